@@ -0,0 +1,102 @@
+import json
+import os
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+from argparse import ArgumentParser
+
+
+def _touch_images(directory, names):
+    for n in names:
+        open(os.path.join(directory, n), 'w').close()
+
+
+def bench_expansion(deck_size, expansion_size):
+    import tts_deckgen.deck as d
+    import tts_deckgen.properties_editor as pe
+
+    with tempfile.TemporaryDirectory() as tmp:
+        deck_dir, images_dir, expansion_dir = (os.path.join(tmp, x) for x in ('deck', 'images', 'expansion'))
+        for x in (deck_dir, images_dir, expansion_dir):
+            os.makedirs(x)
+
+        images = [f'Character {i % (deck_size // 3 + 1):05d} [{i}].png' for i in range(deck_size)]
+        _touch_images(images_dir, images)
+        _touch_images(expansion_dir, ['placeholder.png'])
+        with open(d.cards_info_json(deck_dir, 'grid'), 'w') as fp:
+            json.dump([{'Nickname': n, 'Properties': {}} for n in pe.norm_sort(images)], fp)
+
+        loader = pe.ExpansionLoader(deck_dir, images_dir, expansion_dir, 'grid', show=False)
+        new_images = [f'Character {i % (expansion_size // 2 + 1):05d}.png' for i in range(expansion_size)]
+
+        st = time.perf_counter()
+        for img in new_images:
+            unique = loader._make_unique(img)
+            loader._insert_new(unique, img[:-4])
+        return time.perf_counter() - st
+
+
+def bench_lua(lua, sizes, extra_args):
+    harness = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'tts_guesswho', 'harness.lua')
+    subprocess.run([lua, harness] + extra_args + [str(n) for n in sizes], check=True)
+
+
+def bench_startup(runs):
+    root = os.path.dirname(os.path.abspath(__file__))
+    script = os.path.join(root, 'run_deck_gen.py')
+
+    def run(cmd):
+        times = []
+        for _ in range(runs):
+            st = time.perf_counter()
+            subprocess.run(cmd, check=True, cwd=root, stdout=subprocess.DEVNULL, stdin=subprocess.DEVNULL)
+            times.append(time.perf_counter() - st)
+        return statistics.median(times) * 1000
+
+    with tempfile.TemporaryDirectory() as tmp:
+        save = os.path.join(tmp, 'TS_Save_1.json')
+        with open(save, 'w') as fp:
+            json.dump({'ObjectStates': []}, fp)
+
+        base = run([sys.executable, '-c', 'pass'])
+        print(f'{"mode":>12} {"total, ms":>10} {"over python, ms":>16}')
+        print(f'{"python":>12} {base:>10.1f} {0:>16.1f}')
+        for name, args in (('--help', ['--help']), ('--backups', ['--backups', '-s', save]),
+                           ('--fix', ['--fix', '-s', save])):
+            t = run([sys.executable, script] + args)
+            print(f'{name:>12} {t:>10.1f} {t - base:>16.1f}')
+
+        # Modules imported by generation modes, for comparison
+        t = run([sys.executable, '-c', 'import tts_deckgen.properties_editor, tts_deckgen.builder'])
+        print(f'{"heavy":>12} {t:>10.1f} {t - base:>16.1f}')
+
+
+def main():
+    p = ArgumentParser()
+    p.add_argument('benchmark', choices=['expansion', 'lua', 'startup'])
+    p.add_argument('-n', '--sizes', type=str, default='500,1000,2000,4000',
+                   help='Comma-separated sizes. For expansion: expansion sizes, deck size is 1.5x of it. '
+                        'For lua: deck sizes')
+    p.add_argument('-r', '--runs', type=int, default=10, help='Runs per mode for startup benchmark, median is shown')
+    p.add_argument('--lua', type=str, default='lua', help='Lua interpreter for lua benchmark (5.1-5.4 or LuaJIT)')
+    args = p.parse_args()
+
+    if args.benchmark == 'expansion':
+        print(f'{"deck":>8} {"expansion":>10} {"total, s":>10} {"per image, us":>14}')
+        for n in map(int, args.sizes.split(',')):
+            t = bench_expansion(n * 3 // 2, n)
+            print(f'{n * 3 // 2:>8} {n:>10} {t:>10.3f} {t / n * 1e6:>14.1f}')
+
+    elif args.benchmark == 'lua':
+        sizes = list(map(int, args.sizes.split(',')))
+        bench_lua(args.lua, sizes, [])
+        bench_lua(args.lua, sizes, ['--index'])
+
+    elif args.benchmark == 'startup':
+        bench_startup(args.runs)
+
+
+if __name__ == '__main__':
+    main()
@@ -1,68 +1,21 @@
 import datetime
+import json
 import os.path
-import re
 import shutil
 from argparse import ArgumentParser
-from typing import Optional
+from typing import Optional, List
 
-from PIL import Image, ImageColor
-import json
-from tqdm import tqdm
-
-import tts_deckgen.image_processing as ip
-import tts_deckgen.save_processing as sp
-import tts_deckgen.deck as d
-import tts_deckgen.properties_editor as pe
-import tts_deckgen.properties_editor_legacy as pel
-from tts_deckgen.save_processing import SaveProcessor
-
-
-def generate_deck(pics_dir, output_dir, no_rejected=False, tqdm_inst=None, bg_color: Optional[str] = 'FFFFFF'):
-    if tqdm_inst is None:
-        tqdm_inst = tqdm
-
-    if bg_color is not None:
-        bg_color = ImageColor.getrgb(f'#{bg_color.lower()}ff')
-
-    stamp_img = ip.download_img(d.DEFAULT_STAMP_IMAGE)
-    info = []
-    pics_fixed = []
-    pics_face = []
-    pics_back = None if no_rejected else []
-
-    listdir = pe.norm_sort(os.listdir(pics_dir))
-    for f in tqdm_inst(listdir, total=len(listdir), unit='pic', desc='Preparing pictures'):
-        if ip.check_supported_ext(f):
-            name = '.'.join(f.split('.')[0:-1])
-            name_len = 0
-            while len(name) != name_len:
-                name_len = len(name)
-                name = re.sub(r'\s*\[\d+]$', '', name)
-                name = re.sub(r'^\[\d+]\s*', '', name)
-                name = re.sub(r'\s*\(\d+\)$', '', name)
-                name = re.sub(r'^\(\d+\)\s*', '', name)
-
-            info.append({'Nickname': name})
-            f = os.path.join(pics_dir, f)
-
-            pics_face.append(ip.round_frame(f))
-            fixed = ip.fix_ratio(f)
-            pics_fixed.append(fixed)
-            if pics_back is not None:
-                pics_back.append(ip.stamp(fixed, stamp_img))
-
-    print('DECK: grid')
-    grid_deck = d.Deck.create(pics_face, back_images=pics_back, info=info, tqdm_inst=tqdm_inst, bg_color=bg_color)
-    print('DECK: clean')
-    clean_deck = d.Deck.create(pics_fixed, tqdm_inst=tqdm_inst, info=info, bg_color=bg_color)
-
-    print('Saving...')
-    os.makedirs(output_dir, exist_ok=True)
-    for prefix, deck in (('grid', grid_deck), ('clean', clean_deck)):
-        deck.save(output_dir, prefix, 'grid' == prefix)
-        print(f'{prefix}: {deck.sheets_info()}')
-
-    return grid_deck, clean_deck
+import tts_deckgen.merge as mg
+from tts_deckgen.backup import BackupStore, DEFAULT_KEEP
+
+# Modules depending on PIL, pandas, requests and tqdm are imported by the modes that use them,
+# so modes like --fix or --backups don't pay for these imports on startup
+
+
+def generate_deck(pics_dir, output_dir, no_rejected=False, tqdm_inst=None, bg_color: Optional[str] = 'FFFFFF',
+                  hashed_names=False, lod: Optional[List[int]] = None):
+    from tts_deckgen.builder import DeckBuilder
+    return DeckBuilder(pics_dir, output_dir, no_rejected, tqdm_inst, bg_color, hashed_names, lod).build()
 
 
 def yes_no_interact():
@@ -76,11 +29,15 @@ def yes_no_interact():
 
 
 def insert_urls(game_save, output, show=True):
+    from PIL import Image
+    import tts_deckgen.image_processing as ip
+    import tts_deckgen.uploading as up
+
     with open(game_save, 'r') as sav:
         sav = sav.read()
     buf = sav
 
-    saved_replacement = os.path.join(output, '.url_replace.json')
+    saved_replacement = os.path.join(output, up.URL_REPLACE_JSON)
     files = [f for f in os.listdir(output) if ip.check_supported_ext(f)]
     replacements = {}
 
@@ -119,26 +76,67 @@ def insert_urls(game_save, output, show=True):
             replacement = replacements[f]
             print(f'{f} -> \'{replacement}\'', end=': ')
 
-        fn = sp.to_file_path(fn).replace('\\', '\\\\')
-        out = buf.replace(fn, replacement)
-        if hash(out) != hash(buf):
+        out = _replace_local_path(buf, fn, replacement)
+        if out is not None:
             if not read:
                 replacements[f] = replacement
             print('Success')
+            buf = out
         else:
             print('Not found any occurrences of', fn)
-        buf = out
 
     if hash(buf) != hash(sav):
         with open(game_save, 'w') as fout:
             fout.write(buf)
         print('Wrote modified file')
         if not read:
-            with open(saved_replacement, 'w') as f:
-                json.dump(replacements, f)
+            up.save_replacements(output, replacements)
+
+
+def _replace_local_path(buf, fn, replacement):
+    import tts_deckgen.save_processing as sp
+    fn = sp.to_file_path(fn).replace('\\', '\\\\')
+    out = buf.replace(fn, replacement)
+    return out if hash(out) != hash(buf) else None
+
+
+def upload_sheets(args):
+    import tts_deckgen.uploading as up
+
+    if args.upload_config:
+        backend = up.HttpPostBackend.from_config(args.upload_config)
+    else:
+        backend = up.HttpPostBackend(args.upload_url, args.upload_field, args.upload_response_key)
+    replacements = up.upload_sheets(args.output, backend, workers=args.upload_workers,
+                                    retries=args.upload_retries, force=args.upload_force)
+
+    if args.game_save:
+        replace_urls(args.game_save, args.output, replacements)
+
+
+def replace_urls(game_save, output, replacements):
+    with open(game_save, 'r') as sav:
+        buf = sav.read()
+
+    changed = False
+    for f, replacement in replacements.items():
+        out = _replace_local_path(buf, os.path.join(output, f), replacement)
+        if out is not None:
+            buf = out
+            changed = True
+
+    if changed:
+        with open(game_save, 'w') as fout:
+            fout.write(buf)
+        print('Wrote modified file')
+    else:
+        print('Not found any local sheet paths in save')
 
 
 def import_excel(args, cards, prefix):
+    import tts_deckgen.deck as d
+    import tts_deckgen.properties_editor as pe
+
     _, ch = pe.import_excel(args.import_excel, cards)
     if len(ch) > 0:
         for x in ch:
@@ -152,53 +150,161 @@ def import_excel(args, cards, prefix):
 
 
 def export_excel(xlsx, cards):
-    pe.export_excel(xlsx, cards)
-
-
-def merge_cards(deck_dir, prefix, into, from_fp):
-    with open(from_fp) as fp:
-        src = json.load(fp)
-
-    add = {}
-    for c in src:
-        if 'Nickname' not in c or 'Properties' not in c:
-            continue
-        for idx, cc in enumerate(into):
-            if 'Nickname' in cc and cc['Nickname'] == c['Nickname']:
-                break
-        else:
-            continue
-
-        add[idx] = c['Properties']
-
-    pel.write_changes(d.cards_info_json(deck_dir, prefix), into, add, {})
+    import tts_deckgen.properties_editor as pe
+    from tts_deckgen.cards import PropertyTable
+    # Export only reads cards, so they are packed into columns once instead of a dict per card
+    pe.export_excel(xlsx, PropertyTable.from_cards(cards))
+
+
+def merge_cards(deck_dir, prefix, into, from_fps, policy='overwrite', dry_run=False):
+    import tts_deckgen.deck as d
+    import tts_deckgen.properties_editor_legacy as pel
+
+    add, report = mg.merge_cards(into, mg.load_sources(from_fps), policy)
+    report.print(into)
+    if not dry_run and len(add) > 0:
+        pel.write_changes(d.cards_info_path(deck_dir, prefix), into, add, {})
+
+
+def unpack_prefix(deck_dir, prefix_list):
+    import tts_deckgen.deck as d
+
+    # Grid sheets have round frame and overlay baked in, rebuilt cards would get them twice
+    for prefix in prefix_list + ['clean']:
+        if prefix.startswith('clean') and os.path.isfile(d.deck_info_json(deck_dir, prefix)):
+            return prefix
+    print(f'WARN: Not found clean deck, cards are unpacked from {prefix_list[0]} sheets as is')
+    return prefix_list[0]
+
+
+def unpack_deck(deck_dir, prefix_list, output, workers=None):
+    import tts_deckgen.deck as d
+
+    sheets_prefix = unpack_prefix(deck_dir, prefix_list)
+    sheets = d.DeckSheet.load(deck_dir, sheets_prefix)
+    print(f'Unpacking {sheets_prefix} sheets')
+    cards = None
+    for prefix in prefix_list + ['grid']:
+        if d.has_cards_info(deck_dir, prefix):
+            cards = d.load_cards_info(deck_dir, prefix)
+            break
+    else:
+        print('WARN: Not found cards info, cards will be unpacked without nicknames')
+
+    count = d.unpack_sheets(sheets, deck_dir, output, cards, workers)
+    print(f'Unpacked cards: {count}, written to {output}')
+
+
+def convert_card_store(deck_dir, prefix, kind):
+    import tts_deckgen.card_store as card_store
+    import tts_deckgen.deck as d
+
+    json_path, sqlite_path = d.cards_info_json(deck_dir, prefix), d.cards_info_sqlite(deck_dir, prefix)
+    if kind == 'sqlite' and os.path.isfile(json_path) and not os.path.isfile(sqlite_path):
+        card_store.convert(json_path, sqlite_path, to_sqlite=True)
+    elif kind == 'json' and os.path.isfile(sqlite_path):
+        card_store.convert(json_path, sqlite_path, to_sqlite=False)
+    else:
+        print(f'{prefix}: nothing to convert')
+        return
+    print(f'{prefix}: cards info converted to {kind}')
 
 
 def parse_args():
     p = ArgumentParser()
-    p.add_argument('-d', '--pics-dir', type=str, default=None, help='Directory to grab pictures from')
+    p.add_argument('-d', '--pics-dir', type=str, default=None,
+                   help='Directory to grab pictures from. Can be zip or tar (.tar.gz) archive as well, '
+                        'pictures are read from it without extracting. Or CSV/JSON manifest with picture URLs '
+                        '(url, nickname and properties), downloads are cached in .url_cache next to it')
     p.add_argument('-D', '--deck-dir', type=str, default=None,
                    help='Directory to load deck from. Must be output dir of run with -d option')
     p.add_argument('-u', '--insert-url', action='store_true',
                    help='Enter interactive mode for changing files local dirs to URLs. '
                         'Output dir will be used to iterate over files. --game-save must be set')
+    p.add_argument('-U', '--upload', action='store_true',
+                   help='Upload all sheets from output dir to image host (see --upload-url) and replace local paths '
+                        'in --game-save, if set. Already uploaded files are skipped.')
+    p.add_argument('--upload-url', type=str, default=None, help='Image host endpoint accepting multipart POST')
+    p.add_argument('--upload-field', type=str, default='image', help='Multipart field name for --upload')
+    p.add_argument('--upload-response-key', type=str, default='data.link',
+                   help='Dot-separated path to URL in JSON response for --upload')
+    p.add_argument('--upload-config', type=str, default=None,
+                   help='JSON file with upload backend config (url, field, response_key, headers, data). '
+                        'Overrides other --upload-* options')
+    p.add_argument('--upload-workers', type=int, default=4, help='Parallel uploads for --upload')
+    p.add_argument('--upload-retries', type=int, default=3, help='Retries per file for --upload')
+    p.add_argument('--upload-force', action='store_true', help='Re-upload files, even if they already uploaded')
     p.add_argument('-e', '--expansion', type=str, default=None, help='Expands deck and input dir with new images, '
                                                                      'properly handling properties. Must be dir with '
                                                                      'images and both valid -D and -d options used')
+    p.add_argument('--expansion-rules', type=str, default=None,
+                   help='Non-interactive --expansion mode. Must be JSON file with naming and properties rules')
+    p.add_argument('--dry-run', action='store_true', help='Only print planned changes (for --expansion-rules, '
+                                                          '--query and --merge)')
     p.add_argument('--properties-legacy', action='store_true',
                    help='Enter properties editor mode. Allows you to interactively edit card\'s properties. '
                         'Saved deck must be set. Game save and guid are optional. (-D, -s, -g options respectively).')
     p.add_argument('--fix', action='store_true', help='Restores save (-s option) to untouched state')
 
-    p.add_argument('-m', '--merge', type=str, default=None,
-                   help='Merges specified card info JSON file into deck dir specified with -D option')
+    p.add_argument('--backups', action='store_true', help='List backup generations of save (-s option)')
+    p.add_argument('--restore', type=int, default=None, help='Restores save (-s option) from backup generation, current save is backed up first')
+    p.add_argument('--backup-keep', type=int, default=DEFAULT_KEEP,
+                   help='Number of backup generations to keep (untouched save is always kept)')
+
+    p.add_argument('-m', '--merge', type=str, nargs='+', default=None,
+                   help='Merges specified card info JSON files into deck dir specified with -D option')
+    p.add_argument('--merge-policy', type=str, default='overwrite', choices=mg.POLICIES,
+                   help='What to do with properties, existing in both deck and merged file: overwrite with merged '
+                        'value, keep deck value, or union both values (comma-separated)')
+    p.add_argument('-q', '--query', type=str, action='append', default=None,
+                   help='Bulk edit properties of deck (-D) cards, can be repeated. Examples: '
+                        '\'set "NSFW Rating"=Safe where Nickname~"^Hibiki"\', \'del X where Y=true\'')
+    p.add_argument('--card-store', type=str, default=None, choices=['sqlite', 'json'],
+                   help='Converts cards info of deck (-D) to specified storage. SQLite store is updated per card '
+                        'instead of rewriting the whole JSON file')
+    p.add_argument('--compact-cards', action='store_true',
+                   help='Hold cards info (-D) in compact records with interned strings. Reduces memory usage on '
+                        'large decks')
     p.add_argument('-x', '--export-excel', type=str, default=None,
                    help='Exports specified (-D) deck cards properties to excel. '
-                        'Output excel file can be modified and imported using -X option')
+                        'Output excel file can be modified and imported using -X option. '
+                        'Use .csv or .parquet extension for faster formats')
     p.add_argument('-X', '--import-excel', type=str, default=None,
-                   help='Imports specified excel file into deck (-D). See -x option for more info.')
-
+                   help='Imports specified excel (or .csv, .parquet) file into deck (-D). See -x option for more info.')
+
+    p.add_argument('--unpack', type=str, default=None,
+                   help='Extracts cards of deck (-D) into specified dir as "[0001] Nickname.png", '
+                        'so they can be used with -d again. Cards are cut from clean sheets (first clean* -p prefix '
+                        'or "clean"), nicknames are taken from the first -p prefix having cards info or "grid", '
+                        'cards info is copied as unpacked_cards_info.json')
+    p.add_argument('--unpack-workers', type=int, default=None, help='Parallel workers for --unpack')
+    p.add_argument('-O', '--export-object', type=str, default=None,
+                   help='Export decks (grid and clean, or -p prefixes of -D deck) as a standalone TTS Saved Object '
+                        'JSON. Put it into "Saves/Saved Objects" dir of the game')
     p.add_argument('-o', '--output', type=str, default='output', help='Output dir')
+    p.add_argument('--hashed-names', action='store_true',
+                   help='Include content hash in sheet filenames, so unchanged sheets keep their names (and uploaded '
+                        'URLs) across rebuilds. Stale sheets of the same prefix are removed from output dir')
+    p.add_argument('--preflight', action='store_true',
+                   help='Only check pictures (-d) and print the build plan: card size, sheets and memory estimate. '
+                        'Reads image headers only. The same check is always run before generation')
+    p.add_argument('--lod', type=int, nargs='+', default=None,
+                   help='Also save lower resolution variants of decks, in percent of full resolution '
+                        '(e.g. --lod 25). Saved with prefix like grid_lod25 and the same layout, use it with -p')
+    p.add_argument('-w', '--watch', action='store_true',
+                   help='Keep running after generation (-d) and rebuild decks when pictures dir changes. '
+                        'Only changed pictures are processed again and only changed sheets are saved. '
+                        'Save (-s) and Saved Object (-O) are updated after each rebuild')
+    p.add_argument('--watch-debounce', type=float, default=2.0,
+                   help='Seconds without changes in pictures dir to wait before rebuild in --watch mode')
+    p.add_argument('--serve', action='store_true',
+                   help='Run as a local service: accept build, save patch, Excel import/export and merge jobs over '
+                        'HTTP (POST /jobs, GET /jobs/<id>). Processed pictures are kept in memory between builds')
+    p.add_argument('--serve-port', type=int, default=8765, help='Port on 127.0.0.1 for --serve')
+    p.add_argument('--serve-socket', type=str, default=None, help='Listen on this Unix socket instead of a port')
+    p.add_argument('--serve-token', type=str, default=None,
+                   help='Token required by --serve on TCP port, random one is generated and printed by default')
+    p.add_argument('--serve-workers', type=int, default=2, help='Number of jobs run simultaneously in --serve mode')
     p.add_argument('-R', '--no-rejected', action='store_true', help='Do not generate "Rejected" as back')
 
     p.add_argument('-p', '--prefix', type=str, default='grid,clean',
@@ -210,6 +316,12 @@ def parse_args():
     p.add_argument('-g', '--guid', type=str, default=None,
                    help='Target deck GUID in save. Can be comma-separated list.')
     p.add_argument('-a', '--append', action='store_true', help='Append to deck in save instead of overwrite')
+    p.add_argument('--no-filter-index', action='store_true',
+                   help='Do not embed precomputed Guess Who filter index into written decks (-s, -O). '
+                        'Filters will be computed by the game script at start')
+    p.add_argument('--no-pairing', action='store_true',
+                   help='Write two decks (-g GUID1,GUID2) separately instead of as a grid/hand pair. '
+                        'Paired decks are checked to have the same cards and written in one pass')
 
     p.add_argument('-i', '--show-img', action='store_true', help='Show images for --insert-url or --expand '
                                                                  'interaction. '
@@ -222,131 +334,266 @@ def parse_args():
     return p.parse_args()
 
 
-def main():
-    args = parse_args()
+def run_serve(args):
+    import tts_deckgen.service as svc
+    try:
+        svc.serve(args.serve_port, args.serve_socket, args.serve_workers, args.backup_keep, token=args.serve_token)
+    except KeyboardInterrupt:
+        print('Service stopped')
 
-    if args.keep_transparency:
-        args.bg_color = None
 
-    if args.game_save:
-        if not os.path.isfile(args.game_save):
-            raise AssertionError('--game-save does not represent a file')
+def run_backups(args):
+    if not args.game_save:
+        raise AssertionError('--game-save not set')
+    store = BackupStore.for_save(args.game_save, args.backup_keep)
+    for gen in store.generations:
+        print(gen)
+    if len(store.generations) == 0:
+        print('Not found any backup')
 
-    if args.fix:
-        if not args.game_save:
-            raise AssertionError('--game-save not set')
 
-        bak = args.game_save + '.ttsdg.bak'
-        bak_fallback = args.game_save + '.bak'
+def run_restore(args):
+    if not args.game_save:
+        raise AssertionError('--game-save not set')
+    store = BackupStore.for_save(args.game_save, args.backup_keep)
+    gen = store.restore(args.game_save, args.restore)
+    print(f'Restored: {gen}')
+    if store.latest() is not gen:
+        print(f'Previous save backed up: {store.latest()}')
 
+
+def run_fix(args):
+    if not args.game_save:
+        raise AssertionError('--game-save not set')
+
+    store = BackupStore.for_save(args.game_save, args.backup_keep)
+    gen = store.untouched()
+    if gen is not None:
+        print(f'Found untouched save, backed up: {datetime.datetime.fromtimestamp(gen.time)}')
+        store.restore(args.game_save, gen.id)
+        return
+
+    bak = args.game_save + '.ttsdg.bak'
+    bak_fallback = args.game_save + '.bak'
+
+    if os.path.isfile(bak):
+        print(f'Found untouched save, last modified: {datetime.datetime.fromtimestamp(os.path.getmtime(bak))}')
+
+    else:
+        bak = bak_fallback
         if os.path.isfile(bak):
-            print(f'Found untouched save, last modified: {datetime.datetime.fromtimestamp(os.path.getmtime(bak))}')
+            print(f'Not found save in untouched state, but found backup, last modified: '
+                  f'{datetime.datetime.fromtimestamp(os.path.getmtime(bak))}')
+            ans = input('Would you like to use it? (y/other): ')
+            if not ans.startswith('y'):
+                return
 
         else:
-            bak = bak_fallback
-            if os.path.isfile(bak):
-                print(f'Not found save in untouched state, but found backup, last modified: '
-                      f'{datetime.datetime.fromtimestamp(os.path.getmtime(bak))}')
-                ans = input('Would you like to use it? (y/other): ')
-                if not ans.startswith('y'):
-                    return
-
-            else:
-                print('Not found any backup')
-                return
+            print('Not found any backup')
+            return
 
-        os.remove(args.game_save)
-        shutil.copy(bak, args.game_save)
-        shutil.copy(bak, bak_fallback)
-        os.remove(bak)
-        return
+    os.remove(args.game_save)
+    shutil.copy(bak, args.game_save)
+    shutil.copy(bak, bak_fallback)
+    os.remove(bak)
 
-    if args.expansion:
-        if not os.path.isdir(args.deck_dir):
-            raise AssertionError('--deck-dir does not represent a dir')
-        if not os.path.isdir(args.expansion):
-            raise AssertionError('--expansion does not represent a dir')
-        if not os.path.isdir(args.pics_dir):
-            raise AssertionError('--pics-dir does not represent a dir')
 
-        prefixes = [p for p in args.prefix.split(',') if os.path.isfile(d.cards_info_json(args.deck_dir, p))]
+def run_expansion(args):
+    import tts_deckgen.deck as d
+    import tts_deckgen.properties_editor as pe
 
-        if len(prefixes) == 0:
-            raise AssertionError('Blank prefixes')
-        prefix = prefixes[0]
+    if not os.path.isdir(args.deck_dir):
+        raise AssertionError('--deck-dir does not represent a dir')
+    if not os.path.isdir(args.expansion):
+        raise AssertionError('--expansion does not represent a dir')
+    if not os.path.isdir(args.pics_dir):
+        raise AssertionError('--pics-dir does not represent a dir')
 
-        pe.expansion_loader(args.deck_dir, args.pics_dir, args.expansion, prefix, args.show_img, args.copy_expand)
+    prefixes = [p for p in args.prefix.split(',') if d.has_cards_info(args.deck_dir, p)]
 
-        if len(prefixes) > 1:
-            src = d.cards_info_json(args.deck_dir, prefix)
-            for p in prefixes[1:]:
-                shutil.copy(src, d.cards_info_json(args.deck_dir, p))
-        return
+    if len(prefixes) == 0:
+        raise AssertionError('Blank prefixes')
+    prefix = prefixes[0]
 
-    if args.deck_dir:
-        if not os.path.isdir(args.deck_dir):
-            raise AssertionError('--deck-dir does not represent a dir')
-        if not args.guid and args.game_save:
-            raise AssertionError('--guid not set')
-
-        prefix_list = args.prefix.split(',')
-        cards = d.load_cards_info(args.deck_dir, prefix_list[0])
-        save = True
-
-        if args.merge:
-            if not os.path.isfile(args.merge):
-                raise ValueError('--merge is not a file. Must be a cards info JSON.')
-            merge_cards(args.deck_dir, prefix_list[0], cards, args.merge)
-
-        elif args.export_excel:
-            export_excel(args.export_excel, cards)
+    if args.expansion_rules:
+        pe.batch_expansion(args.deck_dir, args.pics_dir, args.expansion, args.expansion_rules, prefix,
+                           args.copy_expand, args.dry_run)
+        if args.dry_run:
             return
+    else:
+        pe.expansion_loader(args.deck_dir, args.pics_dir, args.expansion, prefix, args.show_img, args.copy_expand)
 
-        elif args.import_excel:
-            import_excel(args, cards, prefix_list[0])
+    if len(prefixes) > 1:
+        for p in prefixes[1:]:
+            d.copy_cards_info(args.deck_dir, prefix, p)
+
+
+def run_deck_dir(args):
+    # Returns False, if --upload / --insert-url must not be run after it
+    import tts_deckgen.deck as d
+    import tts_deckgen.save_processing as sp
+
+    if not os.path.isdir(args.deck_dir):
+        raise AssertionError('--deck-dir does not represent a dir')
+    if not args.guid and args.game_save:
+        raise AssertionError('--guid not set')
+
+    prefix_list = args.prefix.split(',')
+
+    if args.card_store:
+        for prefix in prefix_list:
+            convert_card_store(args.deck_dir, prefix, args.card_store)
+        return False
+
+    if args.unpack:
+        unpack_deck(args.deck_dir, prefix_list, args.unpack, args.unpack_workers)
+        return False
+
+    cards = d.load_cards_info(args.deck_dir, prefix_list[0], args.compact_cards)
+    save = True
+
+    if args.merge:
+        for fp in args.merge:
+            if not os.path.isfile(fp):
+                raise ValueError(f'--merge {fp} is not a file. Must be a cards info JSON.')
+        merge_cards(args.deck_dir, prefix_list[0], cards, args.merge, args.merge_policy, args.dry_run)
+        # Save (-s) is patched even if nothing changed, as it always was
+        save = not args.dry_run
+
+    elif args.export_excel:
+        export_excel(args.export_excel, cards)
+        return False
+
+    elif args.import_excel:
+        import_excel(args, cards, prefix_list[0])
+
+    elif args.export_object:
+        decks = [(d.DeckSheet.load(args.deck_dir, prefix), d.load_cards_info(args.deck_dir, prefix))
+                 for prefix in prefix_list if os.path.isfile(d.deck_info_json(args.deck_dir, prefix))]
+        sp.export_saved_object(args.export_object, *decks, filter_index=not args.no_filter_index)
+        print(f'Saved object written: {args.export_object}')
+        return False
+
+    elif args.query:
+        import tts_deckgen.properties_editor_legacy as pel
+        import tts_deckgen.properties_query as pq
+
+        editor = pel.Editor([], cards)
+        pq.run_queries(editor, args.query)
+        save = pel.print_props_modification(editor.set_props, editor.del_props, editor.orig_props, cards)
+        if args.dry_run or not save:
+            return False
+        pel.write_changes(d.cards_info_path(args.deck_dir, prefix_list[0]), cards,
+                          editor.set_props, editor.del_props)
 
-        elif args.properties:
-            sheets = d.DeckSheet.load(args.deck_dir, prefix_list[0])
-            save, add, rm = pel.edit_properties(sheets, cards)
-            if save:
-                for prefix in prefix_list:
-                    pel.write_changes(d.cards_info_json(args.deck_dir, prefix), cards, add, rm)
-                    break
+    elif args.properties_legacy:
+        import tts_deckgen.properties_editor_legacy as pel
 
-        else:
-            if not args.game_save:
-                raise AssertionError('--game-save not set')
-
-        if save and args.game_save:
-            guids = args.guid.split(',')
-            for i, guid in enumerate(guids):
-                deck = d.DeckSheet.load(args.deck_dir, prefix_list[i if len(prefix_list) > i else 0])
-                if len(guids) == len(prefix_list) and i > 0:
-                    if os.path.isfile(d.cards_info_json(args.deck_dir, prefix_list[i])):
-                        cards = d.load_cards_info(args.deck_dir, prefix_list[i])
-                p = SaveProcessor(args.game_save)
-                p.set_object(guid, append_content=args.append)
-                p.write_decks((deck, cards))
+        sheets = d.DeckSheet.load(args.deck_dir, prefix_list[0])
+        save, add, rm = pel.edit_properties(sheets, cards)
+        if save:
+            for prefix in prefix_list:
+                pel.write_changes(d.cards_info_path(args.deck_dir, prefix), cards, add, rm)
+                break
 
-    elif args.pics_dir:
-        if not os.path.isdir(args.pics_dir):
-            raise AssertionError('--pics-dir does not represent a dir')
+    else:
+        if not args.game_save:
+            raise AssertionError('--game-save not set')
 
-        grid, clean = generate_deck(args.pics_dir, args.output, no_rejected=args.no_rejected, bg_color=args.bg_color)
+    if save and args.game_save:
+        guids = args.guid.split(',')
+        decks = []
+        for i, guid in enumerate(guids):
+            deck = d.DeckSheet.load(args.deck_dir, prefix_list[i if len(prefix_list) > i else 0])
+            if len(guids) == len(prefix_list) and i > 0:
+                if d.has_cards_info(args.deck_dir, prefix_list[i]):
+                    cards = d.load_cards_info(args.deck_dir, prefix_list[i], args.compact_cards)
+            decks.append((deck, cards))
+
+        sp.patch_save(args.game_save, guids, decks, append_content=args.append, pairing=not args.no_pairing,
+                      filter_index=not args.no_filter_index, backup_keep=args.backup_keep)
+    return True
+
+
+def run_pics_dir(args):
+    # Returns False, if --upload / --insert-url must not be run after it
+    import tts_deckgen.save_processing as sp
+    from tts_deckgen.builder import DeckBuilder
+    from tts_deckgen.preflight import preflight
+    from tts_deckgen.sources import is_source
+
+    if not is_source(args.pics_dir):
+        raise AssertionError('--pics-dir does not represent a dir, zip/tar archive or CSV/JSON manifest')
+    if args.lod and not all(0 < x < 100 for x in args.lod):
+        raise AssertionError('--lod values must be between 1 and 99')
+    if args.watch and args.append and args.game_save:
+        raise AssertionError('--append cannot be used with --watch, decks would be appended on every rebuild')
+
+    def write_outputs(grid, clean):
+        if args.export_object:
+            sp.export_saved_object(args.export_object, grid, clean, filter_index=not args.no_filter_index)
+            print(f'Saved object written: {args.export_object}')
+
+        if args.game_save and args.guid:
+            sp.patch_save(args.game_save, args.guid.split(',')[:2], [grid, clean], append_content=args.append,
+                          pairing=not args.no_pairing, filter_index=not args.no_filter_index,
+                          backup_keep=args.backup_keep)
+
+    builder = DeckBuilder(args.pics_dir, args.output, no_rejected=args.no_rejected, bg_color=args.bg_color,
+                          hashed_names=args.hashed_names, lod=args.lod)
+
+    # Fails before any picture is decoded
+    report = preflight(args.pics_dir, builder.source, no_rejected=args.no_rejected)
+    report.print()
+    report.check()
+    if args.preflight:
+        return False
+
+    write_outputs(*builder.build())
+
+    if args.watch:
+        try:
+            builder.watch(write_outputs, debounce=args.watch_debounce)
+        except KeyboardInterrupt:
+            print('Stopped watching')
+        return False
+    return True
 
-        if args.game_save:
-            p = SaveProcessor(args.game_save)
 
-            if args.guid:
-                decks = (grid, clean)
-                guids = args.guid.split(',')
-                for i, guid in enumerate(guids):
-                    if i > 1:
-                        break
-                    p.set_object(guid, append_content=args.append)
-                    p.write_decks(decks[i])
+def main():
+    args = parse_args()
+
+    if args.keep_transparency:
+        args.bg_color = None
+
+    if args.serve:
+        run_serve(args)
+        return
+
+    if args.game_save:
+        if not os.path.isfile(args.game_save):
+            raise AssertionError('--game-save does not represent a file')
+
+    # Standalone modes, the first one set is run
+    for enabled, run in ((args.backups, run_backups), (args.restore is not None, run_restore),
+                         (args.fix, run_fix), (args.expansion, run_expansion)):
+        if enabled:
+            run(args)
+            return
+
+    if args.deck_dir:
+        if not run_deck_dir(args):
+            return
+    elif args.pics_dir:
+        if not run_pics_dir(args):
+            return
+
+    if args.upload:
+        if not args.upload_url and not args.upload_config:
+            raise AssertionError('--upload-url or --upload-config not set')
+        upload_sheets(args)
 
-    if args.insert_url:
+    elif args.insert_url:
         if not args.game_save:
             raise AssertionError('--game-save not set')
         insert_urls(args.game_save, args.output, args.show_img)
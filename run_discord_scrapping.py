@@ -1,19 +1,22 @@
-from fileinput import filename
-import os.path
 from argparse import ArgumentParser
 from datetime import datetime
 
 import discord
 
+from tts_deckgen.discord_scrapping import scrape
+
 time_format = '%y/%m/%d %H:%M:%S'
 
 if __name__ == '__main__':
     p = ArgumentParser()
     p.add_argument('token', type=str, help='Bot token')
     p.add_argument('guild_id', type=int, help='Target guild id')
-    p.add_argument('channel_id', type=int, help='Target channel id')
+    p.add_argument('channel_id', type=int, nargs='+', help='Target channel ids, scrapped concurrently')
     p.add_argument('timestamp', type=str, help=f'Timestamp after which scrap messages, in format {time_format}')
     p.add_argument('-o', '--output', type=str, default='discord-collected', help=f'Output dir')
+    p.add_argument('-j', '--concurrency', type=int, default=8, help='Max simultaneous attachment downloads')
+    p.add_argument('--no-resume', action='store_true',
+                   help='Ignore saved checkpoint and start again from the timestamp')
 
     args = p.parse_args()
 
@@ -23,34 +26,20 @@ if __name__ == '__main__':
     async def on_ready():
         try:
             guild = client.get_guild(args.guild_id)
-            channel = guild.get_channel(args.channel_id)
-            print('Channel found: ' + str(channel))
-
-            msg: discord.Message
-            async for msg in channel.history(after=datetime.strptime(args.timestamp, time_format)):
-                if hasattr(msg, 'attachments') and len(msg.attachments) > 0:
-                    print(f'Msg attachements: {len(msg.attachments)}... ', end='')
-                    for i, a in enumerate(msg.attachments):
-                        ext = a.filename.lower().split(".")[-1]
-                        if ext not in ['png', 'jpg', 'jpeg']:
-                            continue
-                        if len(msg.attachments) == 1 and msg.content and len(msg.content) > 0:
-                            name = f'{msg.content}.{ext}'
-                        else:
-                            name = f'[{msg.id}00{i}] {a.filename}'
-
-                        fn = os.path.join(args.output, name)
-                        i = 1
-                        while os.path.isfile(fn):
-                            fn = os.path.join(args.output, f'[{i}] {name}')
-                            i += 1
-
-                        await a.save(fn)
-                    print('saved.')
-                else:
-                    print(f'Not found attachments')
-
+            channels = []
+            for channel_id in args.channel_id:
+                channel = guild.get_channel(channel_id)
+                if channel is None:
+                    print(f'Channel not found: {channel_id}')
+                    continue
+                print('Channel found: ' + str(channel))
+                channels.append(channel)
+
+            await scrape(channels, args.output, datetime.strptime(args.timestamp, time_format),
+                         concurrency=args.concurrency, resume=not args.no_resume)
         except Exception as e:
             print(e)
+        finally:
+            await client.close()
 
     client.run(args.token)
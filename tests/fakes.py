@@ -0,0 +1,54 @@
+import asyncio
+from datetime import datetime
+from typing import List, Optional
+
+
+class FakeAttachment:
+    def __init__(self, id: int, filename: str, data: bytes, delay=0.0, fail=False):
+        self.id = id
+        self.filename = filename
+        self.data = data
+        self.size = len(data)
+        self.delay = delay
+        self.fail = fail
+
+    async def read(self):
+        await asyncio.sleep(self.delay)
+        if self.fail:
+            raise IOError(f'Download failed: {self.filename}')
+        return self.data
+
+    async def save(self, fp):
+        data = await self.read()
+        with open(fp, 'wb') as f:
+            f.write(data)
+        return len(data)
+
+
+class FakeMessage:
+    def __init__(self, id: int, attachments: List[FakeAttachment], content='', created_at: Optional[datetime] = None):
+        self.id = id
+        self.attachments = attachments
+        self.content = content
+        self.created_at = created_at or datetime.fromtimestamp(id)
+
+
+class FakeChannel:
+    def __init__(self, id: int, messages: List[FakeMessage]):
+        self.id = id
+        self.messages = sorted(messages, key=lambda m: m.id)
+
+    async def history(self, after=None, limit=None, oldest_first=True):
+        res = self.messages
+        if isinstance(after, datetime):
+            res = [m for m in res if m.created_at > after]
+        elif after is not None:
+            res = [m for m in res if m.id > after.id]
+        if not oldest_first:
+            res = res[::-1]
+        for m in res[:limit]:
+            await asyncio.sleep(0)
+            yield m
+
+    def __str__(self):
+        return f'#{self.id}'
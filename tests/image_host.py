@@ -0,0 +1,99 @@
+import json
+import os
+import threading
+import uuid
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+from typing import Optional
+
+from tts_deckgen import uploading as up
+
+
+class LocalImageHost:
+    def __init__(self, root, host='127.0.0.1', port=0, fail_first=0, fail_get_first=0):
+        self.root = root
+        self.fail_first = fail_first
+        self.fail_get_first = fail_get_first
+        self.requests_count = 0
+        self.get_count = 0
+        os.makedirs(root, exist_ok=True)
+
+        host_inst = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_POST(self):
+                with host_inst._lock:
+                    host_inst.requests_count += 1
+                    fail = host_inst.requests_count <= host_inst.fail_first
+                if fail:
+                    self.send_error(503)
+                    return
+
+                length = int(self.headers.get('Content-Length', 0))
+                body = self.rfile.read(length)
+                name = f'{uuid.uuid4().hex}.png'
+                with open(os.path.join(host_inst.root, name), 'wb') as fp:
+                    fp.write(_multipart_payload(body, self.headers.get('Content-Type', '')))
+
+                res = json.dumps({'data': {'link': f'{host_inst.url}/{name}'}}).encode()
+                self.send_response(200)
+                self.send_header('Content-Type', 'application/json')
+                self.send_header('Content-Length', str(len(res)))
+                self.end_headers()
+                self.wfile.write(res)
+
+            def do_GET(self):
+                with host_inst._lock:
+                    host_inst.get_count += 1
+                    fail = host_inst.get_count <= host_inst.fail_get_first
+                if fail:
+                    self.send_error(503)
+                    return
+
+                path = os.path.join(host_inst.root, os.path.basename(self.path))
+                if not os.path.isfile(path):
+                    self.send_error(404)
+                    return
+                with open(path, 'rb') as fp:
+                    res = fp.read()
+                self.send_response(200)
+                self.send_header('Content-Type', 'image/png')
+                self.send_header('Content-Length', str(len(res)))
+                self.end_headers()
+                self.wfile.write(res)
+
+            def log_message(self, *args):
+                pass
+
+        self._lock = threading.Lock()
+        self.server = ThreadingHTTPServer((host, port), Handler)
+        self.url = f'http://{host}:{self.server.server_address[1]}'
+        self._thread: Optional[threading.Thread] = None
+
+    def backend(self):
+        return up.HttpPostBackend(self.url + '/upload')
+
+    def start(self):
+        self._thread = threading.Thread(target=self.server.serve_forever, daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self.server.shutdown()
+        self.server.server_close()
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *args):
+        self.stop()
+
+
+def _multipart_payload(body: bytes, content_type: str):
+    if 'boundary=' not in content_type:
+        return body
+    boundary = content_type.split('boundary=')[-1].strip('"').encode()
+    for part in body.split(b'--' + boundary):
+        head, sep, payload = part.partition(b'\r\n\r\n')
+        if sep and b'filename=' in head:
+            return payload[:-2] if payload.endswith(b'\r\n') else payload
+    return body
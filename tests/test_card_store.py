@@ -0,0 +1,71 @@
+import json
+import os
+
+import pytest
+
+from tts_deckgen import card_store as cs
+
+CARDS = [
+    {'Nickname': 'a', 'Properties': {'Rare': True, 'Tags': ['x', 'y'], 'Cost': 3, 'Note': None}, 'Extra': 1},
+    {'Properties': None, 'Nickname': 'null props'},
+    {'Nickname': 'no props'},
+    {'Nickname': 'empty props', 'Properties': {}},
+    {'Nickname': 'a', 'Properties': {'Meta': {'b': 1, 'a': [2]}}},
+]
+
+
+def test_json_round_trip(tmp_path):
+    json_path, db_path = str(tmp_path / 'cards.json'), str(tmp_path / 'cards.sqlite')
+    with open(json_path, 'w') as fp:
+        json.dump(CARDS, fp)
+
+    cs.convert(json_path, db_path, to_sqlite=True)
+    with cs.CardStore(db_path) as store:
+        assert store.find('Rare', True) == [0]
+        assert store.load() == CARDS
+    cs.convert(json_path, db_path, to_sqlite=False)
+
+    with open(json_path) as fp:
+        res = json.load(fp)
+    assert res == CARDS
+    # Key order of cards is kept too
+    assert [list(c) for c in res] == [list(c) for c in CARDS]
+
+
+def test_update_null_properties(tmp_path):
+    with cs.CardStore(str(tmp_path / 'cards.sqlite')) as store:
+        store.replace_all(CARDS)
+        store.update_properties({1: {'Rare': False}}, {})
+        store.set_card(3, {'Nickname': 'empty props', 'Properties': None})
+        cards = store.load()
+
+    assert cards[1] == {'Properties': {'Rare': False}, 'Nickname': 'null props'}
+    assert cards[3] == {'Nickname': 'empty props', 'Properties': None}
+    assert cards[2] == {'Nickname': 'no props'}
+
+
+def test_convert_leaves_no_temp_files(tmp_path):
+    json_path, db_path = str(tmp_path / 'cards.json'), str(tmp_path / 'cards.sqlite')
+    with open(json_path, 'w') as fp:
+        json.dump(CARDS, fp)
+
+    cs.convert(json_path, db_path, to_sqlite=True)
+    assert sorted(os.listdir(tmp_path)) == ['cards.sqlite']
+    cs.convert(json_path, db_path, to_sqlite=False)
+    assert sorted(os.listdir(tmp_path)) == ['cards.json']
+
+
+def test_failed_convert_keeps_source(tmp_path, monkeypatch):
+    json_path, db_path = str(tmp_path / 'cards.json'), str(tmp_path / 'cards.sqlite')
+    with open(json_path, 'w') as fp:
+        json.dump(CARDS, fp)
+
+    def fail(self, cards):
+        self._insert(0, cards[0])
+
+    monkeypatch.setattr(cs.CardStore, 'replace_all', fail)
+    with pytest.raises(ValueError):
+        cs.convert(json_path, db_path, to_sqlite=True)
+    assert sorted(os.listdir(tmp_path)) == ['cards.json']
+    with open(json_path) as fp:
+        assert json.load(fp) == CARDS
@@ -0,0 +1,95 @@
+import asyncio
+import json
+import os
+
+from tts_deckgen import discord_scrapping as ds
+from .fakes import FakeAttachment, FakeChannel, FakeMessage
+
+SAVED = sorted(['Alpha.png', '[2000] b.png', '[4000] d.jpg', '[5000] e.png'])
+
+
+def _channel(fail_id=None):
+    messages = [
+        FakeMessage(1, [FakeAttachment(10, 'a.png', b'aaa')], content='Alpha'),
+        FakeMessage(2, [FakeAttachment(20, 'b.png', b'bbb'), FakeAttachment(21, 'c.txt', b'ccc')]),
+        FakeMessage(3, [FakeAttachment(30, 'a_copy.png', b'aaa')]),
+        FakeMessage(4, [FakeAttachment(40, 'd.jpg', b'ddd', fail=fail_id == 40)]),
+        FakeMessage(5, [FakeAttachment(50, 'e.png', b'eee', delay=0.01)]),
+    ]
+    return FakeChannel(7, messages)
+
+
+def _scrape(output, channel, resume=True):
+    return asyncio.run(ds.scrape([channel], str(output), None, concurrency=2, resume=resume, verbose=False))
+
+
+def _saved(output):
+    return sorted(f for f in os.listdir(output) if not f.startswith('.'))
+
+
+def test_scrape_dedup(tmp_path):
+    assert _scrape(tmp_path, _channel()) == [4]
+    assert _saved(tmp_path) == SAVED
+
+    with open(tmp_path / ds.MANIFEST_JSON) as fp:
+        manifest = json.load(fp)
+    # Same content is stored once, the duplicate attachment points to it
+    assert manifest['30']['name'] == manifest['10']['name'] == 'Alpha.png'
+    with open(tmp_path / ds.CHECKPOINT_JSON) as fp:
+        assert json.load(fp) == {'7': 5}
+
+
+def test_checkpoint_resume(tmp_path):
+    _scrape(tmp_path, _channel(fail_id=40))
+    # Checkpoint stops before the message with failed download
+    with open(tmp_path / ds.CHECKPOINT_JSON) as fp:
+        assert json.load(fp) == {'7': 3}
+    assert '[4000] d.jpg' not in _saved(tmp_path)
+
+    channel = _channel()
+    assert _scrape(tmp_path, channel) == [1]
+    assert _saved(tmp_path) == SAVED
+    with open(tmp_path / ds.CHECKPOINT_JSON) as fp:
+        assert json.load(fp) == {'7': 5}
+
+
+def test_manifest_dedup_without_checkpoint(tmp_path):
+    _scrape(tmp_path, _channel())
+    os.remove(tmp_path / ds.CHECKPOINT_JSON)
+
+    # All attachments are known by id, nothing is downloaded again
+    assert _scrape(tmp_path, _channel(), resume=False) == [0]
+    assert len(_saved(tmp_path)) == 4
+
+
+class CountingChannel(FakeChannel):
+    def __init__(self, id, messages):
+        super().__init__(id, messages)
+        self.read = 0
+
+    async def history(self, after=None, limit=None, oldest_first=True):
+        async for m in super().history(after, limit, oldest_first):
+            self.read += 1
+            yield m
+
+
+def test_history_backpressure(tmp_path):
+    messages = [FakeMessage(i, [FakeAttachment(i * 10, f'{i}.png', bytes([i]), delay=0.001)])
+                for i in range(1, 101)]
+    channel = CountingChannel(7, messages)
+    ahead = []
+
+    async def run():
+        checkpoint = ds.Checkpoint(str(tmp_path))
+        manifest = ds.IngestManifest(str(tmp_path))
+        scraper = ds.ChannelScraper(channel, str(tmp_path), None, checkpoint, manifest, asyncio.Semaphore(2),
+                                    workers=2, verbose=False)
+        task = asyncio.create_task(scraper.run())
+        while not task.done():
+            ahead.append(channel.read - scraper.saved)
+            await asyncio.sleep(0)
+        return await task
+
+    assert asyncio.run(run()) == 100
+    # Only queued and in-progress messages are read ahead of saved ones
+    assert max(ahead) <= 2 * 2 + 1
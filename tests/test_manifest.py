@@ -0,0 +1,74 @@
+import io
+import json
+import os
+
+import pytest
+from PIL import Image
+
+from tts_deckgen import manifest as mf
+from .image_host import LocalImageHost
+
+
+def _png(color):
+    buf = io.BytesIO()
+    Image.new('RGB', (8, 12), color).save(buf, 'PNG')
+    return buf.getvalue()
+
+
+@pytest.fixture
+def host(tmp_path):
+    host = LocalImageHost(str(tmp_path / 'host')).start()
+    for i in range(3):
+        with open(tmp_path / 'host' / f'{i}.png', 'wb') as fp:
+            fp.write(_png((i * 60, 0, 0)))
+    yield host
+    host.stop()
+
+
+def test_cache_hit(tmp_path, host):
+    urls = [f'{host.url}/{i}.png' for i in range(3)]
+    fetcher = mf.UrlFetcher(str(tmp_path / 'cache'), workers=2, verbose=False)
+    fetcher.fetch_all(urls)
+    assert host.get_count == 3
+    for i, u in enumerate(urls):
+        with open(fetcher.cache_path(u), 'rb') as fp:
+            assert fp.read() == _png((i * 60, 0, 0))
+
+    fetcher.fetch_all(urls)
+    fetcher.close()
+    assert host.get_count == 3
+
+
+def test_retry(tmp_path, host):
+    host.fail_get_first = 2
+    fetcher = mf.UrlFetcher(str(tmp_path / 'cache'), workers=1, backoff=0.01, verbose=False)
+    fetcher.fetch_all([f'{host.url}/0.png'])
+    fetcher.close()
+    assert host.get_count == 3
+    assert os.path.isfile(fetcher.cache_path(f'{host.url}/0.png'))
+
+
+def test_bad_url_not_cached(tmp_path, host):
+    url = f'{host.url}/missing.png'
+    fetcher = mf.UrlFetcher(str(tmp_path / 'cache'), workers=1, retries=0, verbose=False)
+    with pytest.raises(mf.FetchError):
+        fetcher.fetch_all([url])
+    fetcher.close()
+    assert not os.path.isfile(fetcher.cache_path(url))
+
+
+def test_manifest_source(tmp_path, host):
+    path = tmp_path / 'cards.json'
+    with open(path, 'w') as fp:
+        json.dump([{'url': f'{host.url}/2.png', 'nickname': 'Two', 'properties': {'Rare': True}},
+                   {'url': f'{host.url}/0.png'}], fp)
+
+    source = mf.ManifestSource(str(path), str(tmp_path / 'cache'))
+    names = source.order(source.snapshot().keys())
+    assert not any(source.is_available(n) for n in names)
+    source.prefetch(names)
+    assert [source.card_info(n) for n in names] == [{'Nickname': 'Two', 'Properties': {'Rare': 'true'}},
+                                                    {'Nickname': '0'}]
+    with source.open(names[0]) as fp:
+        assert fp.read() == _png((120, 0, 0))
+    source.close()
@@ -0,0 +1,84 @@
+import pytest
+
+from tts_deckgen import merge as mg
+
+
+def _deck():
+    return [
+        {'Nickname': 'a', 'Properties': {'Rarity': 'Common'}},
+        {'Nickname': 'b'},
+        {'Nickname': 'b', 'Properties': {'Tag': 'x'}},
+        {'Nickname': 'c', 'Properties': {}},
+    ]
+
+
+@pytest.mark.parametrize('policy, value', [
+    ('overwrite', 'Rare'),
+    ('keep', None),
+    ('union', 'Common, Rare'),
+])
+def test_policies(policy, value):
+    src = [{'Nickname': 'a', 'Properties': {'Rarity': 'Rare', 'Set': 'Base'}}]
+    add, report = mg.merge_cards(_deck(), [('s.json', src)], policy)
+
+    expected = {'Set': 'Base'} if value is None else {'Rarity': value, 'Set': 'Base'}
+    assert add == {0: expected}
+    assert report.conflicts == 1
+    assert report.unmatched == []
+
+
+def test_union_keeps_present_value():
+    src = [{'Nickname': 'a', 'Properties': {'Rarity': 'Rare'}}]
+    into = _deck()
+    into[0]['Properties']['Rarity'] = 'Common, Rare'
+    add, report = mg.merge_cards(into, [('s.json', src)], 'union')
+    assert add == {}
+    assert report.conflicts == 1
+
+
+def test_same_value_is_not_conflict():
+    add, report = mg.merge_cards(_deck(), [('s.json', [{'Nickname': 'a', 'Properties': {'Rarity': 'Common'}}])])
+    assert add == {}
+    assert report.conflicts == 0
+
+
+def test_single_card_goes_to_all_with_name():
+    add, _ = mg.merge_cards(_deck(), [('s.json', [{'Nickname': 'b', 'Properties': {'Tag': 'y', 'New': '1'}}])])
+    assert add == {1: {'Tag': 'y', 'New': '1'}, 2: {'Tag': 'y', 'New': '1'}}
+
+
+def test_duplicate_names_paired_by_order():
+    src = [
+        {'Nickname': 'b', 'Properties': {'N': '1'}},
+        {'Nickname': 'b', 'Properties': {'N': '2'}},
+        {'Nickname': 'b', 'Properties': {'N': '3'}},
+    ]
+    add, report = mg.merge_cards(_deck(), [('s.json', src)])
+    assert add == {1: {'N': '1'}, 2: {'N': '2'}}
+    assert report.unmatched == [('s.json', 'b')]
+
+
+def test_unmatched_reported_once():
+    src = [
+        {'Nickname': 'x', 'Properties': {'N': '1'}},
+        {'Nickname': 'x', 'Properties': {'N': '2'}},
+        {'Nickname': 'y', 'Properties': {'N': '3'}},
+        {'Nickname': 'z'},
+    ]
+    add, report = mg.merge_cards(_deck(), [('s.json', src)])
+    assert add == {}
+    assert report.unmatched == [('s.json', 'x'), ('s.json', 'x'), ('s.json', 'y')]
+
+
+def test_later_source_conflicts_with_earlier():
+    sources = [('1.json', [{'Nickname': 'c', 'Properties': {'K': 'a'}}]),
+               ('2.json', [{'Nickname': 'c', 'Properties': {'K': 'b'}}])]
+    add, report = mg.merge_cards(_deck(), sources, 'union')
+    assert add == {3: {'K': 'a, b'}}
+    assert report.conflicts == 1
+    assert report.diffs[3] == [('K', None, 'a'), ('K', 'a', 'a, b')]
+
+
+def test_unknown_policy():
+    with pytest.raises(ValueError):
+        mg.merge_cards(_deck(), [], 'replace')
@@ -0,0 +1,47 @@
+import copy
+
+import pytest
+
+from tts_deckgen import properties_editor as pe
+
+CARDS = [
+    {'Nickname': 'a', 'Properties': {'Level': 3, 'Rare': True, 'Ship': 'DD'}},
+    {'Nickname': 'b', 'Properties': {'Rare': False}},
+    {'Nickname': 'c'},
+]
+
+
+@pytest.mark.parametrize('ext', ['csv', 'xlsx', 'parquet'])
+def test_round_trip_unchanged(tmp_path, ext):
+    if ext == 'parquet':
+        pytest.importorskip('pyarrow')
+    path = pe.export_excel(str(tmp_path / f'cards.{ext}'), CARDS)
+    cards = copy.deepcopy(CARDS)
+    _, renamed = pe.import_excel(path, cards)
+
+    assert renamed == []
+    assert cards == CARDS
+
+
+def test_import_changes(tmp_path):
+    path = pe.export_excel(str(tmp_path / 'cards.csv'), CARDS)
+    df = pe.read_table(path)
+    df.loc[0, 'Level'] = '4'
+    df.loc[1, 'Rare'] = ''
+    df.loc[2, 'Ship'] = 'BB'
+    df.loc[2, 'Nickname'] = 'd'
+    df.to_csv(path)
+
+    cards = copy.deepcopy(CARDS)
+    _, renamed = pe.import_excel(path, cards)
+    assert renamed == [('c', 'd')]
+    assert cards == [
+        {'Nickname': 'a', 'Properties': {'Level': '4', 'Rare': True, 'Ship': 'DD'}},
+        {'Nickname': 'b', 'Properties': {}},
+        {'Nickname': 'd', 'Properties': {'Ship': 'BB'}},
+    ]
+
+
+def test_empty(tmp_path):
+    path = pe.export_excel(str(tmp_path / 'cards.csv'), [])
+    assert pe.import_excel(path, []) == ([], [])
@@ -0,0 +1,88 @@
+import pytest
+
+from tts_deckgen import properties_query as pq
+from tts_deckgen.properties_editor_legacy import Editor
+
+
+def _editor():
+    return Editor([], [
+        {'Nickname': 'Hibiki', 'Properties': {'Ship': 'Destroyer', 'Rare': True}},
+        {'Nickname': 'Hibiki Kai', 'Properties': {'Ship': 'Destroyer', 'Rare': False, 'Tags': ['a', 'b']}},
+        {'Nickname': 'Kongou', 'Properties': {'Ship': 'Battleship', 'Level': 3}},
+        {'Nickname': 'Fubuki'},
+    ])
+
+
+def _tokens(query):
+    return [(t.kind, t.value) for t in pq.tokenize(query)]
+
+
+def test_tokenize():
+    assert _tokens('set "NSFW Rating"=Safe, X where Nickname~\'^Hib\\\'i\' and not(Y!=1)') == [
+        ('word', 'set'), ('str', 'NSFW Rating'), ('op', '='), ('word', 'Safe'), ('op', ','), ('word', 'X'),
+        ('word', 'where'), ('word', 'Nickname'), ('op', '~'), ('str', "^Hib'i"), ('word', 'and'), ('word', 'not'),
+        ('op', '('), ('word', 'Y'), ('op', '!='), ('word', '1'), ('op', ')'),
+    ]
+
+
+def test_tokenize_error():
+    with pytest.raises(pq.QuerySyntaxError):
+        pq.tokenize('set X where "unclosed')
+
+
+def test_parse():
+    q = pq.parse('set A=1, B where X=1 or Y and not Z~"^a"')
+    assert q.action == 'set'
+    assert q.assignments == [('A', '1'), ('B', 'true')]
+    op, left, right = q.condition
+    assert (op, left) == ('or', ('=', 'X', '1'))
+    assert right[0] == 'and' and right[1] == ('has', 'Y')
+    assert right[2][0] == 'not' and right[2][1][0] == '~' and right[2][1][2].pattern == '^a'
+
+    q = pq.parse('rm A, B')
+    assert (q.action, q.keys, q.condition) == ('del', ['A', 'B'], None)
+
+
+@pytest.mark.parametrize('query', [
+    'update A=1',
+    'set A=1 when B',
+    'set Nickname=x',
+    'set A=1 where (B',
+    'set A=1 where B~"("',
+    'set A=1 where B C',
+    'del where',
+])
+def test_parse_errors(query):
+    with pytest.raises(pq.QuerySyntaxError):
+        pq.parse(query)
+
+
+@pytest.mark.parametrize('condition, expected', [
+    ('Ship=Destroyer', {0, 1}),
+    ('Ship!=Destroyer', {2, 3}),
+    ('Rare', {0, 1}),
+    ('Rare=true', {0}),
+    ('Rare=false', {1}),
+    ('Rare!=true', {1, 2, 3}),
+    ('Level=3', {2}),
+    ('Tags~"a"', {1}),
+    ('Nickname~"^Hibiki"', {0, 1}),
+    ('Nickname=Fubuki', {3}),
+    ('not Ship', {3}),
+    ('Ship=Destroyer and not Rare=true or Level', {1, 2}),
+    ('Ship=Destroyer and (not Rare=true or Level)', {1}),
+])
+def test_evaluate(condition, expected):
+    assert pq.parse(f'set X where {condition}').select(_editor()) == expected
+
+
+def test_apply():
+    editor = _editor()
+    assert pq.run_queries(editor, ['set Class=DD where Ship=Destroyer', 'del Rare where Rare=false']) == {0, 1}
+    assert editor.set_props == {0: {'Class': 'DD'}, 1: {'Class': 'DD'}}
+    assert editor.del_props == {1: ['Rare']}
+
+    # Already set values aren't changed again
+    editor = Editor([], [{'Nickname': 'a', 'Properties': {'Class': 'DD'}}])
+    pq.parse('set Class=DD').apply(editor)
+    assert editor.set_props == {}
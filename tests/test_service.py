@@ -0,0 +1,116 @@
+import http.client
+import json
+import os
+import stat
+import threading
+
+import pytest
+
+from tts_deckgen import deck as d
+from tts_deckgen import service as sv
+
+
+@pytest.fixture
+def service():
+    return sv.DeckService(workers=2)
+
+
+@pytest.fixture
+def deck_dir(tmp_path):
+    d.save_cards_info([{'Nickname': 'a', 'Properties': {}}, {'Nickname': 'b'}], str(tmp_path), 'grid')
+    with open(tmp_path / 'src.json', 'w') as fp:
+        json.dump([{'Nickname': 'a', 'Properties': {'Rare': 'true'}}, {'Nickname': 'x', 'Properties': {}}], fp)
+    return tmp_path
+
+
+@pytest.fixture
+def server(service):
+    server, token = sv.make_server(service, port=0)
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    yield server, token
+    server.shutdown()
+    server.server_close()
+
+
+def _request(server, method, path, body=None, headers=None):
+    port = server.server_address[1]
+    conn = http.client.HTTPConnection('127.0.0.1', port, timeout=10)
+    conn.request(method, path, body=json.dumps(body) if body is not None else None, headers=headers or {})
+    r = conn.getresponse()
+    res = r.status, json.loads(r.read())
+    conn.close()
+    return res
+
+
+def _headers(token, **extra):
+    return {'Authorization': f'Bearer {token}', 'Content-Type': 'application/json', **extra}
+
+
+def test_merge_job(service, deck_dir):
+    job = service.submit('merge', {'deck_dir': str(deck_dir), 'sources': [str(deck_dir / 'src.json')]})
+    assert service.wait(job.id, 10).status == sv.STATUS_DONE
+    assert job.result == {'changed': 1, 'conflicts': 0, 'unmatched': [{'source': str(deck_dir / 'src.json'),
+                                                                      'nickname': 'x'}]}
+    assert d.load_cards_info(str(deck_dir), 'grid')[0]['Properties'] == {'Rare': 'true'}
+    # Path lock is dropped when no job holds it
+    assert service._path_locks == {}
+
+
+def test_failed_job(service, deck_dir):
+    job = service.submit('merge', {'deck_dir': str(deck_dir), 'sources': ['missing.json']})
+    assert service.wait(job.id, 10).status == sv.STATUS_FAILED
+    assert job.error.startswith('ValueError')
+
+    with pytest.raises(ValueError):
+        service.submit('drop_tables')
+
+
+def test_path_locks_dropped(service, tmp_path):
+    jobs = [service.submit('export_excel', {'deck_dir': str(tmp_path / f'deck{i}'), 'path': 'x.csv'})
+            for i in range(10)]
+    for j in jobs:
+        service.wait(j.id, 10)
+    assert all(j.status == sv.STATUS_FAILED for j in jobs)
+    assert service._path_locks == {}
+
+
+def test_http_jobs(server, deck_dir):
+    server, token = server
+    status, health = _request(server, 'GET', '/health', headers=_headers(token))
+    assert status == 200 and 'merge' in health['ops']
+
+    body = {'op': 'merge', 'params': {'deck_dir': str(deck_dir), 'sources': [str(deck_dir / 'src.json')],
+                                      'dry_run': True}}
+    status, job = _request(server, 'POST', '/jobs', body, _headers(token))
+    assert status == 202
+    status, job = _request(server, 'GET', f'/jobs/{job["id"]}?wait=10', headers=_headers(token))
+    assert (status, job['status'], job['result']['changed']) == (200, sv.STATUS_DONE, 1)
+
+    assert _request(server, 'POST', '/jobs', {'op': 'nope'}, _headers(token))[0] == 400
+    assert _request(server, 'GET', '/jobs/unknown', headers=_headers(token))[0] == 404
+
+
+@pytest.mark.parametrize('headers, code', [
+    ({'Content-Type': 'application/json'}, 401),
+    ({'Authorization': 'Bearer wrong', 'Content-Type': 'application/json'}, 401),
+    ({'Origin': 'http://evil.example'}, 403),
+    ({'Host': 'evil.example'}, 403),
+    ({'Content-Type': 'text/plain'}, 415),
+])
+def test_http_access(server, headers, code):
+    server, token = server
+    base = _headers(token) if code != 401 else {}
+    status, res = _request(server, 'POST', '/jobs', {'op': 'merge'}, {**base, **headers})
+    assert status == code
+    assert 'error' in res
+
+
+def test_unix_socket_permissions(service, tmp_path):
+    path = str(tmp_path / 'svc.sock')
+    server, token = sv.make_server(service, socket_path=path)
+    try:
+        assert token is None
+        assert stat.S_IMODE(os.stat(path).st_mode) == 0o600
+    finally:
+        server.server_close()
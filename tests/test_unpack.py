@@ -0,0 +1,53 @@
+import io
+import os
+
+import pytest
+from PIL import Image, ImageChops
+
+import run_deck_gen
+from tts_deckgen import deck as d
+from tts_deckgen import image_processing as ip
+from tts_deckgen.builder import DeckBuilder
+
+
+def _png(size, color):
+    buf = io.BytesIO()
+    Image.new('RGBA', size, color).save(buf, 'PNG')
+    return buf.getvalue()
+
+
+@pytest.fixture(autouse=True)
+def default_images(monkeypatch):
+    # Stamp, hide and back images are normally downloaded once per run
+    for url, color in ((d.DEFAULT_STAMP_IMAGE, (0, 0, 0, 0)), (d.DEFAULT_HIDE_IMAGE, (90, 90, 90, 255)),
+                       (d.DEFAULT_BACK_IMAGE, (20, 40, 60, 255))):
+        monkeypatch.setitem(ip._downloaded, url, _png((360, 512), color))
+
+
+def _build(pics_dir, output_dir):
+    builder = DeckBuilder(str(pics_dir), str(output_dir), no_rejected=True, tqdm_inst=lambda x, **kw: x)
+    builder.build()
+    return d.load_cards_info(str(output_dir), 'grid')
+
+
+def _sheet_images(deck_dir, prefix):
+    return [Image.open(d._sheet_path(s, str(deck_dir))).convert('RGBA') for s in d.DeckSheet.load(str(deck_dir), prefix)]
+
+
+def test_unpack_round_trip(tmp_path):
+    os.makedirs(tmp_path / 'pics')
+    for i in range(5):
+        Image.effect_noise((360, 512), 40 + i * 10).convert('RGB').save(tmp_path / 'pics' / f'Card {i}.png')
+    cards = _build(tmp_path / 'pics', tmp_path / 'deck')
+
+    run_deck_gen.unpack_deck(str(tmp_path / 'deck'), ['grid', 'clean'], str(tmp_path / 'unpacked'))
+    assert sorted(f for f in os.listdir(tmp_path / 'unpacked') if f.endswith('.png')) == \
+        [f'[000{i + 1}] Card {i}.png' for i in range(5)]
+
+    rebuilt = _build(tmp_path / 'unpacked', tmp_path / 'rebuilt')
+    assert [c['Nickname'] for c in rebuilt] == [c['Nickname'] for c in cards]
+    # Cards are cut from clean sheets, so the rebuilt deck doesn't get a second frame
+    for prefix in ('grid', 'clean'):
+        for a, b in zip(_sheet_images(tmp_path / 'deck', prefix), _sheet_images(tmp_path / 'rebuilt', prefix)):
+            assert a.size == b.size
+            assert ImageChops.difference(a, b).getbbox() is None
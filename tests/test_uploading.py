@@ -0,0 +1,90 @@
+import json
+import os
+
+import pytest
+from PIL import Image
+
+from tts_deckgen import uploading as up
+from .image_host import LocalImageHost
+
+
+def _make_sheets(path, count):
+    os.makedirs(path, exist_ok=True)
+    for i in range(count):
+        Image.new('RGB', (8, 8), (i * 40, 0, 0)).save(os.path.join(path, f'sheet_{i}.png'))
+    return [f'sheet_{i}.png' for i in range(count)]
+
+
+class BrokenBackend(up.UploadBackend):
+    # Fails on given files once, as if the run was interrupted there
+    def __init__(self, backend, broken):
+        self.backend = backend
+        self.broken = set(broken)
+        self.uploaded = []
+
+    def upload(self, session, path, timeout):
+        name = os.path.basename(path)
+        if name in self.broken:
+            self.broken.discard(name)
+            raise RuntimeError(f'Interrupted on {name}')
+        self.uploaded.append(name)
+        return self.backend.upload(session, path, timeout)
+
+
+def test_upload(tmp_path):
+    files = _make_sheets(tmp_path / 'out', 3)
+    with LocalImageHost(str(tmp_path / 'host')) as host:
+        res = up.upload_sheets(str(tmp_path / 'out'), host.backend(), workers=2)
+
+        assert sorted(res) == files
+        assert host.requests_count == 3
+        for f, url in res.items():
+            assert url.startswith(host.url)
+            with open(tmp_path / 'out' / f, 'rb') as fp:
+                assert fp.read() == up.requests.get(url).content
+
+    with open(tmp_path / 'out' / up.URL_REPLACE_JSON) as fp:
+        assert json.load(fp) == res
+
+
+def test_resume(tmp_path):
+    files = _make_sheets(tmp_path / 'out', 4)
+    with LocalImageHost(str(tmp_path / 'host')) as host:
+        backend = BrokenBackend(host.backend(), ['sheet_2.png'])
+        uploader = up.SheetUploader(backend, workers=1, retries=0, verbose=False)
+        with pytest.raises(up.UploadError):
+            uploader.upload_dir(str(tmp_path / 'out'))
+        saved = up.load_replacements(str(tmp_path / 'out'))
+        assert sorted(saved) == ['sheet_0.png', 'sheet_1.png', 'sheet_3.png']
+
+        backend.uploaded = []
+        res = uploader.upload_dir(str(tmp_path / 'out'))
+        uploader.close()
+
+        assert backend.uploaded == ['sheet_2.png']
+        assert sorted(res) == files
+        assert all(res[f] == saved[f] for f in saved)
+        assert host.requests_count == 4
+
+
+def test_retry(tmp_path):
+    _make_sheets(tmp_path / 'out', 2)
+    with LocalImageHost(str(tmp_path / 'host'), fail_first=2) as host:
+        uploader = up.SheetUploader(host.backend(), workers=1, retries=3, backoff=0.01, verbose=False)
+        res = uploader.upload_dir(str(tmp_path / 'out'))
+        uploader.close()
+
+        assert len(res) == 2
+        assert host.requests_count == 4
+
+
+def test_retries_exhausted(tmp_path):
+    _make_sheets(tmp_path / 'out', 1)
+    with LocalImageHost(str(tmp_path / 'host'), fail_first=10) as host:
+        uploader = up.SheetUploader(host.backend(), workers=1, retries=2, backoff=0.01, verbose=False)
+        with pytest.raises(up.UploadError):
+            uploader.upload_dir(str(tmp_path / 'out'))
+        uploader.close()
+
+        assert host.requests_count == 3
+        assert up.load_replacements(str(tmp_path / 'out')) == {}
@@ -0,0 +1,157 @@
+import datetime
+import gzip
+import hashlib
+import json
+import os
+import shutil
+import time
+from typing import List, Optional
+
+DEFAULT_KEEP = 10
+CHUNK_SIZE = 1 << 20
+
+
+class BackupGeneration:
+    id: int
+    hash: str
+    time: float
+    size: int
+    label: str
+    pinned: bool
+
+    def __init__(self, id: int, hash: str, time: float, size: int, label: str = '', pinned: bool = False):
+        self.id = id
+        self.hash = hash
+        self.time = time
+        self.size = size
+        self.label = label
+        self.pinned = pinned
+
+    def __str__(self):
+        stamp = datetime.datetime.fromtimestamp(self.time).strftime('%Y-%m-%d %H:%M:%S')
+        flags = ' (untouched)' if self.pinned else ''
+        label = f' {self.label}' if self.label else ''
+        return f'[{self.id}] {stamp} {self.size / 1024 / 1024:.2f} MB {self.hash[:12]}{flags}{label}'
+
+
+class BackupStore:
+    generations: List[BackupGeneration]
+
+    def __init__(self, root, keep=DEFAULT_KEEP, compresslevel=6):
+        self.root = root
+        self.keep = keep
+        self.compresslevel = compresslevel
+        self.generations = []
+        self.next_id = 1
+        self._load_index()
+
+    @classmethod
+    def for_save(cls, save_path, keep=DEFAULT_KEEP):
+        return cls(save_path + '.ttsdg-backups', keep)
+
+    def add(self, path, label='', pinned=False) -> BackupGeneration:
+        digest, size = _file_digest(path)
+        last = self.latest()
+        if last is not None and last.hash == digest and not pinned:
+            return last
+
+        obj_path = self._object_path(digest)
+        if not os.path.isfile(obj_path):
+            os.makedirs(os.path.dirname(obj_path), exist_ok=True)
+            tmp = obj_path + '.tmp'
+            with open(path, 'rb') as fin, gzip.open(tmp, 'wb', compresslevel=self.compresslevel) as fout:
+                shutil.copyfileobj(fin, fout, CHUNK_SIZE)
+            os.replace(tmp, obj_path)
+
+        gen = BackupGeneration(self.next_id, digest, time.time(), size, label, pinned)
+        self.next_id += 1
+        self.generations.append(gen)
+        self._apply_retention()
+        self._save_index()
+        return gen
+
+    def restore(self, dest, gen_id: Optional[int] = None, backup=True) -> BackupGeneration:
+        gen = self.get(gen_id)
+        tmp = dest + '.ttsdg-restore'
+        with gzip.open(self._object_path(gen.hash), 'rb') as fin, open(tmp, 'wb') as fout:
+            shutil.copyfileobj(fin, fout, CHUNK_SIZE)
+        # Current save is backed up too, so restoring a wrong generation can be undone
+        if backup and os.path.isfile(dest):
+            self.add(dest, f'before restore of [{gen.id}]')
+        os.replace(tmp, dest)
+        return gen
+
+    def get(self, gen_id: Optional[int] = None) -> BackupGeneration:
+        if len(self.generations) == 0:
+            raise ValueError('Backup store is empty')
+        if gen_id is None:
+            return self.generations[-1]
+        for gen in self.generations:
+            if gen.id == gen_id:
+                return gen
+        raise ValueError(f'Backup generation {gen_id} not found')
+
+    def latest(self) -> Optional[BackupGeneration]:
+        return self.generations[-1] if len(self.generations) > 0 else None
+
+    def untouched(self) -> Optional[BackupGeneration]:
+        for gen in self.generations:
+            if gen.pinned:
+                return gen
+        return None
+
+    def _apply_retention(self):
+        unpinned = [g for g in self.generations if not g.pinned]
+        if self.keep is not None and len(unpinned) > self.keep:
+            drop = set(g.id for g in unpinned[:len(unpinned) - self.keep])
+            self.generations = [g for g in self.generations if g.id not in drop]
+
+        referenced = set(g.hash for g in self.generations)
+        objects_dir = os.path.join(self.root, 'objects')
+        if os.path.isdir(objects_dir):
+            for f in os.listdir(objects_dir):
+                if f.endswith('.gz') and f[:-3] not in referenced:
+                    os.remove(os.path.join(objects_dir, f))
+
+    def _object_path(self, digest):
+        return os.path.join(self.root, 'objects', f'{digest}.gz')
+
+    def _index_path(self):
+        return os.path.join(self.root, 'index.json')
+
+    def _load_index(self):
+        path = self._index_path()
+        if not os.path.isfile(path):
+            return
+        with open(path) as fp:
+            index = json.load(fp)
+        self.generations = [BackupGeneration(**g) for g in index['generations']]
+        self.next_id = index['next_id']
+
+    def _save_index(self):
+        os.makedirs(self.root, exist_ok=True)
+        path = self._index_path()
+        with open(path + '.tmp', 'w') as fp:
+            json.dump({'next_id': self.next_id, 'generations': self.generations}, fp, default=vars, indent=2)
+        os.replace(path + '.tmp', path)
+
+
+def _file_digest(path):
+    h = hashlib.sha256()
+    size = 0
+    with open(path, 'rb') as fp:
+        while True:
+            chunk = fp.read(CHUNK_SIZE)
+            if not chunk:
+                break
+            h.update(chunk)
+            size += len(chunk)
+    return h.hexdigest(), size
+
+
+def backup_save(save_path, keep=DEFAULT_KEEP, label=''):
+    store = BackupStore.for_save(save_path, keep)
+    if store.untouched() is None:
+        legacy = save_path + '.ttsdg.bak'
+        store.add(legacy if os.path.isfile(legacy) else save_path, pinned=True)
+    return store.add(save_path, label)
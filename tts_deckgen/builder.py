@@ -0,0 +1,126 @@
+import os
+import random
+import time
+from typing import Optional, List, Dict
+
+from PIL import Image, ImageColor
+from tqdm import tqdm
+
+from . import deck as d
+from . import image_processing as ip
+from .sources import open_source
+
+
+class DeckBuilder:
+    cache: Dict[str, tuple]
+    digests: Dict[str, str]
+
+    def __init__(self, pics_dir, output_dir, no_rejected=False, tqdm_inst=None, bg_color: Optional[str] = 'FFFFFF',
+                 hashed_names=False, lod: Optional[List[int]] = None):
+        self.pics_dir = pics_dir
+        self.source = open_source(pics_dir)
+        self.output_dir = output_dir
+        self.no_rejected = no_rejected
+        self.tqdm_inst = tqdm_inst or tqdm
+        self.bg_color = ImageColor.getrgb(f'#{bg_color.lower()}ff') if bg_color is not None else None
+        self.hashed_names = hashed_names
+        self.lod = lod or []
+
+        # Processed pictures by file name, valid while the source key (like mtime and size) of the file is the same
+        self.cache = {}
+        self.digests = {}
+        self._stamp_img = None
+        self._hide_img = None
+        self._back_img = None
+
+    def build(self):
+        if self._stamp_img is None:
+            self._stamp_img = ip.download_img(d.DEFAULT_STAMP_IMAGE)
+            self._hide_img = ip.download_img(d.DEFAULT_HIDE_IMAGE)
+            self._back_img = ip.download_img(d.DEFAULT_BACK_IMAGE)
+
+        info = []
+        pics_fixed = []
+        pics_face = []
+        pics_back = None if self.no_rejected else []
+
+        files = self.source.snapshot()
+        listdir = self.source.order(files.keys())
+        changed = [f for f in listdir if f not in self.cache or self.cache[f][0] != files[f]]
+        self.source.prefetch(changed)
+        for f in self.tqdm_inst(self.source.read_order(changed), total=len(changed), unit='pic',
+                                desc='Preparing pictures'):
+            self.cache[f] = (files[f],) + self._process(f)
+
+        for f in listdir:
+            info.append(self.source.card_info(f))
+            _, face, fixed, back = self.cache[f]
+            pics_face.append(face)
+            pics_fixed.append(fixed)
+            if pics_back is not None:
+                pics_back.append(back)
+
+        for f in set(self.cache.keys()) - files.keys():
+            del self.cache[f]
+        print(f'Pictures: {len(listdir)}, processed: {len(changed)}, cached: {len(listdir) - len(changed)}')
+
+        print('DECK: grid')
+        grid_deck = d.Deck.create(pics_face, back_images=pics_back, info=info, tqdm_inst=self.tqdm_inst,
+                                  bg_color=self.bg_color, hide_img=self._hide_img, back_img=self._back_img)
+        print('DECK: clean')
+        clean_deck = d.Deck.create(pics_fixed, tqdm_inst=self.tqdm_inst, info=info, bg_color=self.bg_color,
+                                   hide_img=self._hide_img, back_img=self._back_img)
+
+        print('Saving...')
+        os.makedirs(self.output_dir, exist_ok=True)
+        for prefix, deck in (('grid', grid_deck), ('clean', clean_deck)):
+            written = deck.save(self.output_dir, prefix, 'grid' == prefix, self.hashed_names, self.digests)
+            print(f'{prefix}: {deck.sheets_info()}, images written: {written}')
+
+            for percent in self.lod:
+                lod_prefix = f'{prefix}_lod{percent}'
+                written = deck.scaled(percent / 100).save(self.output_dir, lod_prefix, 'grid' == prefix,
+                                                          self.hashed_names, self.digests)
+                print(f'{lod_prefix}: {percent}% resolution, images written: {written}')
+
+        return grid_deck, clean_deck
+
+    def _process(self, name):
+        with self.source.open(name) as fp, Image.open(fp) as img_open:
+            img = img_open.convert('RGBA')
+        face = ip.round_frame(img)
+        fixed = ip.fix_ratio(img)
+        back = None
+        if not self.no_rejected:
+            rnd = random.Random(name) if self.hashed_names else None
+            back = ip.stamp(fixed, self._stamp_img, rnd=rnd)
+        return face, fixed, back
+
+    def watch(self, on_build=None, interval=1.0, debounce=2.0):
+        last = self.source.snapshot()
+        print(f'Watching {self.pics_dir} for changes (Ctrl+C to stop)...')
+        while True:
+            time.sleep(interval)
+            current = self.source.snapshot()
+            if current == last:
+                continue
+
+            # Wait until a burst of changes (copying many files) settles down
+            changed_at = time.monotonic()
+            while time.monotonic() - changed_at < debounce:
+                time.sleep(interval)
+                new = self.source.snapshot()
+                if new != current:
+                    current = new
+                    changed_at = time.monotonic()
+
+            last = current
+            print('Changes detected, rebuilding...')
+            try:
+                decks = self.build()
+                if on_build is not None:
+                    on_build(*decks)
+            except Exception as e:
+                print(f'Rebuild failed: {e}')
+                continue
+            print('Rebuild done')
@@ -0,0 +1,203 @@
+import json
+import os
+import sqlite3
+from typing import List, Dict, Optional
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS cards (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    pos INTEGER NOT NULL,
+    nickname TEXT,
+    data TEXT NOT NULL
+);
+CREATE INDEX IF NOT EXISTS cards_pos ON cards (pos);
+CREATE INDEX IF NOT EXISTS cards_nickname ON cards (nickname);
+CREATE TABLE IF NOT EXISTS properties (
+    card_id INTEGER NOT NULL REFERENCES cards (id) ON DELETE CASCADE,
+    ord INTEGER NOT NULL,
+    key TEXT NOT NULL,
+    value,
+    kind TEXT,
+    PRIMARY KEY (card_id, key)
+);
+CREATE INDEX IF NOT EXISTS properties_key_value ON properties (key, value);
+"""
+
+# Placeholder keeping position of 'Properties' key in card's JSON object.
+# Non-dict values (e.g. "Properties": null) are kept in card's JSON as is
+PROPERTIES_MARK = '\0properties'
+
+
+class CardStore:
+    def __init__(self, path):
+        self.path = path
+        self.conn = sqlite3.connect(path)
+        self.conn.execute('PRAGMA foreign_keys = ON')
+        self.conn.execute('PRAGMA journal_mode = WAL')
+        self.conn.execute('PRAGMA synchronous = NORMAL')
+        self.conn.executescript(SCHEMA)
+
+    def close(self):
+        self.conn.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+    def __len__(self):
+        return self.conn.execute('SELECT COUNT(*) FROM cards').fetchone()[0]
+
+    def load(self) -> List[dict]:
+        props: Dict[int, dict] = {}
+        for card_id, key, value, kind in self.conn.execute(
+                'SELECT card_id, key, value, kind FROM properties ORDER BY card_id, ord'):
+            props.setdefault(card_id, {})[key] = _decode_value(value, kind)
+
+        res = []
+        for card_id, data in self.conn.execute('SELECT id, data FROM cards ORDER BY pos'):
+            card = json.loads(data)
+            if card.get('Properties') == PROPERTIES_MARK:
+                card['Properties'] = props.get(card_id, {})
+            res.append(card)
+        return res
+
+    def replace_all(self, cards: List[dict]):
+        with self.conn:
+            self.conn.execute('DELETE FROM properties')
+            self.conn.execute('DELETE FROM cards')
+            for pos, card in enumerate(cards):
+                self._insert(pos, card)
+
+    def insert_card(self, pos: int, card: dict):
+        with self.conn:
+            self.conn.execute('UPDATE cards SET pos = pos + 1 WHERE pos >= ?', (pos,))
+            self._insert(pos, card)
+
+    def set_card(self, pos: int, card: dict):
+        with self.conn:
+            card_id = self._card_id(pos)
+            self.conn.execute('DELETE FROM properties WHERE card_id = ?', (card_id,))
+            self.conn.execute('UPDATE cards SET nickname = ?, data = ? WHERE id = ?',
+                              (card.get('Nickname'), _encode_card(card), card_id))
+            self._insert_props(card_id, _properties(card))
+
+    def update_properties(self, changes: Dict[int, dict], removals: Dict[int, List[str]]):
+        with self.conn:
+            for pos in set(changes.keys()) | set(removals.keys()):
+                card_id = self._card_id(pos)
+                data = json.loads(self.conn.execute('SELECT data FROM cards WHERE id = ?', (card_id,)).fetchone()[0])
+                if data.get('Properties') != PROPERTIES_MARK:
+                    data['Properties'] = PROPERTIES_MARK
+                    self.conn.execute('UPDATE cards SET data = ? WHERE id = ?', (json.dumps(data), card_id))
+
+                for k in removals.get(pos, []):
+                    self.conn.execute('DELETE FROM properties WHERE card_id = ? AND key = ?', (card_id, k))
+
+                next_ord = self.conn.execute('SELECT COALESCE(MAX(ord), -1) + 1 FROM properties WHERE card_id = ?',
+                                             (card_id,)).fetchone()[0]
+                for k, v in changes.get(pos, {}).items():
+                    value, kind = _encode_value(v)
+                    updated = self.conn.execute('UPDATE properties SET value = ?, kind = ? WHERE card_id = ? AND key = ?',
+                                                (value, kind, card_id, k)).rowcount
+                    if updated == 0:
+                        self.conn.execute('INSERT INTO properties (card_id, ord, key, value, kind) '
+                                          'VALUES (?, ?, ?, ?, ?)', (card_id, next_ord, k, value, kind))
+                        next_ord += 1
+
+    def find(self, key: str, value=None) -> List[int]:
+        if value is None:
+            q = self.conn.execute('SELECT c.pos FROM properties p JOIN cards c ON c.id = p.card_id '
+                                  'WHERE p.key = ? ORDER BY c.pos', (key,))
+        else:
+            q = self.conn.execute('SELECT c.pos FROM properties p JOIN cards c ON c.id = p.card_id '
+                                  'WHERE p.key = ? AND p.value = ? ORDER BY c.pos', (key, _encode_value(value)[0]))
+        return [r[0] for r in q]
+
+    def import_json(self, path):
+        with open(path) as fp:
+            self.replace_all(json.load(fp))
+
+    def export_json(self, path):
+        with open(path, 'w') as fp:
+            json.dump(self.load(), fp, indent=2)
+
+    def _card_id(self, pos):
+        row = self.conn.execute('SELECT id FROM cards WHERE pos = ?', (pos,)).fetchone()
+        if row is None:
+            raise IndexError(f'Card index out of range: {pos}')
+        return row[0]
+
+    def _insert(self, pos, card):
+        cur = self.conn.execute('INSERT INTO cards (pos, nickname, data) VALUES (?, ?, ?)',
+                                (pos, card.get('Nickname'), _encode_card(card)))
+        self._insert_props(cur.lastrowid, _properties(card))
+
+    def _insert_props(self, card_id, props):
+        self.conn.executemany('INSERT INTO properties (card_id, ord, key, value, kind) VALUES (?, ?, ?, ?, ?)',
+                              [(card_id, i, k, *_encode_value(v)) for i, (k, v) in enumerate(props.items())])
+
+
+def _properties(card):
+    props = card.get('Properties')
+    return props if isinstance(props, dict) else {}
+
+
+def _encode_card(card):
+    data = dict(card)
+    if isinstance(data.get('Properties'), dict):
+        data['Properties'] = PROPERTIES_MARK
+    return json.dumps(data)
+
+
+def _encode_value(v):
+    if isinstance(v, bool):
+        return int(v), 'b'
+    if v is None or isinstance(v, (str, int, float)):
+        return v, None
+    return json.dumps(v), 'j'
+
+
+def _decode_value(value, kind: Optional[str]):
+    if kind == 'b':
+        return bool(value)
+    if kind == 'j':
+        return json.loads(value)
+    return value
+
+
+def convert(json_path, sqlite_path, to_sqlite=True):
+    # New file is written aside and checked, source is removed only after it replaces the target
+    if to_sqlite:
+        with open(json_path) as fp:
+            cards = json.load(fp)
+        tmp = sqlite_path + '.tmp'
+        _remove_sqlite(tmp)
+        with CardStore(tmp) as store:
+            store.replace_all(cards)
+            count = len(store)
+        if count != len(cards):
+            _remove_sqlite(tmp)
+            raise ValueError(f'Cards info conversion failed, {count} of {len(cards)} cards written')
+        os.replace(tmp, sqlite_path)
+        os.remove(json_path)
+    else:
+        with CardStore(sqlite_path) as store:
+            cards = store.load()
+        tmp = json_path + '.tmp'
+        with open(tmp, 'w') as fp:
+            json.dump(cards, fp, indent=2)
+        with open(tmp) as fp:
+            count = len(json.load(fp))
+        if count != len(cards):
+            os.remove(tmp)
+            raise ValueError(f'Cards info conversion failed, {count} of {len(cards)} cards written')
+        os.replace(tmp, json_path)
+        _remove_sqlite(sqlite_path)
+
+
+def _remove_sqlite(path):
+    for suffix in ('', '-wal', '-shm'):
+        if os.path.isfile(path + suffix):
+            os.remove(path + suffix)
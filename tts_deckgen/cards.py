@@ -0,0 +1,168 @@
+import json
+import sys
+from array import array
+from collections.abc import MutableMapping
+from typing import List, Dict, Optional, Iterable
+
+NICKNAME = 'Nickname'
+PROPERTIES = 'Properties'
+
+_MISSING = object()
+
+
+def _intern(v):
+    return sys.intern(v) if type(v) is str else v
+
+
+class CardRecord(MutableMapping):
+    __slots__ = ('nickname', 'properties', 'extra')
+
+    def __init__(self, nickname=_MISSING, properties=_MISSING, extra: Optional[dict] = None):
+        self.nickname = _intern(nickname)
+        self.properties = _MISSING if properties is _MISSING else InternedDict(properties)
+        self.extra = extra
+
+    @classmethod
+    def from_dict(cls, card: dict):
+        extra = {k: v for k, v in card.items() if k != NICKNAME and k != PROPERTIES}
+        return cls(card.get(NICKNAME, _MISSING), card.get(PROPERTIES, _MISSING), extra or None)
+
+    def to_dict(self):
+        return dict(self)
+
+    def __getitem__(self, k):
+        if k == NICKNAME:
+            v = self.nickname
+        elif k == PROPERTIES:
+            v = self.properties
+        elif self.extra is not None and k in self.extra:
+            v = self.extra[k]
+        else:
+            v = _MISSING
+        if v is _MISSING:
+            raise KeyError(k)
+        return v
+
+    def __setitem__(self, k, v):
+        if k == NICKNAME:
+            self.nickname = _intern(v)
+        elif k == PROPERTIES:
+            self.properties = v if isinstance(v, InternedDict) else InternedDict(v)
+        else:
+            if self.extra is None:
+                self.extra = {}
+            self.extra[k] = v
+
+    def __delitem__(self, k):
+        self[k]
+        if k == NICKNAME:
+            self.nickname = _MISSING
+        elif k == PROPERTIES:
+            self.properties = _MISSING
+        else:
+            del self.extra[k]
+
+    def __iter__(self):
+        if self.nickname is not _MISSING:
+            yield NICKNAME
+        if self.properties is not _MISSING:
+            yield PROPERTIES
+        if self.extra is not None:
+            yield from self.extra
+
+    def __len__(self):
+        return (self.nickname is not _MISSING) + (self.properties is not _MISSING) + len(self.extra or ())
+
+    def __repr__(self):
+        return repr(self.to_dict())
+
+
+class InternedDict(dict):
+    __slots__ = ()
+
+    def __init__(self, src=()):
+        super().__init__()
+        for k, v in (src.items() if isinstance(src, dict) else src):
+            self[k] = v
+
+    def __setitem__(self, k, v):
+        super().__setitem__(_intern(k), _intern(v))
+
+
+def cards_from_json(cards: Iterable[dict]) -> List[CardRecord]:
+    return [c if isinstance(c, CardRecord) else CardRecord.from_dict(c) for c in cards]
+
+
+def cards_to_json(cards: Iterable[MutableMapping]) -> List[dict]:
+    return [c.to_dict() if isinstance(c, CardRecord) else c for c in cards]
+
+
+def json_default(o):
+    if isinstance(o, CardRecord):
+        return o.to_dict()
+    raise TypeError(f'Object of type {type(o).__name__} is not JSON serializable')
+
+
+def value_key(v):
+    # Lists and dicts from JSON can't be dict keys
+    if isinstance(v, (list, dict)):
+        return json.dumps(v, sort_keys=True, default=json_default)
+    return v
+
+
+class PropertyTable:
+    nicknames: List[str]
+    keys: List[str]
+    codes: Dict[str, array]
+    values: Dict[str, list]
+
+    def __init__(self, size=0):
+        self.size = size
+        self.nicknames = [''] * size
+        self.keys = []
+        self.codes = {}
+        self.values = {}
+        self._lookup: Dict[str, dict] = {}
+
+    @classmethod
+    def from_cards(cls, cards: List[MutableMapping]):
+        table = cls(len(cards))
+        for i, c in enumerate(cards):
+            table.nicknames[i] = _intern(c.get(NICKNAME, ''))
+            for k, v in (c.get(PROPERTIES) or {}).items():
+                table.set(i, k, v)
+        return table
+
+    def set(self, row, key, value):
+        if key not in self.codes:
+            key = _intern(key)
+            self.keys.append(key)
+            # Code 0 is reserved for missing value
+            self.codes[key] = array('I', [0]) * self.size
+            self.values[key] = [None]
+            self._lookup[key] = {}
+
+        lookup = self._lookup[key]
+        vk = value_key(value)
+        code = lookup.get(vk)
+        if code is None:
+            code = len(self.values[key])
+            self.values[key].append(_intern(value))
+            lookup[vk] = code
+        self.codes[key][row] = code
+
+    def get(self, row, key, default=None):
+        codes = self.codes.get(key)
+        if codes is None or codes[row] == 0:
+            return default
+        return self.values[key][codes[row]]
+
+    def row(self, row) -> dict:
+        return {k: self.values[k][self.codes[k][row]] for k in self.keys if self.codes[k][row] != 0}
+
+    def column(self, key, missing='') -> list:
+        values = [missing] + self.values[key][1:]
+        return [values[c] for c in self.codes[key]]
+
+    def to_cards(self) -> List[CardRecord]:
+        return [CardRecord(self.nicknames[i], self.row(i)) for i in range(self.size)]
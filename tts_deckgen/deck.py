@@ -1,13 +1,19 @@
+import hashlib
 import json
 import math
 import os
-from typing import List, Union, Tuple, Optional
+import re
+import shutil
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from typing import List, Union, Tuple, Optional, Dict
 
 from PIL import Image as Image
 from PIL.Image import Image as PILImage
 from tqdm import tqdm
 
 from . import image_processing as ip
+from .card_store import CardStore
+from .cards import cards_from_json, json_default
 
 MAX_SHEET_WIDTH = 10
 MAX_SHEET_HEIGHT = 7
@@ -20,12 +26,14 @@ MARGIN = 0
 class SheetGenerator:
     checkpoint: Optional[Tuple[int, Tuple[int, int], Tuple[int, int]]]
 
-    def __init__(self, w, h, card_size, total_images, bg_color: Optional[Tuple[int, int, int]]):
+    def __init__(self, w, h, card_size, total_images, bg_color: Optional[Tuple[int, int, int]], dry=False):
         self.w = w
         self.h = h
         self.card_size = card_size
         self.total_images = total_images
         self.bg_color = bg_color
+        # Dry generator only plans sheets: their pixel sizes are stored instead of images
+        self.dry = dry
 
         self.sheets = []
         self.sizes = []
@@ -63,17 +71,24 @@ class SheetGenerator:
                 self.w = new_size[0]
                 self.h = new_size[1]
 
-            self.sheets.append(_create_sheet(self.total_images - cur_i, self.w, self.h, self.card_size))
+            self.sheets.append(self._new_sheet(self.total_images - cur_i))
             self.x, self.y = 0, 0
 
+    def _new_sheet(self, leftover):
+        if self.dry:
+            return _sheet_size(leftover, self.w, self.h, self.card_size)
+        return _create_sheet(leftover, self.w, self.h, self.card_size)
+
     def _insert(self, im, x=None, y=None):
+        if self.dry:
+            return
         if x is None:
             x = self.x
         if y is None:
             y = self.y
 
         if im.size != self.card_size:
-            im = im.resize(self.card_size, Image.ANTIALIAS)
+            im = im.resize(self.card_size, Image.LANCZOS)
 
         if self.bg_color is not None:
             bg = Image.new('RGBA', im.size, self.bg_color)
@@ -136,7 +151,7 @@ class SheetGenerator:
             self.w = self.checkpoint[1][0]
             self.h = self.checkpoint[1][1]
 
-        self.sheets.append(_create_sheet(self.total_images, self.w, self.h, self.card_size))
+        self.sheets.append(self._new_sheet(self.total_images))
 
     def _try_solve_full_line_issue(self, last_sheet_size):
         w = self.w - 1
@@ -204,23 +219,38 @@ class Deck:
             res.append(f'({w}x{h}): {c}')
         return ', '.join(res)
 
-    def save(self, output_dir, prefix, save_cards=True):
+    def save(self, output_dir, prefix, save_cards=True, hashed_names=False, digests: Optional[Dict[str, str]] = None):
+        written = set()
+        saved = 0
+
+        def save_img(img, name):
+            nonlocal saved
+            digest = image_digest(img) if hashed_names or digests is not None else None
+            if hashed_names:
+                name = f'{name}_{digest[:12]}'
+            path = os.path.abspath(os.path.join(output_dir, f'{name}.png'))
+
+            # Digests of previously saved files allow to skip slow PNG encoding of unchanged sheets
+            unchanged = hashed_names or digests is not None and digests.get(path) == digest
+            if not unchanged or not os.path.isfile(path):
+                img.save(path)
+                saved += 1
+            if digests is not None:
+                digests[path] = digest
+            written.add(os.path.basename(path))
+            return path
+
         faces = []
         for i, s in enumerate(self.sheets):
-            path = os.path.abspath(os.path.join(output_dir, f'{prefix}_sheet_{i:02d}.png'))
-            s.save(path)
-            faces.append(path)
+            faces.append(save_img(s, f'{prefix}_sheet_{i:02d}'))
 
         if self.back_sheets is not None:
             backs = list()
             for i, s in enumerate(self.back_sheets):
-                path = os.path.abspath(os.path.join(output_dir, f'{prefix}_back_{i:02d}.png'))
-                s.save(path)
-                backs.append(path)
+                backs.append(save_img(s, f'{prefix}_back_{i:02d}'))
 
         else:
-            path = os.path.abspath(os.path.join(output_dir, f'{prefix}_back.png'))
-            self.back_img.save(path)
+            path = save_img(self.back_img, f'{prefix}_back')
             backs = [path for _ in range(len(faces))]
 
         self.saved_sheets = []
@@ -232,6 +262,26 @@ class Deck:
         if save_cards:
             save_cards_info(self.cards_info, output_dir, prefix)
 
+        if hashed_names:
+            remove_stale_sheets(output_dir, prefix, written)
+        return saved
+
+    def scaled(self, factor: float):
+        if factor <= 0:
+            raise ValueError(f'Scale factor must be positive, got {factor}')
+
+        sheets = [_scale_sheet(s, w, h, factor) for s, (w, h, _) in zip(self.sheets, self.sheets_sizes)]
+        back_sheets = None
+        if self.back_sheets is not None:
+            back_sheets = [_scale_sheet(s, w, h, factor) for s, (w, h, _) in zip(self.back_sheets, self.sheets_sizes)]
+
+        if isinstance(self.back_img, list):
+            back_img = [_scale_sheet(b, 1, 1, factor) for b in self.back_img]
+        else:
+            back_img = _scale_sheet(self.back_img, 1, 1, factor)
+
+        return Deck(sheets, back_img, back_sheets, self.has_hide_img, list(self.sheets_sizes), self.cards_info)
+
     @classmethod
     def create(cls, images: List[PILImage], info: Optional[List[dict]] = None, back_img=None, back_images=None,
                insert_hide=True, hide_img=None,
@@ -265,31 +315,14 @@ class Deck:
         sheet_width = min(sheet_width, MAX_SHEET_WIDTH)
         sheet_height = min(sheet_height, MAX_SHEET_HEIGHT)
 
-        ratio = None
-        card_size: Optional[Tuple[int, int]] = None
-
         if tqdm_desc is not None:
             print(f'Preparing {tqdm_desc}...')
 
-        for im in images:
-            curr_ratio = im.size[0] / im.size[1]
-            if ratio is None:
-                ratio = curr_ratio
-            elif abs(ratio - curr_ratio) > 0.01:
-                raise ValueError('Found not equal ratio!')
-
-            if im.size[0] > maxw:
-                card_size = (maxw, maxw * im.size[1] // im.size[0])
-                break
-            if card_size is None or card_size[0] < im.size[0]:
-                card_size = im.size
+        card_size = plan_card_size([im.size for im in images], maxw)
 
         if hide_img is not None:
-            cards_per_sheet = sheet_width * sheet_height
-            i = cards_per_sheet - 1
-            while i < len(images):
+            for i in hide_positions(len(images), sheet_width * sheet_height):
                 images.insert(i, hide_img)
-                i += cards_per_sheet
 
         images_gen = images if tqdm_desc is None else tqdm_inst(images, total=len(images), unit='pic',
                                                                 desc=f'Generating {tqdm_desc}')
@@ -303,14 +336,71 @@ class Deck:
         return gen.get()
 
 
-def _create_sheet(leftover, width, max_height, card_size, background_color=(255, 255, 255, 255)):
+def plan_card_size(sizes: List[Tuple[int, int]], maxw=720, names: Optional[List[str]] = None):
+    ratio = None
+    card_size: Optional[Tuple[int, int]] = None
+
+    for i, size in enumerate(sizes):
+        curr_ratio = size[0] / size[1]
+        if ratio is None:
+            ratio = curr_ratio
+        elif abs(ratio - curr_ratio) > 0.01:
+            raise ValueError('Found not equal ratio!' + (f' ({names[i]}: {size[0]}x{size[1]})' if names else ''))
+
+        if size[0] > maxw:
+            card_size = (maxw, maxw * size[1] // size[0])
+            break
+        if card_size is None or card_size[0] < size[0]:
+            card_size = size
+    return card_size
+
+
+def hide_positions(total_images, cards_per_sheet):
+    # Hide image takes the last card of every full sheet
+    res = []
+    i = cards_per_sheet - 1
+    while i < total_images + len(res):
+        res.append(i)
+        i += cards_per_sheet
+    return res
+
+
+def _sheet_size(leftover, width, max_height, card_size):
     height = int(math.ceil(leftover / width))
     height = min(height, max_height)
-    return Image.new(
-        'RGBA', (
-            card_size[0] * width + MARGIN * (width - 1),
-            card_size[1] * height + MARGIN * (height - 1)),
-        background_color)
+    return card_size[0] * width + MARGIN * (width - 1), card_size[1] * height + MARGIN * (height - 1)
+
+
+def _create_sheet(leftover, width, max_height, card_size, background_color=(255, 255, 255, 255)):
+    return Image.new('RGBA', _sheet_size(leftover, width, max_height, card_size), background_color)
+
+
+def _scale_sheet(sheet: PILImage, columns, rows, factor):
+    # Cells are scaled one by one, so neighbour cards don't bleed into each other and layout stays the same
+    cw, ch = sheet.size[0] // columns, sheet.size[1] // rows
+    new_cw, new_ch = max(1, round(cw * factor)), max(1, round(ch * factor))
+    res = Image.new(sheet.mode, (new_cw * columns, new_ch * rows))
+    for y in range(rows):
+        for x in range(columns):
+            cell = sheet.crop((x * cw, y * ch, (x + 1) * cw, (y + 1) * ch))
+            res.paste(cell.resize((new_cw, new_ch), Image.LANCZOS), (x * new_cw, y * new_ch))
+    return res
+
+
+def image_digest(img: PILImage):
+    h = hashlib.sha1(f'{img.mode}:{img.size[0]}x{img.size[1]}:'.encode())
+    h.update(img.tobytes())
+    return h.hexdigest()
+
+
+def remove_stale_sheets(output_dir, prefix, keep):
+    pattern = re.compile(fr'^{re.escape(prefix)}_(sheet_\d+|back_\d+|back)(_[0-9a-f]+)?\.png$')
+    removed = []
+    for f in os.listdir(output_dir):
+        if f not in keep and pattern.match(f):
+            os.remove(os.path.join(output_dir, f))
+            removed.append(f)
+    return removed
 
 
 def deck_info_json(dir, prefix):
@@ -321,15 +411,61 @@ def cards_info_json(dir, prefix):
     return os.path.join(dir, f'{prefix}_cards_info.json')
 
 
-def load_cards_info(directory, prefix):
-    with open(cards_info_json(directory, prefix)) as fp:
-        res = json.load(fp)
-    return res
+def cards_info_sqlite(dir, prefix):
+    return os.path.join(dir, f'{prefix}_cards_info.sqlite')
+
+
+def cards_info_path(dir, prefix):
+    path = cards_info_sqlite(dir, prefix)
+    return path if os.path.isfile(path) else cards_info_json(dir, prefix)
+
+
+def has_cards_info(dir, prefix):
+    return os.path.isfile(cards_info_path(dir, prefix))
+
+
+def load_cards_info(directory, prefix, compact=False):
+    path = cards_info_path(directory, prefix)
+    if is_card_store(path):
+        with CardStore(path) as store:
+            res = store.load()
+    else:
+        with open(path) as fp:
+            res = json.load(fp)
+    return cards_from_json(res) if compact else res
 
 
 def save_cards_info(cards, deck_dir, prefix):
-    with open(cards_info_json(deck_dir, prefix), 'w') as f:
-        json.dump(cards, f, indent=2)
+    path = cards_info_path(deck_dir, prefix)
+    if is_card_store(path):
+        with CardStore(path) as store:
+            store.replace_all(cards)
+        return
+
+    with open(path, 'w') as f:
+        json.dump(cards, f, indent=2, default=json_default)
+
+
+def insert_card_info(cards, idx, deck_dir, prefix):
+    path = cards_info_path(deck_dir, prefix)
+    if is_card_store(path):
+        with CardStore(path) as store:
+            store.insert_card(idx, cards[idx])
+    else:
+        save_cards_info(cards, deck_dir, prefix)
+
+
+def copy_cards_info(deck_dir, src_prefix, dst_prefix):
+    src = cards_info_path(deck_dir, src_prefix)
+    if is_card_store(src):
+        with CardStore(cards_info_sqlite(deck_dir, dst_prefix)) as store:
+            store.replace_all(load_cards_info(deck_dir, src_prefix))
+    else:
+        shutil.copy(src, cards_info_json(deck_dir, dst_prefix))
+
+
+def is_card_store(path):
+    return path.endswith('.sqlite')
 
 
 def save_deck_info(deck_info, deck_dir, prefix):
@@ -366,3 +502,53 @@ def get_from_sheets(sheets: List[DeckSheet], idx: int):
     x *= card_size[0]
     y *= card_size[1]
     return sheet_img.crop((x, y, x + card_size[0], y + card_size[1]))
+
+
+def _sheet_path(sheet: DeckSheet, deck_dir):
+    # Deck info keeps absolute paths, deck dir could be moved since then
+    if os.path.isfile(sheet.face_path):
+        return sheet.face_path
+    return os.path.join(deck_dir, os.path.basename(sheet.face_path))
+
+
+def _card_file_name(idx, total, nickname):
+    nickname = re.sub(r'[<>:"/\\|?*\x00-\x1f]', '_', nickname).strip() or 'Card'
+    return f'[{idx + 1:0{max(4, len(str(total)))}d}] {nickname}.png'
+
+
+def unpack_sheets(sheets: List[DeckSheet], deck_dir, output_dir, cards: Optional[List[dict]] = None, workers=None,
+                  tqdm_inst=tqdm):
+    total = sum(s.size[2] for s in sheets)
+    if cards is not None and len(cards) != total:
+        raise ValueError(f'Cards info length mismatch with sheets ({len(cards)} vs. {total})')
+    os.makedirs(output_dir, exist_ok=True)
+
+    def decode(path):
+        with Image.open(path) as img:
+            img.load()
+            return img
+
+    def save_card(sheet_img, size, cell, idx):
+        cw = (sheet_img.size[0] - MARGIN * (size[0] - 1)) // size[0]
+        ch = (sheet_img.size[1] - MARGIN * (size[1] - 1)) // size[1]
+        x, y = cell % size[0] * (cw + MARGIN), cell // size[0] * (ch + MARGIN)
+        nickname = cards[idx].get('Nickname', '') if cards is not None else ''
+        sheet_img.crop((x, y, x + cw, y + ch)).save(os.path.join(output_dir, _card_file_name(idx, total, nickname)))
+
+    # Each sheet is decoded once, its cards are encoded by the same pool while other sheets are still decoding
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        decoding = {executor.submit(decode, _sheet_path(s, deck_dir)): i for i, s in enumerate(sheets)}
+        starts = [sum(s.size[2] for s in sheets[:i]) for i in range(len(sheets))]
+        saving = []
+        for future in as_completed(decoding):
+            i = decoding[future]
+            sheet_img = future.result()
+            saving += [executor.submit(save_card, sheet_img, sheets[i].size, c, starts[i] + c)
+                       for c in range(sheets[i].size[2])]
+
+        for future in tqdm_inst(as_completed(saving), total=len(saving), unit='card', desc='Unpacking cards'):
+            future.result()
+
+    if cards is not None:
+        save_cards_info(cards, output_dir, 'unpacked')
+    return total
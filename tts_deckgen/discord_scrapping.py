@@ -0,0 +1,227 @@
+import asyncio
+import hashlib
+import json
+import os
+import time
+from collections import deque
+from datetime import datetime
+from typing import Dict, Optional, Union
+
+SUPPORTED_EXT = ['png', 'jpg', 'jpeg']
+CHECKPOINT_JSON = '.scrap_checkpoint.json'
+MANIFEST_JSON = '.scrap_manifest.json'
+
+
+class Snowflake:
+    __slots__ = ('id',)
+
+    def __init__(self, id: int):
+        self.id = id
+
+
+class Checkpoint:
+    def __init__(self, output, save_interval=1.0):
+        self.path = os.path.join(output, CHECKPOINT_JSON)
+        self.save_interval = save_interval
+        self.last_ids: Dict[str, int] = {}
+        self._saved_at = 0.0
+        if os.path.isfile(self.path):
+            with open(self.path) as fp:
+                self.last_ids = json.load(fp)
+
+    def get(self, channel_id) -> Optional[int]:
+        return self.last_ids.get(str(channel_id))
+
+    def set(self, channel_id, message_id):
+        self.last_ids[str(channel_id)] = message_id
+        if time.monotonic() - self._saved_at >= self.save_interval:
+            self.save()
+
+    def save(self):
+        with open(self.path + '.tmp', 'w') as fp:
+            json.dump(self.last_ids, fp)
+        os.replace(self.path + '.tmp', self.path)
+        self._saved_at = time.monotonic()
+
+
+class IngestManifest:
+    def __init__(self, output, save_interval=1.0):
+        self.output = output
+        self.path = os.path.join(output, MANIFEST_JSON)
+        self.save_interval = save_interval
+        self.entries: Dict[str, dict] = {}
+        self._saved_at = 0.0
+        if os.path.isfile(self.path):
+            with open(self.path) as fp:
+                self.entries = json.load(fp)
+
+        self.hashes: Dict[str, str] = {}
+        for e in self.entries.values():
+            self.hashes.setdefault(e['sha256'], e['name'])
+        self.names = set(os.listdir(output)) if os.path.isdir(output) else set()
+        self.names.update(e['name'] for e in self.entries.values())
+
+    def has_id(self, attachment_id) -> bool:
+        return str(attachment_id) in self.entries
+
+    def find_hash(self, digest) -> Optional[str]:
+        return self.hashes.get(digest)
+
+    def reserve_name(self, name) -> str:
+        res = name
+        j = 1
+        while res in self.names:
+            res = f'[{j}] {name}'
+            j += 1
+        self.names.add(res)
+        return res
+
+    def add(self, attachment_id, name, size, digest):
+        self.entries[str(attachment_id)] = {'name': name, 'size': size, 'sha256': digest}
+        self.hashes.setdefault(digest, name)
+        if time.monotonic() - self._saved_at >= self.save_interval:
+            self.save()
+
+    def discard(self, attachment_id):
+        e = self.entries.pop(str(attachment_id), None)
+        if e is not None and self.hashes.get(e['sha256']) == e['name']:
+            del self.hashes[e['sha256']]
+
+    def save(self):
+        with open(self.path + '.tmp', 'w') as fp:
+            json.dump(self.entries, fp)
+        os.replace(self.path + '.tmp', self.path)
+        self._saved_at = time.monotonic()
+
+
+class ChannelScraper:
+    def __init__(self, channel, output, after: Union[datetime, Snowflake, None], checkpoint: Checkpoint,
+                 manifest: IngestManifest, semaphore: asyncio.Semaphore, workers=8, verbose=True):
+        self.channel = channel
+        self.output = output
+        self.after = after
+        self.checkpoint = checkpoint
+        self.manifest = manifest
+        self.semaphore = semaphore
+        self.workers = max(1, workers)
+        self.verbose = verbose
+
+        self.saved = 0
+        self.skipped = 0
+        self.failed = 0
+
+    async def run(self):
+        last_id = self.checkpoint.get(self.channel.id)
+        after = Snowflake(last_id) if last_id is not None else self.after
+        if self.verbose:
+            print(f'Channel {self.channel}: resuming after message {last_id}' if last_id is not None
+                  else f'Channel {self.channel}: scraping from {after}')
+
+        # History isn't read further, while the queue is full, so memory use doesn't grow with channel size
+        queue = asyncio.Queue(maxsize=self.workers)
+        pending = deque()
+        workers = [asyncio.create_task(self._worker(queue, pending)) for _ in range(self.workers)]
+        try:
+            async for msg in self.channel.history(after=after, limit=None, oldest_first=True):
+                attachments = list(self._attachments(msg))
+                # [message id, attachments left, any failed]
+                state = [msg.id, len(attachments), False]
+                pending.append(state)
+                for a, name in attachments:
+                    await queue.put((a, name, state))
+                self._advance(pending)
+            await queue.join()
+        finally:
+            for w in workers:
+                w.cancel()
+            await asyncio.gather(*workers, return_exceptions=True)
+        self._advance(pending)
+        self.checkpoint.save()
+        self.manifest.save()
+
+        if self.verbose:
+            print(f'Channel {self.channel}: saved {self.saved}, duplicates skipped {self.skipped}, '
+                  f'failed {self.failed}')
+        return self.saved
+
+    def _attachments(self, msg):
+        attachments = getattr(msg, 'attachments', None) or []
+        for i, a in enumerate(attachments):
+            ext = a.filename.lower().split(".")[-1]
+            if ext not in SUPPORTED_EXT:
+                continue
+            if self.manifest.has_id(a.id):
+                self.skipped += 1
+                continue
+            if len(attachments) == 1 and msg.content and len(msg.content) > 0:
+                name = f'{msg.content}.{ext}'
+            else:
+                name = f'[{msg.id}00{i}] {a.filename}'
+            yield a, name
+
+    async def _worker(self, queue: asyncio.Queue, pending):
+        while True:
+            a, name, state = await queue.get()
+            try:
+                await self._save(a, name)
+            except Exception:
+                state[2] = True
+            finally:
+                state[1] -= 1
+                queue.task_done()
+            self._advance(pending)
+
+    async def _save(self, attachment, name):
+        async with self.semaphore:
+            try:
+                data = await attachment.read()
+            except Exception as e:
+                self.failed += 1
+                print(f'Failed to download {name}: {e}')
+                raise
+
+        # No awaits from the lookup to manifest.add, so concurrent identical downloads can't both pass
+        digest = hashlib.sha256(data).hexdigest()
+        if self.manifest.has_id(attachment.id):
+            self.skipped += 1
+            return
+        existing = self.manifest.find_hash(digest)
+        if existing is not None:
+            self.manifest.add(attachment.id, existing, len(data), digest)
+            self.skipped += 1
+            return
+
+        name = self.manifest.reserve_name(name)
+        self.manifest.add(attachment.id, name, len(data), digest)
+        try:
+            with open(os.path.join(self.output, name), 'wb') as fp:
+                fp.write(data)
+        except Exception as e:
+            self.manifest.discard(attachment.id)
+            self.failed += 1
+            print(f'Failed to save {name}: {e}')
+            raise
+        self.saved += 1
+
+    def _advance(self, pending):
+        # Checkpoint only moves over messages, all attachments of which are saved
+        while len(pending) > 0 and pending[0][1] == 0:
+            msg_id, _, failed = pending[0]
+            if failed:
+                break
+            pending.popleft()
+            self.checkpoint.set(self.channel.id, msg_id)
+
+
+async def scrape(channels: list, output, after: Union[datetime, Snowflake, None], concurrency=8, resume=True,
+                 verbose=True):
+    os.makedirs(output, exist_ok=True)
+    checkpoint = Checkpoint(output)
+    if not resume:
+        checkpoint.last_ids = {}
+    manifest = IngestManifest(output)
+    semaphore = asyncio.Semaphore(concurrency)
+    scrapers = [ChannelScraper(c, output, after, checkpoint, manifest, semaphore, concurrency, verbose)
+                for c in channels]
+    return await asyncio.gather(*(s.run() for s in scrapers))
+
@@ -0,0 +1,96 @@
+import json
+import re
+from typing import List, Dict, Optional
+
+# Must be kept in sync with "Pack config" in tts_guesswho/global.lua
+CATEGORIES_ALIASES = {
+    'From Title': 'Title',
+}
+
+CAT_OTHER = 'Other'
+CAT_SOURCE = 'Title Source'
+CAT_GENRE = 'Title Genre'
+BOOLEAN_CATEGORIES = {
+    'From Game': CAT_SOURCE,
+    'From Collection-RPG Game': CAT_SOURCE,
+    'From non-Asian Title': CAT_SOURCE,
+    'From non-Asian Animation': CAT_SOURCE,
+    'From Anime/Manga/Ranobe': CAT_SOURCE,
+    'Title Genre - Romance': CAT_GENRE,
+    'Title Genre - Harem-Like': CAT_GENRE,
+}
+
+INDEX_VERSION = 1
+UNIQUE_NAME = 'uniqueName'
+_LINES_RE = re.compile(r'[\n;]+')
+
+
+def properties_to_table(description: Optional[str]) -> Dict[str, object]:
+    # Same as PropertiesToTable in global.lua: value-less lines are boolean (True)
+    res = {}
+    for line in _LINES_RE.split(description or ''):
+        kv = [x for x in line.split(':') if len(x) > 0]
+        if len(kv) == 0:
+            continue
+        res[kv[0]] = kv[1].strip() if len(kv) > 1 else True
+    return res
+
+
+def unique_names(names: List[str]) -> List[str]:
+    # Same as GW_GAME:FixNameCollisions: "A", "A" -> "A (1)", "A (2)"
+    res = list(names)
+    first: Dict[str, int] = {}
+    counters: Dict[str, int] = {}
+    for i, name in enumerate(names):
+        if name not in first:
+            first[name] = i
+            continue
+        if name not in counters:
+            res[first[name]] = f'{name} (1)'
+            counters[name] = 1
+        counters[name] += 1
+        res[i] = f'{name} ({counters[name]})'
+    return res
+
+
+def build_filter_index(contained_objects: List[dict]) -> dict:
+    nicknames = [o.get('Nickname', '') for o in contained_objects]
+    cat_map: Dict[str, Dict[str, List[int]]] = {}
+    filter_order = []
+
+    for idx, o in enumerate(contained_objects):
+        properties = properties_to_table(o.get('Description'))
+        properties.pop(UNIQUE_NAME, None)
+        properties['Name'] = nicknames[idx]
+
+        for k, v in properties.items():
+            k = CATEGORIES_ALIASES.get(k, k)
+            if v is True:
+                cat, f = BOOLEAN_CATEGORIES.get(k, CAT_OTHER), k
+            else:
+                cat, f = k, v
+
+            filters = cat_map.setdefault(cat, {})
+            if f not in filters:
+                filters[f] = []
+                filter_order.append(f)
+            filters[f].append(idx)
+
+    cat_order = sorted(c for c in cat_map if c != 'Name' and c != CAT_OTHER)
+    if 'Name' in cat_map:
+        cat_order.insert(0, 'Name')
+    if CAT_OTHER in cat_map:
+        cat_order.append(CAT_OTHER)
+
+    return {
+        'gw_index': INDEX_VERSION,
+        'n': len(contained_objects),
+        'names': unique_names(nicknames),
+        'cats': cat_order,
+        'map': cat_map,
+        'filters': sorted(filter_order),
+    }
+
+
+def encode_script_state(index: dict) -> str:
+    return json.dumps(index, ensure_ascii=False, separators=(',', ':'))
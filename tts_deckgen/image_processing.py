@@ -1,6 +1,6 @@
 import io
 import random
-from typing import Tuple, Union
+from typing import Tuple, Union, Optional
 
 import PIL.Image
 import requests
@@ -12,9 +12,19 @@ def check_supported_ext(f):
     return f.lower().split('.')[-1] in ['png', 'jpg', 'jpeg']
 
 
-def download_img(img_url) -> PIL.Image.Image:
-    r = requests.get(img_url)
-    return Image.open(io.BytesIO(r.content))
+# Downloaded content by url, long running processes (--serve) fetch default assets only once
+_downloaded = {}
+
+
+def download_img(img_url, cache=True) -> PIL.Image.Image:
+    content = _downloaded.get(img_url) if cache else None
+    if content is None:
+        r = requests.get(img_url)
+        r.raise_for_status()
+        content = r.content
+        if cache:
+            _downloaded[img_url] = content
+    return Image.open(io.BytesIO(content))
 
 
 def round_r(size: Tuple[int, int]):
@@ -31,7 +41,11 @@ def fix_ratio(img: Union[str, Image.Image], ratio=(2, 3), freeze_width=False, fr
         img = img_open.convert('RGBA')
         img_open.close()
 
-    width, height = img.size
+    return img.crop(fix_ratio_box(img.size, ratio, freeze_width, freeze_height))
+
+
+def fix_ratio_box(size: Tuple[int, int], ratio=(2, 3), freeze_width=False, freeze_height=False):
+    width, height = size
 
     if not freeze_height and ratio[0] / ratio[1] > width / height or freeze_width:
         new_height = width * ratio[1] / ratio[0]
@@ -40,7 +54,10 @@ def fix_ratio(img: Union[str, Image.Image], ratio=(2, 3), freeze_width=False, fr
         new_width = height * ratio[0] / ratio[1]
         new_height = height
 
-    return img.crop(find_center((width, height), (new_width, new_height)))
+    # Less than a pixel off is rounding of an already fixed size (e.g. unpacked cards), such sizes are kept
+    if abs(new_width - width) < 1 and abs(new_height - height) < 1:
+        return 0, 0, width, height
+    return find_center((width, height), (new_width, new_height))
 
 
 def find_center(box_size, content_size):
@@ -51,37 +68,43 @@ def find_center(box_size, content_size):
         int((w + cw) / 2), int((h + ch) / 2))
 
 
-def stamp(orig_img: PILImage, stamp_img: PILImage, back_color=(54, 54, 54, 200)):
+def stamp(orig_img: PILImage, stamp_img: PILImage, back_color=(54, 54, 54, 200), rnd: Optional[random.Random] = None):
+    if rnd is None:
+        rnd = random
+
     w = stamp_img.size[0]
     h = w * orig_img.size[1] // orig_img.size[0]
 
     stamp_back = Image.new('RGBA', (w, h), back_color)
-    angle = -random.randint(0, 90)
+    angle = -rnd.randint(0, 90)
     stamp_img = stamp_img.rotate(angle, Image.BICUBIC)
 
     center = find_center(stamp_back.size, stamp_img.size)
     offset_x, offset_y = center[0], center[1]
-    offset_x = random.randint(0, offset_x * 2) - offset_x
-    offset_y = random.randint(0, offset_y * 2) - offset_y
+    offset_x = rnd.randint(0, offset_x * 2) - offset_x
+    offset_y = rnd.randint(0, offset_y * 2) - offset_y
 
     center = (
         center[0] + offset_x, center[1] + offset_y,
         center[2] + offset_x, center[3] + offset_y)
 
     stamp_back.paste(stamp_img, center, stamp_img)
-    stamp_back = stamp_back.resize(orig_img.size, Image.ANTIALIAS)
+    stamp_back = stamp_back.resize(orig_img.size, Image.LANCZOS)
     return Image.alpha_composite(orig_img, stamp_back)
 
 
-def round_frame(img: str, ratio=(2, 3)):
-    with Image.open(img).convert('RGBA') as img:
-        img = fix_ratio(img, ratio)
-        over = Image.new('RGBA', img.size, (255, 255, 255, 0))
-        over_draw = ImageDraw.Draw(over)
-        over_draw.rounded_rectangle(
-            ((0, 0), img.size),
-            round_r(img.size),
-            width=round_w(img.size),
-            fill=(255, 255, 255, 0),
-            outline=(31, 157, 26))
-        return Image.alpha_composite(img, over)
+def round_frame(img: Union[str, Image.Image], ratio=(2, 3)):
+    if isinstance(img, str):
+        with Image.open(img) as img_open:
+            img = img_open.convert('RGBA')
+
+    img = fix_ratio(img, ratio)
+    over = Image.new('RGBA', img.size, (255, 255, 255, 0))
+    over_draw = ImageDraw.Draw(over)
+    over_draw.rounded_rectangle(
+        ((0, 0), img.size),
+        round_r(img.size),
+        width=round_w(img.size),
+        fill=(255, 255, 255, 0),
+        outline=(31, 157, 26))
+    return Image.alpha_composite(img, over)
@@ -0,0 +1,186 @@
+import csv
+import hashlib
+import io
+import json
+import os
+import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from typing import Dict, List, Optional
+from urllib.parse import urlparse, unquote
+
+import requests
+from PIL import Image
+from requests.adapters import HTTPAdapter
+
+from .sources import PicsSource, card_name
+
+CACHE_DIR = '.url_cache'
+
+
+class FetchError(RuntimeError):
+    pass
+
+
+class ManifestEntry:
+    def __init__(self, url: str, nickname: str, properties: Dict[str, str]):
+        self.url = url
+        self.nickname = nickname
+        self.properties = properties
+
+
+def load_manifest(path) -> List[ManifestEntry]:
+    # JSON: [{"url": ..., "nickname": ..., "properties": {...}}, ...]
+    # CSV: "url" and "nickname" columns, other non-empty columns are properties
+    if path.lower().endswith('.json'):
+        with open(path, encoding='utf-8') as fp:
+            rows = json.load(fp)
+        if not isinstance(rows, list):
+            raise ValueError(f'Manifest {path} must be a list of cards')
+    else:
+        with open(path, encoding='utf-8-sig', newline='') as fp:
+            rows = [_csv_row(r) for r in csv.DictReader(fp)]
+
+    res = []
+    for i, row in enumerate(rows):
+        row = {k.lower(): v for k, v in row.items()}
+        url = (row.get('url') or '').strip()
+        if not url:
+            raise ValueError(f'Manifest {path}: no url in row #{i + 1}')
+        nickname = row.get('nickname') or card_name(unquote(os.path.basename(urlparse(url).path)))
+        properties = {k: _property_value(v) for k, v in (row.get('properties') or {}).items()}
+        res.append(ManifestEntry(url, nickname, properties))
+    return res
+
+
+def _csv_row(row: Dict[str, str]):
+    res = {'properties': {}}
+    for k, v in row.items():
+        if k is None or v is None or v == '':
+            continue
+        if k.lower() in ('url', 'nickname'):
+            res[k.lower()] = v
+        else:
+            res['properties'][k] = v
+    return res
+
+
+def _property_value(v):
+    if isinstance(v, bool):
+        return 'true' if v else 'false'
+    return str(v)
+
+
+class UrlFetcher:
+    # Downloads are stored by URL hash, so a URL is never downloaded twice
+    def __init__(self, cache_dir, workers=8, retries=3, backoff=0.5, timeout=30.0, verbose=True):
+        self.cache_dir = cache_dir
+        self.workers = max(1, workers)
+        self.retries = retries
+        self.backoff = backoff
+        self.timeout = timeout
+        self.verbose = verbose
+
+        self.session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=self.workers)
+        self.session.mount('http://', adapter)
+        self.session.mount('https://', adapter)
+
+    def cache_path(self, url):
+        return os.path.join(self.cache_dir, hashlib.sha1(url.encode('utf-8')).hexdigest())
+
+    def fetch_all(self, urls: List[str]):
+        pending = [u for u in dict.fromkeys(urls) if not os.path.isfile(self.cache_path(u))]
+        if len(pending) == 0:
+            return
+        if self.verbose:
+            print(f'Downloading {len(pending)} of {len(urls)} pictures ({len(urls) - len(pending)} cached)')
+        os.makedirs(self.cache_dir, exist_ok=True)
+
+        errors = []
+        with ThreadPoolExecutor(max_workers=self.workers) as executor:
+            futures = {executor.submit(self._fetch_one, u): u for u in pending}
+            for future in as_completed(futures):
+                try:
+                    future.result()
+                except Exception as e:
+                    errors.append(futures[future])
+                    print(f'Failed to download {futures[future]}: {e}')
+
+        if len(errors) > 0:
+            raise FetchError(f'Failed to download {len(errors)} picture(s), run again to resume')
+
+    def _fetch_one(self, url):
+        attempt = 0
+        while True:
+            try:
+                r = self.session.get(url, timeout=self.timeout)
+                if r.status_code >= 500 or r.status_code == 429:
+                    raise FetchError(f'Server error {r.status_code}')
+                r.raise_for_status()
+                break
+            except (FetchError, requests.ConnectionError, requests.Timeout):
+                if attempt >= self.retries:
+                    raise
+                time.sleep(self.backoff * 2 ** attempt)
+                attempt += 1
+
+        # Error pages must not get into the cache
+        Image.open(io.BytesIO(r.content))
+        path = self.cache_path(url)
+        tmp = f'{path}.{os.getpid()}.tmp'
+        with open(tmp, 'wb') as fp:
+            fp.write(r.content)
+        os.replace(tmp, path)
+
+    def close(self):
+        self.session.close()
+
+
+class ManifestSource(PicsSource):
+    def __init__(self, path, cache_dir: Optional[str] = None, workers=8, retries=3):
+        super().__init__(path)
+        self.fetcher = UrlFetcher(cache_dir or os.path.join(os.path.dirname(os.path.abspath(path)), CACHE_DIR),
+                                  workers=workers, retries=retries)
+        self._stat: Optional[tuple] = None
+        self._entries: Dict[str, ManifestEntry] = {}
+        self._order: Dict[str, int] = {}
+
+    def snapshot(self):
+        st = os.stat(self.path)
+        stat = (st.st_mtime_ns, st.st_size)
+        if stat != self._stat:
+            self._entries, self._order = {}, {}
+            for entry in load_manifest(self.path):
+                # Named by URL, so reordered or renamed cards are not processed again
+                name = os.path.basename(self.fetcher.cache_path(entry.url))
+                if name in self._entries:
+                    raise ValueError(f'Duplicate URL in {self.path}: {entry.url}')
+                self._entries[name] = entry
+                self._order[name] = len(self._order)
+            self._stat = stat
+        return {name: (e.url,) for name, e in self._entries.items()}
+
+    def order(self, names):
+        return sorted(names, key=lambda x: self._order[x])
+
+    def prefetch(self, names):
+        self.fetcher.fetch_all([self._entries[n].url for n in names])
+
+    def open(self, name):
+        path = self.fetcher.cache_path(self._entries[name].url)
+        if not os.path.isfile(path):
+            self.fetcher.fetch_all([self._entries[name].url])
+        return open(path, 'rb')
+
+    def is_available(self, name):
+        return os.path.isfile(self.fetcher.cache_path(self._entries[name].url))
+
+    def card_info(self, name):
+        e = self._entries[name]
+        res = {'Nickname': e.nickname}
+        if len(e.properties) > 0:
+            res['Properties'] = dict(e.properties)
+        return res
+
+    def close(self):
+        self.fetcher.close()
@@ -0,0 +1,93 @@
+import json
+from typing import List, Dict, Tuple, Optional
+
+POLICIES = ('overwrite', 'keep', 'union')
+UNION_SEPARATOR = ', '
+
+
+class MergeReport:
+    def __init__(self):
+        self.diffs: Dict[int, List[Tuple[str, Optional[str], str]]] = {}
+        self.unmatched: List[Tuple[str, str]] = []
+        self.conflicts = 0
+
+    def add_diff(self, idx, key, old, new):
+        self.diffs.setdefault(idx, []).append((key, old, new))
+
+    def print(self, cards):
+        for idx in sorted(self.diffs):
+            print(f"[{idx}] {cards[idx].get('Nickname', '')}:")
+            for k, old, new in self.diffs[idx]:
+                print(f'\t{k}: {new}' if old is None else f'\t{k}: {old} -> {new}')
+        for source, nick in self.unmatched:
+            print(f'Not matched: "{nick}" ({source})')
+        print(f'Cards changed: {len(self.diffs)}, conflicts: {self.conflicts}, not matched: {len(self.unmatched)}')
+
+
+def _merge_value(old, new, policy):
+    if policy == 'overwrite':
+        return new
+    if policy == 'keep':
+        return old
+    values = str(old).split(UNION_SEPARATOR)
+    if str(new) in values:
+        return old
+    return UNION_SEPARATOR.join(values + [str(new)])
+
+
+def merge_cards(into: List[dict], sources: List[Tuple[str, List[dict]]], policy='overwrite'):
+    if policy not in POLICIES:
+        raise ValueError(f'Unknown merge policy: {policy}')
+
+    positions: Dict[str, List[int]] = {}
+    for idx, c in enumerate(into):
+        if 'Nickname' in c:
+            positions.setdefault(c['Nickname'], []).append(idx)
+
+    add: Dict[int, dict] = {}
+    report = MergeReport()
+
+    for source_name, src in sources:
+        groups: Dict[str, List[dict]] = {}
+        for c in src:
+            if 'Nickname' not in c or 'Properties' not in c:
+                continue
+            groups.setdefault(c['Nickname'], []).append(c)
+
+        for nick, group in groups.items():
+            targets = positions.get(nick, [])
+            if len(group) == 1:
+                pairs = [(group[0], idx) for idx in targets]
+                if len(targets) == 0:
+                    report.unmatched.append((source_name, nick))
+            else:
+                # Cards sharing a name are matched by their order in the deck
+                pairs = list(zip(group, targets))
+                report.unmatched += [(source_name, nick) for _ in group[len(targets):]]
+
+            for c, idx in pairs:
+                current = into[idx].get('Properties') or {}
+                changes = add.setdefault(idx, {})
+                for k, v in c['Properties'].items():
+                    old = changes.get(k, current.get(k))
+                    if old is None:
+                        new = v
+                    elif old == v:
+                        continue
+                    else:
+                        report.conflicts += 1
+                        new = _merge_value(old, v, policy)
+                        if new == old:
+                            continue
+                    changes[k] = new
+                    report.add_diff(idx, k, old, new)
+
+    return {k: v for k, v in add.items() if len(v) > 0}, report
+
+
+def load_sources(paths: List[str]):
+    res = []
+    for path in paths:
+        with open(path) as fp:
+            res.append((path, json.load(fp)))
+    return res
@@ -0,0 +1,157 @@
+import io
+import os
+import time
+from typing import List, Tuple, Optional
+
+from PIL import Image
+
+from . import deck as d
+from . import image_processing as ip
+from .sources import PicsSource, open_source
+
+FORMATS = {'png': 'PNG', 'jpg': 'JPEG', 'jpeg': 'JPEG'}
+MAX_ERRORS_SHOWN = 10
+HEADER_CHUNK = 16 * 1024
+
+
+class PreflightReport:
+    def __init__(self, path):
+        self.path = path
+        self.names: List[str] = []
+        self.sizes: List[Tuple[int, int]] = []
+        self.skipped: List[str] = []
+        self.remote: List[str] = []
+        self.warnings: List[str] = []
+        self.errors: List[str] = []
+        self.card_size: Optional[Tuple[int, int]] = None
+        self.sheets_sizes: List[Tuple[int, int, int]] = []
+        self.sheets_px: List[Tuple[int, int]] = []
+        self.pictures_bytes = 0
+        self.sheets_bytes = 0
+        self.elapsed = 0.0
+
+    def sheets_info(self):
+        # Same sheets are grouped: 43 x (10x7): 69, (10x4): 33
+        groups = []
+        for s in self.sheets_sizes:
+            if len(groups) > 0 and groups[-1][0] == s:
+                groups[-1][1] += 1
+            else:
+                groups.append([s, 1])
+        return ', '.join(f'{n} x ({w}x{h}): {c}' if n > 1 else f'({w}x{h}): {c}' for (w, h, c), n in groups)
+
+    def print(self):
+        print(f'Preflight of {self.path}: {len(self.names)} pictures, checked in {self.elapsed:.2f}s')
+        if len(self.skipped) > 0:
+            print(f'Skipped, not supported: {", ".join(self.skipped)}')
+        if len(self.remote) > 0:
+            print(f'WARN: {len(self.remote)} pictures are not downloaded yet (remote, size unknown), '
+                  f'card size and memory estimate only account for downloaded ones')
+        for w in self.warnings:
+            print(f'WARN: {w}')
+        if self.card_size is not None:
+            print(f'Card size: {self.card_size[0]}x{self.card_size[1]}')
+        if len(self.sheets_sizes) > 0:
+            print(f'Sheets per deck: {len(self.sheets_sizes)}, {self.sheets_info()}')
+            print(f'Largest sheet: {max(w for w, _ in self.sheets_px)}x{max(h for _, h in self.sheets_px)} px')
+            print(f'Memory estimate: pictures {_mb(self.pictures_bytes)}, sheets {_mb(self.sheets_bytes)}, '
+                  f'total {_mb(self.pictures_bytes + self.sheets_bytes)}')
+        for e in self.errors[:MAX_ERRORS_SHOWN]:
+            print(f'ERROR: {e}')
+        if len(self.errors) > MAX_ERRORS_SHOWN:
+            print(f'ERROR: ... and {len(self.errors) - MAX_ERRORS_SHOWN} more')
+
+    def check(self):
+        if len(self.errors) > 0:
+            raise ValueError(f'Preflight failed with {len(self.errors)} error(s), see above')
+
+
+def _mb(n):
+    return f'{n / 2 ** 20:.0f} MB'
+
+
+def read_header(fp):
+    # Reads from the start of the stream only as much as needed to parse the header,
+    # streams of compressed archives can't seek back cheaply
+    buf = b''
+    chunk = HEADER_CHUNK
+    while True:
+        data = fp.read(chunk)
+        buf += data
+        try:
+            with Image.open(io.BytesIO(buf)) as img:
+                return img.size, img.format
+        except Exception:
+            if len(data) < chunk:
+                raise
+        chunk *= 2
+
+
+def preflight(path, source: Optional[PicsSource] = None, no_rejected=False, maxw=720,
+              sheet_width=d.MAX_SHEET_WIDTH, sheet_height=d.MAX_SHEET_HEIGHT) -> PreflightReport:
+    # Only image headers are read, sizes are computed the same way as by DeckBuilder and Deck.create
+    st = time.perf_counter()
+    report = PreflightReport(path)
+    source = source or open_source(path)
+
+    if os.path.isdir(path):
+        report.skipped = [f for f in sorted(os.listdir(path))
+                          if not ip.check_supported_ext(f) and not f.startswith('.')
+                          and os.path.isfile(os.path.join(path, f))]
+
+    names = source.order(source.snapshot().keys())
+    headers = {}
+    for name in source.read_order(names):
+        if not source.is_available(name):
+            report.remote.append(name)
+            continue
+        try:
+            with source.open_stream(name) as fp:
+                headers[name] = read_header(fp)
+        except Exception as e:
+            headers[name] = e
+
+    fixed = []
+    for name in names:
+        if name not in headers:
+            continue
+        if isinstance(headers[name], Exception):
+            report.errors.append(f'{name}: cannot read image ({headers[name]})')
+            continue
+        size, fmt = headers[name]
+
+        ext = name.lower().split('.')[-1]
+        if ext in FORMATS and FORMATS[ext] != fmt:
+            report.warnings.append(f'{name}: extension doesn\'t match {fmt} format')
+        if size[0] == 0 or size[1] == 0:
+            report.errors.append(f'{name}: empty image')
+            continue
+
+        box = ip.fix_ratio_box(size)
+        report.names.append(name)
+        report.sizes.append(size)
+        fixed.append((box[2] - box[0], box[3] - box[1]))
+
+    # Cached faces, fixed and rejected pictures are kept during the build
+    report.pictures_bytes = sum(w * h * 4 for w, h in fixed) * (2 if no_rejected else 3)
+
+    if len(report.errors) == 0 and len(fixed) > 0:
+        try:
+            report.card_size = d.plan_card_size(fixed, maxw, report.names)
+
+            cards_per_sheet = sheet_width * sheet_height
+            count = len(fixed) + len(report.remote)
+            total = count + len(d.hide_positions(count, cards_per_sheet))
+            gen = d.SheetGenerator(sheet_width, sheet_height, report.card_size, total, None, dry=True)
+            gen.generate(range(total), True)
+            report.sheets_sizes, report.sheets_px = gen.sizes, gen.sheets
+
+            # Grid faces, clean faces and grid backs (unless no rejected)
+            report.sheets_bytes = sum(w * h * 4 for w, h in gen.sheets) * (2 if no_rejected else 3)
+        except ValueError as e:
+            report.errors.append(str(e))
+    elif len(fixed) == 0 and len(report.errors) == 0 and len(report.remote) == 0:
+        report.errors.append('No pictures found')
+
+    report.elapsed = time.perf_counter() - st
+    return report
@@ -1,3 +1,5 @@
+import bisect
+import json
 import os
 import re
 import shutil
@@ -7,6 +9,7 @@ from PIL import Image
 
 from . import deck as d
 from . import image_processing as ip
+from .cards import PropertyTable
 
 KNOWN_SOURCES = ['kantai_collection']
 SUGGEST_PROPERTIES = {
@@ -15,58 +18,108 @@ SUGGEST_PROPERTIES = {
 }
 
 
+TABLE_FORMATS = ('xlsx', 'csv', 'parquet')
+
+
+def _table_format(path):
+    ext = path.lower().split('.')[-1]
+    return ext if ext in TABLE_FORMATS else None
+
+
+def _optional_engine(module, engine):
+    try:
+        __import__(module)
+        return engine
+    except ImportError:
+        return None
+
+
+def _parquet_engine():
+    engine = _optional_engine('pyarrow', 'pyarrow') or _optional_engine('fastparquet', 'fastparquet')
+    if engine is None:
+        raise ValueError('Parquet tables need pyarrow or fastparquet: pip install pyarrow')
+    return engine
+
+
 def export_excel(path, cards):
-    if not path.endswith('.xlsx'):
+    fmt = _table_format(path)
+    if fmt is None:
         path = '.'.join([path, 'xlsx'])
+        fmt = 'xlsx'
 
     df = cards_to_df(cards)
-    df.to_excel(path)
+    if fmt == 'csv':
+        df.to_csv(path)
+    elif fmt == 'parquet':
+        df.astype(str).to_parquet(path, engine=_parquet_engine())
+    else:
+        df.to_excel(path, engine=_optional_engine('xlsxwriter', 'xlsxwriter'))
+    return path
 
 
 def cards_to_df(cards):
-    columns = []
-    for c in cards:
-        if 'Properties' not in c:
-            c['Properties'] = {}
-        for p in c['Properties']:
-            if p not in columns:
-                columns.append(str(p))
-    columns = ['Nickname'] + list(sorted(columns))
-    rows = []
-    for c in cards:
-        if 'Nickname' not in c:
-            c['Nickname'] = ''
-        row = [c['Nickname']]
-        props = c['Properties']
-        for p in columns[1:]:
-            row.append(props[p] if p in props else '')
-        rows.append(row)
-    return pd.DataFrame(data=rows, columns=columns)
+    if isinstance(cards, PropertyTable):
+        columns = {'Nickname': pd.Series(cards.nicknames, dtype=object)}
+        for k in sorted(cards.keys, key=str):
+            columns[str(k)] = pd.Series(cards.column(k), dtype=object)
+        return pd.DataFrame(columns)
+    if len(cards) == 0:
+        return pd.DataFrame({'Nickname': []})
+
+    nicks = pd.Series([c.get('Nickname', '') for c in cards], dtype=object, name='Nickname')
+    props = pd.DataFrame.from_records([c.get('Properties') or {} for c in cards], index=nicks.index)
+    props.columns = props.columns.map(str)
+    props = props.reindex(columns=sorted(props.columns)).astype(object).fillna('')
+    return pd.concat([nicks, props], axis=1)
+
+
+def read_table(path):
+    fmt = _table_format(path)
+    if fmt == 'csv':
+        df = pd.read_csv(path, index_col=0, dtype=str, keep_default_na=False)
+        df.index = df.index.astype(int)
+        return df
+    if fmt == 'parquet':
+        return pd.read_parquet(path, engine=_parquet_engine())
+    return pd.read_excel(path, index_col=0, na_filter=False, engine=_optional_engine('python_calamine', 'calamine'))
 
 
 def import_excel(path, into=None):
-    df = pd.read_excel(path, index_col=0, na_filter=False)
+    df = read_table(path)
     if into is None:
         into = [{} for _ in range(len(df))]
     if len(into) != len(df):
         raise ValueError(f'Table data length isn\'t equal to original data length ({len(df)} != {len(into)})')
 
-    changed_nicks = []
-    for idx, d in df.iterrows():
-        c = into[idx]
-        new_nick = d.iloc[0]
-        if 'Nickname' not in c or c['Nickname'] != new_nick:
-            changed_nicks.append((c['Nickname'], new_nick))
-            c['Nickname'] = new_nick
+    new = df.astype(object)
+    old = cards_to_df(into).reindex(index=new.index)
+
+    # Compared as text: CSV and Parquet tables bring 3 and True back as '3' and 'True', they aren't changes
+    new_nicks, old_nicks = new.iloc[:, 0], old['Nickname']
+    nick_changed = (new_nicks.astype(str).to_numpy() != old_nicks.astype(str).to_numpy())
+    changed_nicks = list(zip(old_nicks[nick_changed], new_nicks[nick_changed]))
+
+    new_props = new.iloc[:, 1:]
+    old_props = old.reindex(columns=new_props.columns, fill_value='')
+    mask = new_props.astype(str).to_numpy() != old_props.astype(str).to_numpy()
+    rows, cols = mask.nonzero()
+    keys = new_props.columns
+    values = new_props.to_numpy()
+    labels = new.index
+
+    for i in nick_changed.nonzero()[0]:
+        into[labels[i]]['Nickname'] = new_nicks.iat[i]
+    for i, j in zip(rows, cols):
+        c = into[labels[i]]
         if 'Properties' not in c:
             c['Properties'] = {}
         props = c['Properties']
-        for k, v in d.iloc[1:].items():
-            if v == '':
-                if k in props:
-                    del props[k]
-                continue
-            props[k] = v
+        k, v = keys[j], values[i, j]
+        if v == '':
+            if k in props:
+                del props[k]
+            continue
+        props[k] = v
 
     return into, changed_nicks
 
@@ -84,10 +137,12 @@ def _rename(old, new, directory):
            os.path.normpath(os.path.join(directory, '.'.join([new, old.split('.')[-1]])))
 
 
-def _normalize_name(raw_name):
+def _normalize_name(raw_name, known_sources=None):
+    if known_sources is None:
+        known_sources = KNOWN_SOURCES
     split = raw_name.split('_and_')
     for i, name in enumerate(split):
-        for x in KNOWN_SOURCES:
+        for x in known_sources:
             if name.endswith(x):
                 name = re.sub(fr'_{re.escape(x)}$', '', name)
         join = ' '.join([f[0].upper() + f[1:] for f in (name.split('_'))])
@@ -116,6 +171,7 @@ class ExpansionLoader:
         self.expansion = None
         self.images_names = None
         self.images = None
+        self.images_keys = None
         self.previous_name = None
         self.cards = d.load_cards_info(deck_path, prefix)
         self.images_path = images_path
@@ -137,7 +193,8 @@ class ExpansionLoader:
 
     def init_expansion(self):
         self.images = norm_sort([f for f in os.listdir(self.images_path) if ip.check_supported_ext(f)])
-        self.images_names = _strip_extensions(self.images)
+        self.images_keys = [f.lower() for f in self.images]
+        self.images_names = set(_strip_extensions(self.images))
         self.expansion = list(os.listdir(self.expansion_path))
         return len(self.expansion)
 
@@ -150,13 +207,15 @@ class ExpansionLoader:
             s = f'{name_no_ext} [{i}]'
             i += 1
 
-        self.images_names.append(s)
+        self.images_names.add(s)
         return '.'.join([s, ext])
 
     def _insert_new(self, name, name_orig):
-        self.images.append(name)
-        self.images = norm_sort(self.images)
-        idx = self.images.index(name)
+        # Same position as norm_sort() would give: after all names with equal key
+        key = name.lower()
+        idx = bisect.bisect_right(self.images_keys, key)
+        self.images_keys.insert(idx, key)
+        self.images.insert(idx, name)
 
         obj = {
             'Nickname': name_orig,
@@ -245,7 +304,7 @@ class ExpansionLoader:
             shutil.copy(img_path, new_path)
         else:
             shutil.move(img_path, new_path)
-        d.save_cards_info(self.cards, self.deck_path, self.prefix)
+        d.insert_card_info(self.cards, idx, self.deck_path, self.prefix)
 
         print(f'{img_path} -> {new_path}')
         print(str(obj))
@@ -256,6 +315,98 @@ class ExpansionLoader:
         return self.idx < len(self.expansion)
 
 
+class ExpansionRules:
+    def __init__(self, names=None, properties=None, danbooru=True, known_sources=None, multiple_names='first',
+                 inherit=True):
+        if isinstance(names, dict):
+            names = [{'pattern': k, 'name': v} for k, v in names.items()]
+        self.names = [(re.compile(r['pattern']), r.get('name'), r.get('properties', {})) for r in names or []]
+        self.properties = properties or {}
+        self.danbooru = danbooru
+        self.known_sources = KNOWN_SOURCES + (known_sources or [])
+        self.multiple_names = multiple_names
+        self.inherit = inherit
+
+        if multiple_names not in ('first', 'join'):
+            raise ValueError(f'Unknown multiple_names value: {multiple_names}')
+
+    @classmethod
+    def load(cls, path):
+        with open(path) as fp:
+            return cls(**json.load(fp))
+
+    def resolve(self, img):
+        name_no_ext = '.'.join(img.split('.')[:-1])
+        for pattern, name, props in self.names:
+            match = pattern.search(name_no_ext)
+            if match:
+                return (match.expand(name) if name else name_no_ext), props
+
+        if self.danbooru:
+            match = re.match(r'__([\w_-]+)_drawn_by_.*', img)
+            if match:
+                name = _normalize_name(match.group(1), self.known_sources)
+                if not isinstance(name, str):
+                    name = name[0] if self.multiple_names == 'first' else ' and '.join(name)
+                return name, {}
+
+        return name_no_ext, {}
+
+
+class BatchExpansionLoader(ExpansionLoader):
+    def __init__(self, deck_path, images_path, expansion_path, rules: ExpansionRules, prefix='grid', copy=False):
+        self.rules = rules
+        self.planned = []
+        super().__init__(deck_path, images_path, expansion_path, prefix, False, copy)
+
+    def init_expansion(self):
+        super().init_expansion()
+        self.expansion = norm_sort([f for f in self.expansion if ip.check_supported_ext(f)])
+        return len(self.expansion)
+
+    def plan(self):
+        for img in self.expansion:
+            name, props = self.rules.resolve(img)
+            name_orig = '.'.join([name, img.split('.')[-1]])
+            unique = self._make_unique(name_orig)
+            idx, obj = self._insert_new(unique, name)
+
+            obj['Properties'].update(self.rules.properties)
+            if self.rules.inherit:
+                self._try_inherit(idx, obj)
+            obj['Properties'].update(props)
+
+            self.planned.append((img, unique, obj))
+        return self.planned
+
+    def report(self):
+        positions = {id(c): i for i, c in enumerate(self.cards)}
+        for img, unique, obj in self.planned:
+            props = ', '.join(f'{k}: {v}' for k, v in obj['Properties'].items())
+            print(f'{img} -> {unique} [{positions[id(obj)]}] {{{props}}}')
+        print(f'Total: {len(self.planned)} images, deck size: {len(self.cards)}')
+
+    def commit(self):
+        for img, unique, _ in self.planned:
+            src = os.path.join(self.expansion_path, img)
+            dst = os.path.join(self.images_path, unique)
+            if self.copy:
+                shutil.copy(src, dst)
+            else:
+                shutil.move(src, dst)
+        d.save_cards_info(self.cards, self.deck_path, self.prefix)
+
+
+def batch_expansion(deck_path, images_path, expansion_path, rules_path, prefix='grid', copy=False, dry_run=False):
+    loader = BatchExpansionLoader(deck_path, images_path, expansion_path, ExpansionRules.load(rules_path),
+                                  prefix, copy)
+    loader.plan()
+    loader.report()
+    if not dry_run:
+        loader.commit()
+    return loader
+
+
 def expansion_loader(deck_path, images_path, expansion_path, prefix='grid', show=True, copy=False):
     editor = ExpansionLoader(deck_path, images_path, expansion_path, prefix, show, copy)
     while editor.has_next():
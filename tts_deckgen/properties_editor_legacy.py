@@ -1,11 +1,14 @@
+import bisect
 import json
 import re
 import traceback
-from typing import List, Dict
+from typing import List, Dict, Set
 
 import pandas as pd
 
-from .deck import DeckSheet, get_from_sheets
+from .card_store import CardStore
+from .cards import json_default, value_key
+from .deck import DeckSheet, get_from_sheets, is_card_store
 
 RESERVED_PROPS = ['name']
 
@@ -14,10 +17,80 @@ class CommandNotFoundError(RuntimeError):
     pass
 
 
-def _print_all(props, cards):
+class PropertyIndex:
+    props: List[dict]
+    index: Dict[str, Dict[object, Set[int]]]
+    empty: Set[int]
+
+    def __init__(self, props: List[dict]):
+        self.props = []
+        self.index = {}
+        self.empty = set()
+        self._signatures: Dict[int, str] = {}
+        for i, p in enumerate(props):
+            self.props.append({})
+            self.update(i, p)
+
+    def update(self, idx, new_props: dict):
+        old_props = self.props[idx]
+        for k, v in old_props.items():
+            if new_props.get(k, _MISSING) != v:
+                self._remove(idx, k, v)
+        for k, v in new_props.items():
+            if old_props.get(k, _MISSING) != v:
+                self.index.setdefault(k, {}).setdefault(value_key(v), set()).add(idx)
+
+        self.props[idx] = new_props
+        self._signatures.pop(idx, None)
+        if len(new_props) == 0:
+            self.empty.add(idx)
+        else:
+            self.empty.discard(idx)
+
+    def cards_with(self, key, value=None) -> Set[int]:
+        values = self.index.get(key, {})
+        if value is not None:
+            return values.get(value_key(value), set())
+        res = set()
+        for cards in values.values():
+            res |= cards
+        return res
+
+    def count(self, key):
+        return sum(len(cards) for cards in self.index.get(key, {}).values())
+
+    def signature(self, idx):
+        sign = self._signatures.get(idx)
+        if sign is None:
+            sign = '\n'.join(sorted([f'\t{k}: {v}' for k, v in self.props[idx].items()]))
+            self._signatures[idx] = sign
+        return sign
+
+    def _remove(self, idx, k, v):
+        values = self.index[k]
+        v = value_key(v)
+        values[v].discard(idx)
+        if len(values[v]) == 0:
+            del values[v]
+            if len(values) == 0:
+                del self.index[k]
+
+
+_MISSING = object()
+
+
+def _next_cyclic(candidates, curr):
+    if len(candidates) == 0:
+        return curr
+    lst = sorted(candidates)
+    pos = bisect.bisect_right(lst, curr)
+    return lst[pos] if pos < len(lst) else lst[0]
+
+
+def _print_all(index: PropertyIndex, cards):
     sign_dict = {}
-    for i, signs in enumerate(props):
-        sign = '\n'.join(sorted([f'\t{k}: {v}' for k, v in signs.items()]))
+    for i in range(len(index.props)):
+        sign = index.signature(i)
         if sign == '':
             sign = '\t(empty)'
         if sign not in sign_dict:
@@ -29,6 +102,20 @@ def _print_all(props, cards):
 
 
 def _confirm_props_modification(set_props, del_props, curr_props, cards):
+    if not print_props_modification(set_props, del_props, curr_props, cards):
+        return False
+
+    print('\nDo You confirm changes? (y/n)')
+
+    ans = input()
+    while ans not in ['yes', 'no', 'y', 'n']:
+        print('yes/no/y/n only')
+        ans = input('')
+
+    return ans.startswith('y')
+
+
+def print_props_modification(set_props, del_props, curr_props, cards):
     if len(set_props) == len(del_props) == 0:
         print('No changes made')
         return False
@@ -61,7 +148,7 @@ def _confirm_props_modification(set_props, del_props, curr_props, cards):
     create_str = []
     alter_str = []
     delete_str = []
-    for res, dct in ((create_str, create), (alter_str, alter)):
+    for res, dct in ((create_str, create), (alter_str, alter), (delete_str, delete)):
         sign_dict = {}
         for i, signs in dct.items():
             sign = '\n'.join(sorted(signs))
@@ -79,14 +166,7 @@ def _confirm_props_modification(set_props, del_props, curr_props, cards):
         print(f'{s}:')
         print('\n'.join(map(lambda x: f'{x[0]}:\n{x[1]}', arr)))
 
-    print('\nDo You confirm changes? (y/n)')
-
-    ans = input()
-    while ans not in ['yes', 'no', 'y', 'n']:
-        print('yes/no/y/n only')
-        ans = input('')
-
-    return ans.startswith('y')
+    return True
 
 
 def _check_prop(k, warn=True):
@@ -123,7 +203,9 @@ def print_help():
           '\trpaste|rpt paste replacing all\n'
           '\texit|q quit program\n'
           '\thelp|h print this help\n'
-          '\tprint print all properties, grouped\n\n')
+          '\tprint print all properties, grouped\n'
+          '\tquery|qr STR: bulk edit, e.g. \'set "NSFW Rating"=Safe where Nickname~"^Hibiki"\' '
+          'or \'del X where Y=true and not Z\'\n\n')
 
 
 class Editor:
@@ -146,10 +228,17 @@ class Editor:
         self.prev_search_val = None
         self.prev_move = 'next'
 
+        self.index = PropertyIndex([self._merge_props(i) for i in range(len(cards))])
+        self.names_index: Dict[str, List[int]] = {}
+        for i, c in enumerate(cards):
+            self.names_index.setdefault(c['Nickname'], []).append(i)
+
     def get_props(self, idx=None):
-        if not idx:
+        if idx is None:
             idx = self.curr
+        return self.index.props[idx].copy()
 
+    def _merge_props(self, idx):
         res = self.orig_props[idx].copy()
         if idx in self.del_props:
             for k in self.del_props[idx]:
@@ -161,20 +250,42 @@ class Editor:
 
         return res
 
+    def _refresh(self, idx=None):
+        if idx is None:
+            idx = self.curr
+        self.index.update(idx, self._merge_props(idx))
+
     def print_curr(self):
         print(f"[{self.curr}] \"{self.get_name()}\"")
         _print_props(self.get_props())
 
-    def set_p(self, k, v):
+    def set_p(self, k, v, idx=None):
+        if idx is None:
+            idx = self.curr
         if len(v) == 0:
             v = 'true'
-        if self.curr in self.del_props and k in self.del_props[self.curr]:
-            self.del_props[self.curr].remove(k)
-            if len(self.del_props[self.curr]) == 0:
-                del self.del_props[self.curr]
-        if self.curr not in self.set_props:
-            self.set_props[self.curr] = {}
-        self.set_props[self.curr][k] = v
+        if idx in self.del_props and k in self.del_props[idx]:
+            self.del_props[idx].remove(k)
+            if len(self.del_props[idx]) == 0:
+                del self.del_props[idx]
+        if idx not in self.set_props:
+            self.set_props[idx] = {}
+        self.set_props[idx][k] = v
+        self._refresh(idx)
+
+    def del_p(self, k, idx=None):
+        if idx is None:
+            idx = self.curr
+        if idx in self.set_props and k in self.set_props[idx]:
+            del self.set_props[idx][k]
+            if len(self.set_props[idx]) == 0:
+                del self.set_props[idx]
+        if k in self.orig_props[idx]:
+            if idx not in self.del_props:
+                self.del_props[idx] = []
+            if k not in self.del_props[idx]:
+                self.del_props[idx].append(k)
+        self._refresh(idx)
 
     def find(self, predicate, curr):
         started = curr
@@ -191,7 +302,7 @@ class Editor:
         self.curr %= len(self.cards)
 
     def print_total(self, key):
-        count = sum(key in self.get_props(i) for i in range(len(self.cards)))
+        count = self.index.count(key)
         if count > 0:
             print(f'That key is used {count} times')
         else:
@@ -230,12 +341,10 @@ class Editor:
     def com_pfind(self, command_input, val, skip_blocks=False):
         name = self.get_name()
 
-        def pd(curr):
-            props = self.get_props(curr)
-            return (not skip_blocks or self.get_name(curr) != name) and \
-                   command_input in props and (True if len(val) == 0 else val == props[command_input])
-
-        found = self.find(pd, self.curr)
+        candidates = self.index.cards_with(command_input, val if len(val) > 0 else None)
+        if skip_blocks:
+            candidates = {i for i in candidates if self.get_name(i) != name}
+        found = _next_cyclic(candidates, self.curr)
         if found == self.curr:
             print('Not found')
         else:
@@ -300,9 +409,9 @@ class Editor:
                 self.curr = int(command_input)
                 self.curr %= len(self.cards)
             else:
-                found = self.find(lambda i: len(self.get_props(i)) == 0, self.curr)
+                found = _next_cyclic(self.index.empty, self.curr)
                 if self.curr == found:
-                    found = self.find(lambda i: len(self.del_props[i]) == len(self.set_props[i]) == 0, self.curr)
+                    found = self.find(lambda i: i not in self.del_props and i not in self.set_props, self.curr)
                 self.curr = found
 
             self.print_curr()
@@ -327,15 +436,7 @@ class Editor:
 
         elif command in ['del', 'd', 'rm']:
             if len(command_input) > 0 and _check_prop(command_input):
-                if self.curr in self.set_props and command_input in self.set_props[self.curr]:
-                    del self.set_props[self.curr][command_input]
-                    if len(self.set_props[self.curr]) == 0:
-                        del self.set_props[self.curr]
-                if command_input not in self.orig_props[self.curr]:
-                    return
-                if self.curr not in self.del_props:
-                    self.del_props[self.curr] = []
-                self.del_props[self.curr].append(command_input)
+                self.del_p(command_input)
 
         elif command in ['copy', 'cp']:
             props = self.get_props()
@@ -348,15 +449,14 @@ class Editor:
                 del self.set_props[self.curr]
             if self.curr in self.del_props:
                 del self.del_props[self.curr]
+            self._refresh()
 
         elif command in ['clra']:
             if self.curr in self.set_props:
                 del self.set_props[self.curr]
-            if self.curr not in self.del_props:
-                self.del_props = self.curr
-            for k in self.get_props():
-                if k not in self.del_props[self.curr]:
-                    self.del_props[self.curr].append(k)
+            self._refresh()
+            for k in list(self.get_props()):
+                self.del_p(k)
 
         elif command in ['paste', 'pt', 'paste-all', 'pta', 'rpt', 'rpaste']:
             replace = command in ['rpt', 'rpaste']
@@ -366,30 +466,29 @@ class Editor:
             self.print_curr()
 
             if to_all:
-                name = self.get_name()
                 started = self.curr
-                first = True
-                while first or started != self.curr:
-                    if first:
-                        first = False
-
-                    found = self.find(lambda i: self.get_name(i) == name, self.curr)
-                    if found != self.curr and found != started:
+                same_name = self.names_index[self.get_name()]
+                pos = bisect.bisect_right(same_name, started)
+                for found in same_name[pos:] + same_name[:pos]:
+                    if found != started:
                         self.curr = found
                         self.paste()
                         self.print_curr()
-                    else:
-                        break
 
             self.repeat_last()
 
         elif command in ['print']:
-            _print_all((self.get_props(i) for i in range(len(self.cards))), self.cards)
+            _print_all(self.index, self.cards)
             if len(self.set_props) > 0 or len(self.del_props) > 0:
                 print('Modified, not saved')
             else:
                 print('Up-to-date with disk')
                 
+        elif command in ['query', 'qr']:
+            from .properties_query import run_queries
+            if len(command_input) > 0:
+                run_queries(self, [command_input])
+
         elif command in ['fnext', 'fn']:
             self.find_next()
 
@@ -436,7 +535,12 @@ def write_changes(file, cards, add, rm):
             for k, v in add[curr].items():
                 cp[k] = v
 
+    if is_card_store(file):
+        with CardStore(file) as store:
+            store.update_properties(add, rm)
+        return
+
     with open(file, 'w') as fp:
-        json.dump(cards, fp, indent=2)
+        json.dump(cards, fp, indent=2, default=json_default)
 
 
@@ -0,0 +1,250 @@
+import re
+from typing import List, Set, Tuple, Optional
+
+from .properties_editor_legacy import Editor, _check_prop
+
+NICKNAME = 'Nickname'
+TOKEN_RE = re.compile(r'\s*(?:"((?:[^"\\]|\\.)*)"|\'((?:[^\'\\]|\\.)*)\'|(!=|!~|[=~,()])|([^\s=~,()!"\']+))')
+KEYWORDS = ('set', 'del', 'delete', 'rm', 'where', 'and', 'or', 'not')
+
+
+class QuerySyntaxError(ValueError):
+    pass
+
+
+class _Token:
+    def __init__(self, value, kind):
+        self.value = value
+        self.kind = kind
+
+    def is_kw(self, *words):
+        return self.kind == 'word' and self.value.lower() in words
+
+    def __repr__(self):
+        return f'{self.kind}:{self.value}'
+
+
+def tokenize(query: str) -> List[_Token]:
+    res = []
+    pos = 0
+    query = query.strip()
+    while pos < len(query):
+        m = TOKEN_RE.match(query, pos)
+        if not m or m.end() == pos:
+            raise QuerySyntaxError(f'Unexpected character at {pos}: {query[pos:]}')
+        dq, sq, op, word = m.groups()
+        if dq is not None or sq is not None:
+            res.append(_Token(re.sub(r'\\(.)', r'\1', dq if dq is not None else sq), 'str'))
+        elif op is not None:
+            res.append(_Token(op, 'op'))
+        else:
+            res.append(_Token(word, 'word'))
+        pos = m.end()
+    return res
+
+
+class Query:
+    action: str
+    assignments: List[Tuple[str, str]]
+    keys: List[str]
+    condition: Optional[tuple]
+
+    def __init__(self, action, assignments, keys, condition):
+        self.action = action
+        self.assignments = assignments
+        self.keys = keys
+        self.condition = condition
+
+    def select(self, editor: Editor) -> Set[int]:
+        if self.condition is None:
+            return set(range(len(editor.cards)))
+        return _evaluate(self.condition, editor)
+
+    def apply(self, editor: Editor) -> Set[int]:
+        matched = self.select(editor)
+        for idx in sorted(matched):
+            if self.action == 'set':
+                for k, v in self.assignments:
+                    if editor.get_props(idx).get(k) != v:
+                        editor.set_p(k, v, idx)
+            else:
+                for k in self.keys:
+                    if k in editor.get_props(idx):
+                        editor.del_p(k, idx)
+        return matched
+
+
+class _Parser:
+    def __init__(self, tokens: List[_Token]):
+        self.tokens = tokens
+        self.pos = 0
+
+    def peek(self) -> Optional[_Token]:
+        return self.tokens[self.pos] if self.pos < len(self.tokens) else None
+
+    def next(self) -> _Token:
+        t = self.peek()
+        if t is None:
+            raise QuerySyntaxError('Unexpected end of query')
+        self.pos += 1
+        return t
+
+    def expect_op(self, op):
+        t = self.next()
+        if t.kind != 'op' or t.value != op:
+            raise QuerySyntaxError(f'Expected "{op}", found "{t.value}"')
+
+    def name(self) -> str:
+        t = self.next()
+        if t.kind == 'op' or t.is_kw(*KEYWORDS):
+            raise QuerySyntaxError(f'Expected property name, found "{t.value}"')
+        return t.value
+
+    def value(self) -> str:
+        t = self.next()
+        if t.kind == 'op':
+            raise QuerySyntaxError(f'Expected value, found "{t.value}"')
+        return t.value
+
+    def parse(self) -> Query:
+        t = self.next()
+        assignments, keys = [], []
+        if t.is_kw('set'):
+            action = 'set'
+            while True:
+                k = self.name()
+                v = 'true'
+                nt = self.peek()
+                if nt is not None and nt.kind == 'op' and nt.value == '=':
+                    self.next()
+                    v = self.value()
+                if not _check_prop(k) or k == NICKNAME:
+                    raise QuerySyntaxError(f'Property "{k}" cannot be set')
+                assignments.append((k, v if len(v) > 0 else 'true'))
+                if not self._comma():
+                    break
+        elif t.is_kw('del', 'delete', 'rm'):
+            action = 'del'
+            while True:
+                keys.append(self.name())
+                if not self._comma():
+                    break
+        else:
+            raise QuerySyntaxError(f'Unknown action "{t.value}", must be set or del')
+
+        condition = None
+        t = self.peek()
+        if t is not None:
+            if not t.is_kw('where'):
+                raise QuerySyntaxError(f'Expected "where", found "{t.value}"')
+            self.next()
+            condition = self.or_expr()
+            if self.peek() is not None:
+                raise QuerySyntaxError(f'Unexpected "{self.peek().value}"')
+
+        return Query(action, assignments, keys, condition)
+
+    def _comma(self):
+        t = self.peek()
+        if t is not None and t.kind == 'op' and t.value == ',':
+            self.next()
+            return True
+        return False
+
+    def or_expr(self):
+        node = self.and_expr()
+        while self.peek() is not None and self.peek().is_kw('or'):
+            self.next()
+            node = ('or', node, self.and_expr())
+        return node
+
+    def and_expr(self):
+        node = self.not_expr()
+        while self.peek() is not None and self.peek().is_kw('and'):
+            self.next()
+            node = ('and', node, self.not_expr())
+        return node
+
+    def not_expr(self):
+        t = self.peek()
+        if t is not None and t.is_kw('not'):
+            self.next()
+            return 'not', self.not_expr()
+        if t is not None and t.kind == 'op' and t.value == '(':
+            self.next()
+            node = self.or_expr()
+            self.expect_op(')')
+            return node
+        return self.comparison()
+
+    def comparison(self):
+        k = self.name()
+        t = self.peek()
+        if t is not None and t.kind == 'op' and t.value in ('=', '!=', '~', '!~'):
+            self.next()
+            v = self.value()
+            if t.value in ('~', '!~'):
+                try:
+                    v = re.compile(v)
+                except re.error as e:
+                    raise QuerySyntaxError(f'Bad regex "{v}": {e}')
+            return t.value, k, v
+        return 'has', k
+
+
+def parse(query: str) -> Query:
+    return _Parser(tokenize(query)).parse()
+
+
+def _value_str(v):
+    # Booleans from JSON are compared as they are shown in the card description
+    if isinstance(v, bool):
+        return 'true' if v else 'false'
+    return str(v)
+
+
+def _values_map(editor: Editor, key):
+    if key == NICKNAME:
+        return editor.names_index
+    return editor.index.index.get(key, {})
+
+
+def _evaluate(node, editor: Editor) -> Set[int]:
+    op = node[0]
+    if op == 'and':
+        return _evaluate(node[1], editor) & _evaluate(node[2], editor)
+    if op == 'or':
+        return _evaluate(node[1], editor) | _evaluate(node[2], editor)
+    if op == 'not':
+        return set(range(len(editor.cards))) - _evaluate(node[1], editor)
+
+    key = node[1]
+    values = _values_map(editor, key)
+    if op == 'has':
+        if key == NICKNAME:
+            return set(range(len(editor.cards)))
+        return editor.index.cards_with(key)
+
+    # Conditions are checked once per distinct value, not per card
+    res = set()
+    if op in ('=', '!='):
+        for v, cards in values.items():
+            if _value_str(v) == node[2]:
+                res |= set(cards)
+    else:
+        for v, cards in values.items():
+            if node[2].search(_value_str(v)):
+                res |= set(cards)
+
+    if op in ('!=', '!~'):
+        res = set(range(len(editor.cards))) - res
+    return res
+
+
+def run_queries(editor: Editor, queries: List[str]):
+    total = set()
+    for q in queries:
+        matched = parse(q).apply(editor)
+        print(f'{q}: {len(matched)} card(s) matched')
+        total |= matched
+    return total
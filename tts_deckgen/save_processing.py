@@ -1,10 +1,11 @@
 import json
 import os.path
 import random
-import shutil
 from typing import Optional, List, Tuple, Union
 
 from . import save_data as data
+from . import filter_index as fi
+from .backup import backup_save, DEFAULT_KEEP
 from .deck import Deck, DeckSheet
 
 
@@ -15,6 +16,105 @@ def to_file_path(path):
     return 'file:///' + path
 
 
+def card_description(properties: dict):
+    return '\n'.join(
+        map(lambda x: f'{x[0]}: {x[1]}' if x[1] != "true" else f'{x[0]}',
+            filter(lambda x: x[1] != "false", properties.items())))
+
+
+def build_deck_content(decks, reference_custom_deck: str, reference_contained_object: str,
+                       custom_decks_start: int, generate_guid):
+    custom_decks = {}
+    deck_ids = []
+    contained_objects = []
+
+    for deck_idx, deck in enumerate(decks):
+        saved_sheets, cards_info = deck if not isinstance(deck, Deck) else (deck.saved_sheets, deck.cards_info)
+        if saved_sheets is None:
+            print(f'WARN: Deck #{deck_idx} not saved!')
+            continue
+
+        start = len(deck_ids)
+
+        for sheet in saved_sheets:
+            sheet_idx = len(custom_decks) + 1 + custom_decks_start
+
+            custom_deck = json.loads(reference_custom_deck)
+            custom_deck['FaceURL'] = to_file_path(sheet.face_path)
+            custom_deck['BackURL'] = to_file_path(sheet.back_path)
+            custom_deck['NumWidth'] = sheet.size[0]
+            custom_deck['NumHeight'] = sheet.size[1]
+            custom_deck['BackIsHidden'] = sheet.back_is_hidden
+            custom_deck['UniqueBack'] = sheet.unique_back
+            custom_decks[str(sheet_idx)] = custom_deck
+
+            deck_ids += [sheet_idx * 100 + i for i in range(sheet.size[2])]
+
+        for i, inf in enumerate(cards_info):
+            obj = json.loads(reference_contained_object)
+            for k, v in inf.items():
+                if k == 'Properties':
+                    obj['Description'] = card_description(v)
+                else:
+                    obj[k] = v
+
+            card_id = deck_ids[start + i]
+            obj['CardID'] = card_id
+
+            obj['GUID'] = generate_guid()
+            contained_objects.append(obj)
+
+    return custom_decks, deck_ids, contained_objects
+
+
+def export_saved_object(path, *decks: Union[Deck, Tuple[List[DeckSheet], List[dict]]],
+                        nickname: Optional[str] = None, spacing=3.0, filter_index=True):
+    guids = set()
+
+    def generate_guid():
+        guid = ''
+        while guid == '' or guid in guids:
+            guid = f'{random.randint(0, 0xffffff):06x}'
+        guids.add(guid)
+        return guid
+
+    if nickname is None:
+        nickname = os.path.splitext(os.path.basename(path))[0]
+
+    res = json.loads(data.saved_object)
+    res['SaveName'] = nickname
+    custom_decks_start = 0
+
+    for i, deck in enumerate(decks):
+        custom_decks, deck_ids, contained_objects = build_deck_content(
+            (deck,), data.custom_deck_entry, data.contained_object, custom_decks_start, generate_guid)
+        custom_decks_start += len(custom_decks)
+
+        deck_obj = json.loads(data.deck_custom)
+        deck_obj['GUID'] = generate_guid()
+        deck_obj['Nickname'] = nickname if len(decks) == 1 else f'{nickname} #{i + 1}'
+        deck_obj['Locked'] = False
+        deck_obj['Transform'].update({'posX': i * spacing, 'posY': 1.0, 'posZ': 0.0, 'rotX': 0.0, 'rotY': 180.0})
+        deck_obj['CustomDeck'] = custom_decks
+        deck_obj['DeckIDs'] = deck_ids
+        deck_obj['ContainedObjects'] = contained_objects
+        if filter_index:
+            deck_obj['LuaScriptState'] = fi.encode_script_state(fi.build_filter_index(contained_objects))
+        res['ObjectStates'].append(deck_obj)
+
+    with open(path, 'w') as fout:
+        json.dump(res, fout, indent=2)
+    return res
+
+
+def check_pairs(grid: List[dict], hand: List[dict]):
+    if len(grid) != len(hand):
+        raise ValueError(f'Paired decks size not equal: {len(grid)} != {len(hand)}')
+    for i, (a, b) in enumerate(zip(grid, hand)):
+        if a.get('Nickname') != b.get('Nickname'):
+            raise ValueError(f'Paired decks differ at card #{i}: "{a.get("Nickname")}" != "{b.get("Nickname")}"')
+
+
 class SaveProcessor:
     deck_obj: dict
     save_obj: dict
@@ -23,8 +123,10 @@ class SaveProcessor:
     reference_contained_object: Optional[str]
     reference_custom_deck: Optional[str]
 
-    def __init__(self, save_path, verbose=True):
+    def __init__(self, save_path, verbose=True, backup_keep=DEFAULT_KEEP, filter_index=True):
         self.verbose = verbose
+        self.backup_keep = backup_keep
+        self.filter_index = filter_index
         if verbose:
             print('Reading save...')
 
@@ -49,6 +151,51 @@ class SaveProcessor:
         self._find_custom_decks()
 
     def set_object(self, obj_guid, use_stored_data=True, append_content=False):
+        self.deck_obj, self.referenced, self.save_props = self._prepare_object(obj_guid, use_stored_data,
+                                                                               append_content)
+        self.obj_guid = obj_guid
+
+    def write_decks(self, *decks: Union[Deck, Tuple[List[DeckSheet], List[dict]]]):
+        if self.verbose:
+            print('Generating data...')
+
+        self._fill_object(self.deck_obj, decks)
+        if self.filter_index:
+            self._set_state(self.deck_obj, self.obj_guid, self._build_filter_index(self.deck_obj))
+
+        self._place_object(self.obj_guid, self.deck_obj, self.referenced, self.save_props)
+        self._write_save()
+
+    def write_paired_decks(self, guids: Tuple[str, str],
+                           decks: Tuple[Union[Deck, Tuple[List[DeckSheet], List[dict]]], ...],
+                           use_stored_data=True, append_content=False):
+        if len(guids) != 2 or len(decks) != 2:
+            raise ValueError('Exactly two GUIDs and two decks must be paired')
+        if guids[0] == guids[1]:
+            raise ValueError(f'Cannot pair deck {guids[0]} with itself')
+
+        objs = [self._prepare_object(guid, use_stored_data, append_content) for guid in guids]
+
+        if self.verbose:
+            print('Generating data...')
+        for (deck_obj, _, _), deck in zip(objs, decks):
+            self._fill_object(deck_obj, (deck,))
+
+        contents = [deck_obj['ContainedObjects'] for deck_obj, _, _ in objs]
+        check_pairs(*contents)
+
+        for i, (deck_obj, referenced, save_props) in enumerate(objs):
+            state = self._build_filter_index(deck_obj) if self.filter_index else {}
+            state['pairs'] = {
+                'deck': guids[1 - i],
+                'cards': {a['GUID']: b['GUID'] for a, b in zip(contents[i], contents[1 - i])},
+            }
+            self._set_state(deck_obj, guids[i], state)
+            self._place_object(guids[i], deck_obj, referenced, save_props)
+
+        self._write_save()
+
+    def _prepare_object(self, obj_guid, use_stored_data, append_content):
         objects = self.save_obj['ObjectStates']
         for o in objects:
             if o['GUID'] == obj_guid:
@@ -77,85 +224,40 @@ class SaveProcessor:
         if self.reference_contained_object is None:
             self.reference_contained_object = data.contained_object
 
-        self.obj_guid = obj_guid
-
         if not use_stored_data or append_content:
             if not append_content:
                 deck_obj['CustomDeck'] = {}
                 deck_obj['DeckIDs'] = []
                 deck_obj['ContainedObjects'] = []
-            self.deck_obj = deck_obj
-            self.referenced = True
+            return deck_obj, True, {}
         else:
-            self.save_props = {'Transform': deck_obj['Transform']}
-            self.deck_obj = json.loads(data.deck_custom)
+            return json.loads(data.deck_custom), False, {'Transform': deck_obj['Transform']}
 
-    def write_decks(self, *decks: Union[Deck, Tuple[List[DeckSheet], List[dict]]]):
-        custom_decks = {}
-        deck_ids = []
-        contained_objects = []
+    def _fill_object(self, deck_obj, decks):
+        custom_decks, deck_ids, contained_objects = build_deck_content(
+            decks, self.reference_custom_deck, self.reference_contained_object,
+            self.custom_decks_start, self._generate_guid)
+        self.custom_decks_start += len(custom_decks)
 
-        if self.verbose:
-            print('Generating data...')
+        deck_obj['CustomDeck'].update(custom_decks)
+        deck_obj['DeckIDs'] += deck_ids
+        deck_obj['ContainedObjects'] += contained_objects
 
-        for deck_idx, deck in enumerate(decks):
-            saved_sheets, cards_info = deck if not isinstance(deck, Deck) else (deck.saved_sheets, deck.cards_info)
-            if saved_sheets is None:
-                print(f'WARN: Deck #{deck_idx} not saved!')
-                continue
-
-            start = len(deck_ids)
-
-            for sheet in saved_sheets:
-                sheet_idx = len(custom_decks) + 1 + self.custom_decks_start
-
-                custom_deck = json.loads(self.reference_custom_deck)
-                custom_deck['FaceURL'] = to_file_path(sheet.face_path)
-                custom_deck['BackURL'] = to_file_path(sheet.back_path)
-                custom_deck['NumWidth'] = sheet.size[0]
-                custom_deck['NumHeight'] = sheet.size[1]
-                custom_deck['BackIsHidden'] = sheet.back_is_hidden
-                custom_deck['UniqueBack'] = sheet.unique_back
-                custom_decks[str(sheet_idx)] = custom_deck
-
-                deck_ids += [sheet_idx * 100 + i for i in range(sheet.size[2])]
-
-            for i, inf in enumerate(cards_info):
-                obj = json.loads(self.reference_contained_object)
-                for k, v in inf.items():
-                    if k == 'Properties':
-                        obj['Description'] = '\n'.join(
-                            map(lambda x: f'{x[0]}: {x[1]}' if x[1] != "true" else f'{x[0]}',
-                                filter(lambda x: x[1] != "false", v.items())))
-                    else:
-                        obj[k] = v
-
-                card_id = deck_ids[start + i]
-                obj['CardID'] = card_id
-
-                obj['GUID'] = self._generate_guid()
-                contained_objects.append(obj)
-
-        self.deck_obj['CustomDeck'].update(custom_decks)
-        self.deck_obj['DeckIDs'] += deck_ids
-        self.deck_obj['ContainedObjects'] += contained_objects
-
-        if not self.referenced:
-            self.deck_obj['GUID'] = self.obj_guid
+    def _place_object(self, obj_guid, deck_obj, referenced, save_props):
+        if not referenced:
+            deck_obj['GUID'] = obj_guid
             for i, o in enumerate(self.save_obj['ObjectStates']):
-                if o['GUID'] == self.obj_guid:
-                    self.deck_obj.update(self.save_props)
-                    self.save_obj['ObjectStates'][i] = self.deck_obj
+                if o['GUID'] == obj_guid:
+                    deck_obj.update(save_props)
+                    self.save_obj['ObjectStates'][i] = deck_obj
                     break
 
+    def _write_save(self):
         if self.verbose:
             print('Backing up save...')
-        filedir, filename = os.path.split(self.save_path)
-        first_bak_path = os.path.join(filedir, filename + '.ttsdg.bak')
-        if not os.path.exists(first_bak_path):
-            shutil.copy(self.save_path, first_bak_path)
-        else:
-            shutil.copy(self.save_path, os.path.join(filedir, filename + '.bak'))
+        gen = backup_save(self.save_path, self.backup_keep)
+        if self.verbose:
+            print(f'Backup: {gen}')
         os.remove(self.save_path)
 
         if self.verbose:
@@ -163,6 +265,17 @@ class SaveProcessor:
         with open(self.save_path, 'w') as fout:
             json.dump(self.save_obj, fout, indent=4)
 
+    def _build_filter_index(self, deck_obj):
+        if self.verbose:
+            print('Building filter index...')
+        return fi.build_filter_index(deck_obj['ContainedObjects'])
+
+    def _set_state(self, deck_obj, obj_guid, state: dict):
+        if deck_obj.get('LuaScript'):
+            print(f'WARN: Deck {obj_guid} has own script, script state is not written')
+            return
+        deck_obj['LuaScriptState'] = fi.encode_script_state(state)
+
     def _collect_guids(self):
         self._foreach_object(lambda o: self.guids.add(o['GUID']), lambda o: 'GUID' in o)
         if self.verbose:
@@ -197,3 +310,14 @@ class SaveProcessor:
                 func(o)
             if 'ContainedObjects' in o:
                 self._foreach_object(func, condition, o['ContainedObjects'])
+
+
+def patch_save(game_save, guids: List[str], decks: List[Union[Deck, Tuple[List[DeckSheet], List[dict]]]],
+               append_content=False, pairing=True, filter_index=True, backup_keep=DEFAULT_KEEP, verbose=True):
+    p = SaveProcessor(game_save, verbose=verbose, backup_keep=backup_keep, filter_index=filter_index)
+    if pairing and len(guids) == 2 and len(decks) == 2:
+        p.write_paired_decks(guids, decks, append_content=append_content)
+        return
+    for guid, deck in zip(guids, decks):
+        p.set_object(guid, append_content=append_content)
+        p.write_decks(deck)
@@ -0,0 +1,367 @@
+import json
+import os
+import hmac
+import queue
+import secrets
+import socketserver
+import threading
+import time
+import uuid
+from collections import OrderedDict
+from contextlib import contextmanager
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Optional, List, Dict, Tuple
+from urllib.parse import urlparse, parse_qs
+
+from . import deck as d
+from . import merge as mg
+from . import properties_editor as pe
+from . import properties_editor_legacy as pel
+from . import save_processing as sp
+from .backup import DEFAULT_KEEP
+from .builder import DeckBuilder
+from .cards import PropertyTable
+from .sources import is_source
+
+STATUS_QUEUED = 'queued'
+STATUS_RUNNING = 'running'
+STATUS_DONE = 'done'
+STATUS_FAILED = 'failed'
+
+MAX_WAIT = 300
+
+# Builders hold processed full resolution pictures, so only a few recently used ones are kept
+MAX_BUILDERS = 4
+BUILDER_TTL = 30 * 60
+# Finished jobs are forgotten after a while
+MAX_FINISHED_JOBS = 500
+JOB_TTL = 60 * 60
+
+
+class Job:
+    def __init__(self, op: str, params: dict):
+        self.id = uuid.uuid4().hex[:12]
+        self.op = op
+        self.params = params
+        self.status = STATUS_QUEUED
+        self.result = None
+        self.error: Optional[str] = None
+        self.created = time.time()
+        self.started: Optional[float] = None
+        self.finished: Optional[float] = None
+        self.done = threading.Event()
+
+    def to_dict(self):
+        return {
+            'id': self.id,
+            'op': self.op,
+            'status': self.status,
+            'result': self.result,
+            'error': self.error,
+            'created': self.created,
+            'started': self.started,
+            'finished': self.finished,
+        }
+
+
+class DeckService:
+    jobs: Dict[str, Job]
+    builders: 'OrderedDict[tuple, Tuple[DeckBuilder, float]]'
+
+    def __init__(self, workers=2, backup_keep=DEFAULT_KEEP, max_builders=MAX_BUILDERS, builder_ttl=BUILDER_TTL,
+                 max_finished_jobs=MAX_FINISHED_JOBS, job_ttl=JOB_TTL):
+        self.backup_keep = backup_keep
+        self.max_builders = max_builders
+        self.builder_ttl = builder_ttl
+        self.max_finished_jobs = max_finished_jobs
+        self.job_ttl = job_ttl
+        self.jobs = {}
+        # Builders stay alive between jobs, so a rebuild only processes changed pictures.
+        # Least recently used first, with time of last use
+        self.builders = OrderedDict()
+        self._queue = queue.Queue()
+        self._lock = threading.Lock()
+        # Path -> [lock, number of jobs holding or waiting for it]
+        self._path_locks: Dict[str, list] = {}
+        self._ops = {
+            'build': self._build,
+            'patch': self._patch,
+            'export_excel': self._export_excel,
+            'import_excel': self._import_excel,
+            'merge': self._merge,
+        }
+        self._workers = [threading.Thread(target=self._work, daemon=True) for _ in range(max(1, workers))]
+        for w in self._workers:
+            w.start()
+
+    @property
+    def ops(self):
+        return sorted(self._ops.keys())
+
+    def submit(self, op: str, params: Optional[dict] = None) -> Job:
+        if op not in self._ops:
+            raise ValueError(f'Unknown operation: {op}. Supported: {", ".join(self.ops)}')
+        job = Job(op, params or {})
+        with self._lock:
+            self._prune_jobs()
+            self.jobs[job.id] = job
+        self._queue.put(job)
+        return job
+
+    def get(self, job_id) -> Optional[Job]:
+        with self._lock:
+            return self.jobs.get(job_id)
+
+    def list(self) -> List[Job]:
+        with self._lock:
+            return sorted(self.jobs.values(), key=lambda j: j.created)
+
+    def wait(self, job_id, timeout=None) -> Optional[Job]:
+        job = self.get(job_id)
+        if job is not None:
+            job.done.wait(timeout)
+        return job
+
+    def _work(self):
+        while True:
+            job = self._queue.get()
+            job.status = STATUS_RUNNING
+            job.started = time.time()
+            try:
+                job.result = self._ops[job.op](**job.params)
+                job.status = STATUS_DONE
+            except Exception as e:
+                job.error = f'{type(e).__name__}: {e}'
+                job.status = STATUS_FAILED
+            job.finished = time.time()
+            print(f'Job {job.id} ({job.op}): {job.status} in {job.finished - job.started:.2f}s')
+            job.done.set()
+
+    def _prune_jobs(self):
+        now = time.time()
+        finished = sorted((j for j in self.jobs.values() if j.finished is not None), key=lambda j: j.finished)
+        extra = len(finished) - self.max_finished_jobs
+        for i, j in enumerate(finished):
+            if i < extra or now - j.finished > self.job_ttl:
+                del self.jobs[j.id]
+
+    def _prune_builders(self):
+        now = time.time()
+        for key, (_, used) in list(self.builders.items()):
+            if len(self.builders) > self.max_builders or now - used > self.builder_ttl:
+                del self.builders[key]
+
+    @contextmanager
+    def _path_lock(self, path):
+        # Jobs touching the same deck dir or save are run one after another.
+        # Lock is dropped when no job needs it, so paths don't pile up in a long running service
+        path = os.path.abspath(path)
+        with self._lock:
+            entry = self._path_locks.setdefault(path, [threading.Lock(), 0])
+            entry[1] += 1
+        try:
+            with entry[0]:
+                yield
+        finally:
+            with self._lock:
+                entry[1] -= 1
+                if entry[1] == 0:
+                    del self._path_locks[path]
+
+    def _builder(self, pics_dir, output_dir, no_rejected, bg_color, hashed_names, lod) -> DeckBuilder:
+        key = (os.path.abspath(pics_dir), os.path.abspath(output_dir), no_rejected, bg_color, hashed_names,
+               tuple(lod or []))
+        with self._lock:
+            builder, _ = self.builders.pop(key, (None, None))
+            if builder is None:
+                builder = DeckBuilder(pics_dir, output_dir, no_rejected=no_rejected, bg_color=bg_color,
+                                      hashed_names=hashed_names, lod=lod)
+            self.builders[key] = (builder, time.time())
+            self._prune_builders()
+        return builder
+
+    def _patch_save(self, game_save, guids, decks, append=False, pairing=True, filter_index=True):
+        if not os.path.isfile(game_save):
+            raise ValueError(f'Game save not found: {game_save}')
+        with self._path_lock(game_save):
+            sp.patch_save(game_save, guids, decks, append_content=append, pairing=pairing,
+                          filter_index=filter_index, backup_keep=self.backup_keep)
+
+    def _build(self, pics_dir, output='output', no_rejected=False, bg_color='FFFFFF', hashed_names=False,
+               lod: Optional[List[int]] = None, game_save=None, guids: Optional[List[str]] = None,
+               export_object=None, append=False, pairing=True, filter_index=True):
+        if not is_source(pics_dir):
+            raise ValueError(f'Pictures dir, archive or manifest not found: {pics_dir}')
+        if game_save and not guids:
+            raise ValueError('guids must be set with game_save')
+
+        builder = self._builder(pics_dir, output, no_rejected, bg_color, hashed_names, lod)
+        with self._path_lock(output):
+            grid, clean = builder.build()
+
+        if export_object:
+            sp.export_saved_object(export_object, grid, clean, filter_index=filter_index)
+        if game_save:
+            self._patch_save(game_save, guids[:2], [grid, clean], append, pairing, filter_index)
+
+        return {'cards': len(grid.cards_info), 'grid': grid.sheets_info(), 'clean': clean.sheets_info()}
+
+    def _patch(self, deck_dir, game_save, guids: List[str], prefixes: Optional[List[str]] = None, append=False,
+               pairing=True, filter_index=True):
+        prefixes = prefixes or ['grid', 'clean']
+        decks: List[Tuple[List[d.DeckSheet], List[dict]]] = []
+        with self._path_lock(deck_dir):
+            for i in range(len(guids)):
+                prefix = prefixes[i if len(prefixes) > i else 0]
+                decks.append((d.DeckSheet.load(deck_dir, prefix), d.load_cards_info(deck_dir, prefix)))
+
+        self._patch_save(game_save, guids, decks, append, pairing, filter_index)
+        return {'decks': len(decks), 'cards': [len(cards) for _, cards in decks]}
+
+    def _export_excel(self, deck_dir, path, prefix='grid'):
+        with self._path_lock(deck_dir):
+            cards = d.load_cards_info(deck_dir, prefix)
+        pe.export_excel(path, PropertyTable.from_cards(cards))
+        return {'cards': len(cards), 'path': path}
+
+    def _import_excel(self, deck_dir, path, prefix='grid', allow_renames=False):
+        with self._path_lock(deck_dir):
+            cards = d.load_cards_info(deck_dir, prefix)
+            _, ch = pe.import_excel(path, cards)
+            # No one to confirm renames interactively, so they must be allowed explicitly
+            if len(ch) > 0 and not allow_renames:
+                raise ValueError(f'Some names would be changed ({len(ch)}), set allow_renames to import anyway')
+            d.save_cards_info(cards, deck_dir, prefix)
+        return {'cards': len(cards), 'renamed': [list(x) for x in ch]}
+
+    def _merge(self, deck_dir, sources: List[str], prefix='grid', policy='overwrite', dry_run=False):
+        for fp in sources:
+            if not os.path.isfile(fp):
+                raise ValueError(f'Merge source {fp} is not a file. Must be a cards info JSON.')
+        with self._path_lock(deck_dir):
+            cards = d.load_cards_info(deck_dir, prefix)
+            add, report = mg.merge_cards(cards, mg.load_sources(sources), policy)
+            if not dry_run and len(add) > 0:
+                pel.write_changes(d.cards_info_path(deck_dir, prefix), cards, add, {})
+        return {'changed': len(report.diffs), 'conflicts': report.conflicts,
+                'unmatched': [{'source': s, 'nickname': n} for s, n in report.unmatched]}
+
+
+def _make_handler(service: DeckService, token: Optional[str] = None, hosts: Tuple[str, ...] = ()):
+    # Web pages can't submit jobs: requests of browsers carry Origin, DNS rebinding gives a foreign Host,
+    # and a cross-origin form can't send JSON or the token
+    origins = tuple(f'http://{h}' for h in hosts)
+
+    class Handler(BaseHTTPRequestHandler):
+        def do_GET(self):
+            if not self._check_access():
+                return
+            url = urlparse(self.path)
+            parts = [x for x in url.path.split('/') if x]
+            if parts == ['health']:
+                return self._reply(200, {'status': 'ok', 'ops': service.ops, 'builders': len(service.builders)})
+            if parts == ['jobs']:
+                return self._reply(200, [j.to_dict() for j in service.list()])
+            if len(parts) == 2 and parts[0] == 'jobs':
+                wait = parse_qs(url.query).get('wait')
+                try:
+                    timeout = min(float(wait[0]), MAX_WAIT) if wait else 0
+                except ValueError:
+                    return self._reply(400, {'error': 'wait must be a number of seconds'})
+                job = service.wait(parts[1], timeout) if timeout > 0 else service.get(parts[1])
+                if job is None:
+                    return self._reply(404, {'error': f'Job not found: {parts[1]}'})
+                return self._reply(200, job.to_dict())
+            self._reply(404, {'error': f'Not found: {url.path}'})
+
+        def do_POST(self):
+            if not self._check_access():
+                return
+            if self.headers.get('Content-Type', '').split(';')[0].strip().lower() != 'application/json':
+                return self._reply(415, {'error': 'Content-Type must be application/json'})
+            if urlparse(self.path).path.rstrip('/') != '/jobs':
+                return self._reply(404, {'error': f'Not found: {self.path}'})
+            try:
+                length = int(self.headers.get('Content-Length') or 0)
+                body = json.loads(self.rfile.read(length) or b'{}')
+                if not isinstance(body, dict) or not isinstance(body.get('params', {}), dict):
+                    raise ValueError('Body must be an object: {"op": ..., "params": {...}}')
+                job = service.submit(body.get('op'), body.get('params'))
+            except ValueError as e:
+                return self._reply(400, {'error': str(e)})
+            self._reply(202, job.to_dict())
+
+        def _check_access(self):
+            origin = self.headers.get('Origin')
+            if origin is not None and origin not in origins:
+                self._reply(403, {'error': f'Origin not allowed: {origin}'})
+                return False
+            if len(hosts) > 0 and self.headers.get('Host') not in hosts:
+                self._reply(403, {'error': f'Host not allowed: {self.headers.get("Host")}'})
+                return False
+            if token is not None:
+                auth = self.headers.get('Authorization', '')
+                if not hmac.compare_digest(auth.encode(), f'Bearer {token}'.encode()):
+                    self._reply(401, {'error': 'Missing or wrong token, use "Authorization: Bearer TOKEN" header'})
+                    return False
+            return True
+
+        def _reply(self, code, data):
+            buf = json.dumps(data, ensure_ascii=False).encode('utf-8')
+            self.send_response(code)
+            self.send_header('Content-Type', 'application/json; charset=utf-8')
+            self.send_header('Content-Length', str(len(buf)))
+            self.end_headers()
+            self.wfile.write(buf)
+
+        def address_string(self):
+            # Unix socket clients have no (host, port) address
+            return self.client_address[0] if isinstance(self.client_address, tuple) else 'unix'
+
+        def log_message(self, format, *args):
+            print(f'{self.address_string()} - {format % args}')
+
+    return Handler
+
+
+class _UnixHTTPServer(socketserver.ThreadingMixIn, socketserver.UnixStreamServer):
+    daemon_threads = True
+
+
+def make_server(service: DeckService, port=8765, socket_path=None, token: Optional[str] = None):
+    # Returns the server and the token clients must send (None for unix socket)
+    if socket_path:
+        if os.path.exists(socket_path):
+            os.remove(socket_path)
+        # Access is limited by socket file permissions, no token needed.
+        # Socket is created owner-only, there is no moment it is open to others
+        umask = os.umask(0o177)
+        try:
+            server = _UnixHTTPServer(socket_path, _make_handler(service))
+        finally:
+            os.umask(umask)
+        return server, None
+
+    token = token or secrets.token_urlsafe(24)
+    server = ThreadingHTTPServer(('127.0.0.1', port), None)
+    port = server.server_address[1]
+    server.RequestHandlerClass = _make_handler(service, token, (f'127.0.0.1:{port}', f'localhost:{port}'))
+    return server, token
+
+
+def serve(port=8765, socket_path=None, workers=2, backup_keep=DEFAULT_KEEP, service: Optional[DeckService] = None,
+          token: Optional[str] = None):
+    service = service or DeckService(workers=workers, backup_keep=backup_keep)
+    server, token = make_server(service, port, socket_path, token)
+    if socket_path:
+        print(f'Serving on unix socket {socket_path} ({workers} workers)')
+    else:
+        print(f'Serving on http://127.0.0.1:{server.server_address[1]} ({workers} workers)')
+        print(f'Token: {token} (send it as "Authorization: Bearer TOKEN" header)')
+
+    try:
+        server.serve_forever()
+    finally:
+        server.server_close()
+        if socket_path and os.path.exists(socket_path):
+            os.remove(socket_path)
@@ -0,0 +1,222 @@
+import io
+import os
+import re
+import tarfile
+import zipfile
+from typing import Dict, BinaryIO, Optional
+
+from . import image_processing as ip
+from .properties_editor import norm_sort
+
+IGNORED_DIRS = ('__MACOSX',)
+MANIFEST_EXT = ('csv', 'json')
+
+
+def card_name(filename):
+    name = '.'.join(filename.split('.')[0:-1])
+    name_len = 0
+    while len(name) != name_len:
+        name_len = len(name)
+        name = re.sub(r'\s*\[\d+]$', '', name)
+        name = re.sub(r'^\[\d+]\s*', '', name)
+        name = re.sub(r'\s*\(\d+\)$', '', name)
+        name = re.sub(r'^\(\d+\)\s*', '', name)
+    return name
+
+
+class PicsSource:
+    path: str
+
+    def __init__(self, path):
+        self.path = path
+
+    def snapshot(self) -> Dict[str, tuple]:
+        # Picture names with a key, which changes when the picture content changes
+        raise NotImplementedError
+
+    def open(self, name) -> BinaryIO:
+        raise NotImplementedError
+
+    def open_stream(self, name) -> BinaryIO:
+        # Forward-only stream, for reading just the beginning of a picture
+        return self.open(name)
+
+    def is_available(self, name):
+        # False if the picture can't be read without downloading it
+        return True
+
+    def order(self, names):
+        # Order of cards in deck
+        return norm_sort(names)
+
+    def read_order(self, names):
+        # Order in which pictures are read fastest
+        return list(names)
+
+    def prefetch(self, names):
+        pass
+
+    def card_info(self, name) -> dict:
+        return {'Nickname': card_name(name)}
+
+    def close(self):
+        pass
+
+
+class DirSource(PicsSource):
+    def snapshot(self):
+        res = {}
+        for f in os.listdir(self.path):
+            if ip.check_supported_ext(f):
+                try:
+                    st = os.stat(os.path.join(self.path, f))
+                except FileNotFoundError:
+                    continue
+                res[f] = (st.st_mtime_ns, st.st_size)
+        return res
+
+    def open(self, name):
+        return open(os.path.join(self.path, name), 'rb')
+
+
+class ArchiveSource(PicsSource):
+    # Pictures are matched by member basename, so nested dirs in archive are flattened.
+    # Archive is re-read only when it changes on disk
+    def __init__(self, path):
+        super().__init__(path)
+        self._stat: Optional[tuple] = None
+        self._members: Dict[str, object] = {}
+        self._keys: Dict[str, tuple] = {}
+        self._order: Dict[str, int] = {}
+
+    def snapshot(self):
+        try:
+            st = os.stat(self.path)
+        except FileNotFoundError:
+            return {}
+        stat = (st.st_mtime_ns, st.st_size)
+        if stat != self._stat:
+            self.close()
+            self._open()
+            self._members, self._keys, self._order = {}, {}, {}
+            for member, name, key in self._list():
+                if not _is_picture(name):
+                    continue
+                base = name.split('/')[-1]
+                if base in self._members:
+                    raise ValueError(f'Duplicate picture name in {self.path}: {base}')
+                self._members[base] = member
+                self._keys[base] = key
+                self._order[base] = len(self._order)
+            self._stat = stat
+        return dict(self._keys)
+
+    def open(self, name):
+        if self._stat is None:
+            self.snapshot()
+        return io.BytesIO(self._read(self._members[name]))
+
+    def open_stream(self, name):
+        if self._stat is None:
+            self.snapshot()
+        return self._stream(self._members[name])
+
+    def read_order(self, names):
+        # Compressed tar can't seek back without decompressing again from the start
+        if self._stat is None:
+            self.snapshot()
+        return sorted(names, key=lambda x: self._order[x])
+
+    def _open(self):
+        raise NotImplementedError
+
+    def _list(self):
+        raise NotImplementedError
+
+    def _read(self, member) -> bytes:
+        raise NotImplementedError
+
+    def _stream(self, member) -> BinaryIO:
+        raise NotImplementedError
+
+
+class ZipSource(ArchiveSource):
+    _zip: Optional[zipfile.ZipFile] = None
+
+    def _open(self):
+        self._zip = zipfile.ZipFile(self.path)
+
+    def _list(self):
+        for info in self._zip.infolist():
+            if not info.is_dir():
+                yield info, info.filename, (info.file_size, info.CRC)
+
+    def _read(self, member):
+        return self._zip.read(member)
+
+    def _stream(self, member):
+        return self._zip.open(member)
+
+    def close(self):
+        if self._zip is not None:
+            self._zip.close()
+            self._zip = None
+        self._stat = None
+
+
+class TarSource(ArchiveSource):
+    _tar: Optional[tarfile.TarFile] = None
+
+    def _open(self):
+        self._tar = tarfile.open(self.path)
+
+    def _list(self):
+        for info in self._tar.getmembers():
+            if info.isfile():
+                yield info, info.name, (info.size, info.mtime)
+
+    def _read(self, member):
+        with self._tar.extractfile(member) as fp:
+            return fp.read()
+
+    def _stream(self, member):
+        return self._tar.extractfile(member)
+
+    def close(self):
+        if self._tar is not None:
+            self._tar.close()
+            self._tar = None
+        self._stat = None
+
+
+def _is_picture(name):
+    parts = name.split('/')
+    if any(p in IGNORED_DIRS for p in parts[:-1]) or parts[-1].startswith('._'):
+        return False
+    return ip.check_supported_ext(parts[-1])
+
+
+def is_archive(path):
+    return os.path.isfile(path) and (zipfile.is_zipfile(path) or tarfile.is_tarfile(path))
+
+
+def is_manifest(path):
+    return os.path.isfile(path) and path.lower().split('.')[-1] in MANIFEST_EXT
+
+
+def is_source(path):
+    return os.path.isdir(path) or is_manifest(path) or is_archive(path)
+
+
+def open_source(path) -> PicsSource:
+    if os.path.isdir(path):
+        return DirSource(path)
+    if is_manifest(path):
+        from .manifest import ManifestSource
+        return ManifestSource(path)
+    if os.path.isfile(path):
+        if zipfile.is_zipfile(path):
+            return ZipSource(path)
+        if tarfile.is_tarfile(path):
+            return TarSource(path)
+    raise ValueError(f'Pictures source must be a dir, zip or tar archive, or CSV/JSON manifest: {path}')
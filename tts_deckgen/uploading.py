@@ -0,0 +1,152 @@
+import json
+import os
+import threading
+import time
+from abc import ABC, abstractmethod
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from typing import Dict, List, Optional
+
+import requests
+from requests.adapters import HTTPAdapter
+
+from . import image_processing as ip
+
+URL_REPLACE_JSON = '.url_replace.json'
+
+
+class UploadError(RuntimeError):
+    pass
+
+
+class UploadBackend(ABC):
+    @abstractmethod
+    def upload(self, session: requests.Session, path: str, timeout: float) -> str:
+        pass
+
+
+class HttpPostBackend(UploadBackend):
+    def __init__(self, url: str, field='image', response_key: Optional[str] = 'data.link',
+                 headers: Optional[Dict[str, str]] = None, data: Optional[Dict[str, str]] = None):
+        self.url = url
+        self.field = field
+        self.response_key = response_key
+        self.headers = headers or {}
+        self.data = data or {}
+
+    def upload(self, session, path, timeout):
+        with open(path, 'rb') as fp:
+            r = session.post(self.url, files={self.field: (os.path.basename(path), fp, 'image/png')},
+                             data=self.data, headers=self.headers, timeout=timeout)
+        if r.status_code >= 500 or r.status_code == 429:
+            raise UploadError(f'Server error {r.status_code} on {os.path.basename(path)}')
+        r.raise_for_status()
+
+        if self.response_key is None:
+            return r.text.strip()
+
+        res = r.json()
+        for k in self.response_key.split('.'):
+            res = res[k]
+        return res
+
+    @classmethod
+    def from_config(cls, path):
+        with open(path) as fp:
+            cfg = json.load(fp)
+        if 'url' not in cfg:
+            raise ValueError('Upload config must contain "url"')
+        return cls(cfg['url'], cfg.get('field', 'image'), cfg.get('response_key', 'data.link'),
+                   cfg.get('headers'), cfg.get('data'))
+
+
+class SheetUploader:
+    def __init__(self, backend: UploadBackend, workers=4, retries=3, backoff=0.5, timeout=60.0, verbose=True):
+        self.backend = backend
+        self.workers = max(1, workers)
+        self.retries = retries
+        self.backoff = backoff
+        self.timeout = timeout
+        self.verbose = verbose
+
+        self.session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=self.workers)
+        self.session.mount('http://', adapter)
+        self.session.mount('https://', adapter)
+
+        self._lock = threading.Lock()
+
+    def upload_dir(self, output_dir, files: Optional[List[str]] = None, force=False) -> Dict[str, str]:
+        if files is None:
+            files = list_sheets(output_dir)
+
+        state = load_replacements(output_dir, files)
+        pending = [f for f in files if force or f not in state]
+        if self.verbose:
+            print(f'Uploading {len(pending)} of {len(files)} files ({len(files) - len(pending)} already uploaded)')
+
+        errors = []
+        with ThreadPoolExecutor(max_workers=self.workers) as executor:
+            futures = {executor.submit(self._upload_one, os.path.join(output_dir, f)): f for f in pending}
+            for future in as_completed(futures):
+                f = futures[future]
+                try:
+                    url = future.result()
+                except Exception as e:
+                    errors.append(f)
+                    print(f'Failed to upload {f}: {e}')
+                    continue
+
+                with self._lock:
+                    state[f] = url
+                    save_replacements(output_dir, state)
+                if self.verbose:
+                    print(f'{f} -> {url}')
+
+        if len(errors) > 0:
+            raise UploadError(f'Failed to upload {len(errors)} file(s), run again to resume: {", ".join(errors)}')
+        return {f: state[f] for f in files}
+
+    def _upload_one(self, path):
+        attempt = 0
+        while True:
+            try:
+                return self.backend.upload(self.session, path, self.timeout)
+            except (UploadError, requests.ConnectionError, requests.Timeout):
+                if attempt >= self.retries:
+                    raise
+                time.sleep(self.backoff * 2 ** attempt)
+                attempt += 1
+
+    def close(self):
+        self.session.close()
+
+
+def list_sheets(output_dir):
+    return [f for f in sorted(os.listdir(output_dir)) if ip.check_supported_ext(f)]
+
+
+def load_replacements(output_dir, files: Optional[List[str]] = None) -> Dict[str, str]:
+    path = os.path.join(output_dir, URL_REPLACE_JSON)
+    if not os.path.isfile(path):
+        return {}
+    with open(path) as fp:
+        res = json.load(fp)
+    if files is not None:
+        res = {k: v for k, v in res.items() if k in files}
+    return res
+
+
+def save_replacements(output_dir, replacements: Dict[str, str]):
+    path = os.path.join(output_dir, URL_REPLACE_JSON)
+    tmp = path + '.tmp'
+    with open(tmp, 'w') as fp:
+        json.dump(replacements, fp)
+    os.replace(tmp, path)
+
+
+def upload_sheets(output_dir, backend: UploadBackend, workers=4, retries=3, force=False):
+    uploader = SheetUploader(backend, workers=workers, retries=retries)
+    try:
+        return uploader.upload_dir(output_dir, force=force)
+    finally:
+        uploader.close()
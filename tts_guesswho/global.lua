@@ -40,6 +40,9 @@ BOOLEAN_CATEGORIES = {
     ['Title Genre - Harem-Like'] = CAT_GENRE,
 }
 
+-- Changes in pack config above must be also made in tts_deckgen/filter_index.py
+FILTER_INDEX_VERSION = 1
+
 --[[  Advanced field settings  ]]
 
 PLAYER_ZONE_MARGIN = 1.0
@@ -326,14 +329,25 @@ function GW_GAME:InitGame()
     local card_list = DIAG_Time('LoadCards', function()
         return self:LoadCards()
     end)
+    local index = DIAG_Time('LoadFilterIndex', function()
+        return self:LoadFilterIndex(card_list)
+    end)
     DIAG_Time('FixNameCollisions', function()
-        self:FixNameCollisions(card_list)
+        if index then
+            self:ApplyUniqueNames(card_list, index.names)
+        else
+            self:FixNameCollisions(card_list)
+        end
     end)
     DIAG_Time('InitCards', function()
         self:InitCards(card_list)
     end)
     DIAG_Time('InitFilters', function()
-        self.data.filters, self.data.filter_categories, self.data.filter_order = self:InitFilters(card_list)
+        if index then
+            self.data.filters, self.data.filter_categories, self.data.filter_order = self:FiltersFromIndex(index)
+        else
+            self.data.filters, self.data.filter_categories, self.data.filter_order = self:InitFilters(card_list)
+        end
     end)
     DIAG_Time('GenerateCardsCache', function()
         self.data.cards_cache = self:GenerateCardsCache(card_list)
@@ -788,10 +802,9 @@ function GW_GAME:InitFilters(card_list)
         local properties = TblShallowCopy(card.properties)
         properties['Name'] = card.name
 
-        for k, v in pairs(properties) do
-            if k ~= 'uniqueName' then
-                local alias = CATEGORIES_ALIASES[k]
-                if alias then k = alias end
+        for key, v in pairs(properties) do
+            if key ~= 'uniqueName' then
+                local k = CATEGORIES_ALIASES[key] or key
 
                 local cur_cat = k
                 local cur_f = v
@@ -816,12 +829,14 @@ function GW_GAME:InitFilters(card_list)
 
     local cat_order = {}
     for cat, _ in pairs(cat_map) do
-        if cat == 'Name' then
-            table.insert(cat_order, 1, cat)
-        elseif cat ~= CAT_OTHER then
+        if cat ~= 'Name' and cat ~= CAT_OTHER then
             table.insert(cat_order, cat)
         end
     end
+    table.sort(cat_order)
+    if cat_map['Name'] then
+        table.insert(cat_order, 1, 'Name')
+    end
     if cat_map[CAT_OTHER] then
         table.insert(cat_order, CAT_OTHER)
     end
@@ -829,6 +844,57 @@ function GW_GAME:InitFilters(card_list)
     return cat_map, cat_order, filter_order
 end
 
+-- Filter index is precomputed by the deck generator (tts_deckgen/filter_index.py) and stored in grid deck state
+function GW_GAME:LoadFilterIndex(card_list)
+    local index = self:GetDeckState(getObjectFromGUID(self.grid_deck))
+    if not index or index.gw_index ~= FILTER_INDEX_VERSION then
+        log('Filter index not found in deck state')
+        return
+    end
+    if index.n ~= #card_list or #index.names ~= #card_list then
+        log('Filter index is outdated: cards count mismatch')
+        return
+    end
+    for i, card in ipairs(card_list) do
+        local name = index.names[i]
+        if name ~= card.name and not StartsWith(name, card.name .. ' (') then
+            log('Filter index is outdated: card #' .. i .. ' mismatch')
+            return
+        end
+    end
+
+    return index
+end
+
+function GW_GAME:ApplyUniqueNames(card_list, names)
+    local count = 0
+    for i, card in ipairs(card_list) do
+        if card:GetName() ~= names[i] then
+            card:SetName(names[i])
+            count = count + 1
+        end
+    end
+
+    if count > 0 then
+        log('Fixed ' .. count .. ' name collisions')
+    end
+end
+
+function GW_GAME:FiltersFromIndex(index)
+    local cat_map = {}
+    for cat, filters in pairs(index.map) do
+        cat_map[cat] = {}
+        for f, list in pairs(filters) do
+            local names = {}
+            for j, idx in ipairs(list) do
+                names[j] = index.names[idx + 1]
+            end
+            cat_map[cat][f] = names
+        end
+    end
+    return cat_map, index.cats, index.filters
+end
+
 function GW_GAME:UiInitFilters()
     local ui_xml = UI.getXmlTable()
     local panel_childs = getById(ui_xml, "filtersPanel").children
@@ -1230,6 +1296,15 @@ function GW_GAME:LoadCards()
     local deck_hand = getObjectFromGUID(self.hand_deck)
 
     local objs = deck.getObjects()
+    local pairs_map = self:GetCardPairs(deck, deck_hand, objs)
+    if pairs_map then
+        for _, obj in ipairs(objs) do
+            obj.guid_hand = pairs_map[obj.guid]
+            table.insert(res, Card(obj, deck, deck_hand))
+        end
+        return res
+    end
+
     local objs_hand = deck_hand.getObjects()
     if #objs ~= #objs_hand then
         print('ERROR: Decks size not equal!')
@@ -1244,6 +1319,35 @@ function GW_GAME:LoadCards()
     return res
 end
 
+-- Paired decks written by the deck generator have grid -> hand card GUIDs map in state
+function GW_GAME:GetCardPairs(deck, deck_hand, objs)
+    local state = self:GetDeckState(deck)
+    local p = state and state.pairs
+    if not p or p.deck ~= deck_hand.getGUID() or deck_hand.getQuantity() ~= #objs then
+        return
+    end
+    for _, obj in ipairs(objs) do
+        if not p.cards[obj.guid] then
+            log('Deck pairs are outdated, pairing by order')
+            return
+        end
+    end
+    return p.cards
+end
+
+function GW_GAME:GetDeckState(deck)
+    local state = deck and deck.script_state
+    if not state or state == '' then
+        return
+    end
+    if self.deck_state_raw ~= state then
+        local ok, value = pcall(JSON.decode, state)
+        self.deck_state_raw = state
+        self.deck_state = ok and type(value) == 'table' and value or nil
+    end
+    return self.deck_state
+end
+
 function GW_GAME:GenerateCardsCache(tbl)
     local res = {}
     for _, i in ipairs(tbl) do
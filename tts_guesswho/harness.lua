@@ -0,0 +1,546 @@
+--[[
+    Headless performance harness for global.lua.
+
+    Runs the game script under a plain Lua interpreter (5.1 - 5.5, LuaJIT) with stubbed TTS API,
+    on synthetic decks, and prints per-function timings.
+
+    Usage: lua tts_guesswho/harness.lua [--index] [--multi-page] [--players N] [--verbose] [SIZE ...]
+
+    --index       Put precomputed filter index and card pairs into deck state (as deck generator does)
+    --multi-page  Disable one_page config, so players get control desks and page through the whole deck
+]]
+
+table.pack = table.pack or function(...) return {n = select('#', ...), ...} end
+table.unpack = table.unpack or unpack
+
+-- MoonSharp accepts char codes > 255, plain Lua doesn't
+local string_char = string.char
+string.char = function(...)
+    local ok, res = pcall(string_char, ...)
+    return ok and res or '?'
+end
+
+local SCRIPT_DIR = (arg and arg[0] or ''):match('^(.*[/\\])') or ''
+local GLOBAL_LUA = SCRIPT_DIR .. 'global.lua'
+
+local OPTS = {index = false, multi_page = false, players = 4, verbose = false, sizes = {}}
+for i = 1, #(arg or {}) do
+    local a = arg[i]
+    if a == '--index' then OPTS.index = true
+    elseif a == '--multi-page' then OPTS.multi_page = true
+    elseif a == '--verbose' then OPTS.verbose = true
+    elseif a == '--players' then OPTS.players = -1
+    elseif OPTS.players == -1 then OPTS.players = tonumber(a)
+    else table.insert(OPTS.sizes, tonumber(a)) end
+end
+if #OPTS.sizes == 0 then OPTS.sizes = {100, 500, 1000, 2000, 5000} end
+
+
+--[[  JSON  ]]
+
+local json = {}
+
+local function json_encode_str(s)
+    return '"' .. s:gsub('[%c"\\]', function(c)
+        local esc = {['"'] = '\\"', ['\\'] = '\\\\', ['\n'] = '\\n', ['\r'] = '\\r', ['\t'] = '\\t'}
+        return esc[c] or string.format('\\u%04x', c:byte())
+    end) .. '"'
+end
+
+function json.encode(v)
+    local t = type(v)
+    if t == 'string' then
+        return json_encode_str(v)
+    elseif t == 'number' or t == 'boolean' then
+        return tostring(v)
+    elseif t == 'nil' then
+        return 'null'
+    end
+
+    local parts = {}
+    if #v > 0 or next(v) == nil then
+        for i = 1, #v do parts[i] = json.encode(v[i]) end
+        return '[' .. table.concat(parts, ',') .. ']'
+    end
+    for k, x in pairs(v) do
+        table.insert(parts, json_encode_str(tostring(k)) .. ':' .. json.encode(x))
+    end
+    return '{' .. table.concat(parts, ',') .. '}'
+end
+
+local function utf8_char(code)
+    if code < 0x80 then return string_char(code) end
+    if code < 0x800 then return string_char(0xC0 + math.floor(code / 0x40), 0x80 + code % 0x40) end
+    return string_char(0xE0 + math.floor(code / 0x1000), 0x80 + math.floor(code / 0x40) % 0x40, 0x80 + code % 0x40)
+end
+
+function json.decode(s)
+    local pos = 1
+
+    local function ws()
+        pos = s:find('[^ \t\r\n]', pos) or #s + 1
+    end
+
+    local value
+
+    local function str()
+        local res = {}
+        pos = pos + 1
+        while true do
+            local st, en = s:find('["\\]', pos)
+            if not st then error('Unterminated string') end
+            table.insert(res, s:sub(pos, st - 1))
+            if s:sub(st, st) == '"' then
+                pos = en + 1
+                return table.concat(res)
+            end
+            local c = s:sub(st + 1, st + 1)
+            if c == 'u' then
+                table.insert(res, utf8_char(tonumber(s:sub(st + 2, st + 5), 16)))
+                pos = st + 6
+            else
+                local esc = {b = '\b', f = '\f', n = '\n', r = '\r', t = '\t'}
+                table.insert(res, esc[c] or c)
+                pos = st + 2
+            end
+        end
+    end
+
+    function value()
+        ws()
+        local c = s:sub(pos, pos)
+        if c == '{' then
+            local res = {}
+            pos = pos + 1
+            ws()
+            if s:sub(pos, pos) == '}' then pos = pos + 1; return res end
+            while true do
+                ws()
+                local k = str()
+                ws()
+                pos = pos + 1 -- :
+                res[k] = value()
+                ws()
+                c = s:sub(pos, pos)
+                pos = pos + 1
+                if c == '}' then return res end
+            end
+        elseif c == '[' then
+            local res = {}
+            pos = pos + 1
+            ws()
+            if s:sub(pos, pos) == ']' then pos = pos + 1; return res end
+            while true do
+                table.insert(res, value())
+                ws()
+                c = s:sub(pos, pos)
+                pos = pos + 1
+                if c == ']' then return res end
+            end
+        elseif c == '"' then
+            return str()
+        elseif s:sub(pos, pos + 3) == 'true' then
+            pos = pos + 4; return true
+        elseif s:sub(pos, pos + 4) == 'false' then
+            pos = pos + 5; return false
+        elseif s:sub(pos, pos + 3) == 'null' then
+            pos = pos + 4; return nil
+        end
+        local st, en = s:find('^-?[%d.eE+-]+', pos)
+        if not st then error('Unexpected character at ' .. pos) end
+        pos = en + 1
+        return tonumber(s:sub(st, en))
+    end
+
+    return value()
+end
+
+
+--[[  TTS API stubs  ]]
+
+local function install_stubs()
+    local objects = {}
+    local json_store = {}
+    local guid_counter = 0
+    local json_counter = 0
+
+    JSON = json
+
+    local vec_mt = {}
+    vec_mt.__index = vec_mt
+    function Vector(x, y, z)
+        if type(x) == 'table' then
+            x, y, z = x.x or x[1], x.y or x[2], x.z or x[3]
+        end
+        return setmetatable({x = x or 0, y = y or 0, z = z or 0}, vec_mt)
+    end
+    vec_mt.__add = function(a, b) return Vector(a.x + b.x, a.y + b.y, a.z + b.z) end
+    vec_mt.__sub = function(a, b) return Vector(a.x - b.x, a.y - b.y, a.z - b.z) end
+    vec_mt.__mul = function(a, b)
+        if type(a) == 'number' then a, b = b, a end
+        return Vector(a.x * b, a.y * b, a.z * b)
+    end
+    function vec_mt:rotateOver(axis, angle)
+        local r = math.rad(angle or 0)
+        local c, s = math.cos(r), math.sin(r)
+        local x, y, z = self.x, self.y, self.z
+        if axis == 'x' then
+            self.y, self.z = y * c - z * s, y * s + z * c
+        elseif axis == 'y' then
+            self.x, self.z = x * c + z * s, -x * s + z * c
+        else
+            self.x, self.y = x * c - y * s, x * s + y * c
+        end
+        return self
+    end
+
+    local color_mt = {__index = {toHex = function() return 'FFFFFF' end}}
+    Color = {
+        fromString = function(c) return setmetatable({name = c}, color_mt) end,
+        Red = setmetatable({name = 'Red'}, color_mt),
+        Orange = setmetatable({name = 'Orange'}, color_mt),
+    }
+
+    local function noop() end
+    local xml = {
+        {tag = 'Panel', attributes = {id = 'filtersPanel'}, children = {
+            {tag = 'Panel', attributes = {id = 'category'}, children = {}},
+            {tag = 'Button', attributes = {id = 'toggleAll'}},
+        }},
+    }
+    UI = {
+        show = noop, hide = noop, setAttribute = noop, setValue = noop,
+        getXmlTable = function() return xml end,
+        setXmlTable = noop,
+        getXml = function() return '' end,
+        setXml = noop,
+    }
+
+    Wait = {
+        frames = function(fnc) fnc() end,
+        condition = function(fnc) fnc() end,
+    }
+
+    log = OPTS.verbose and print or noop
+    broadcastToAll = noop
+    broadcastToColor = noop
+
+    local function new_guid()
+        guid_counter = guid_counter + 1
+        return string.format('%06x', guid_counter)
+    end
+
+    local function store_json(data)
+        json_counter = json_counter + 1
+        local key = 'json:' .. json_counter
+        json_store[key] = data
+        return key
+    end
+
+    local function new_object(props)
+        local o = {
+            guid = props.guid or new_guid(),
+            type = props.type or 'Card',
+            name = props.name or '',
+            description = props.description or '',
+            position = Vector(props.position),
+            scale = Vector(props.scale or {1, 1, 1}),
+            is_face_down = false,
+            script_state = props.script_state or '',
+            tags = {},
+            contents = props.contents,
+            UI = {setXml = noop, getXml = function() return '' end, setValue = noop, show = noop, loading = false},
+        }
+        objects[o.guid] = o
+
+        o.getGUID = function() return o.guid end
+        o.getName = function() return o.name end
+        o.setName = function(v) o.name = v end
+        o.getDescription = function() return o.description end
+        o.setDescription = function(v) o.description = v end
+        o.setLock = noop
+        o.setPosition = function(p) o.position = Vector(p) end
+        o.setPositionSmooth = o.setPosition
+        o.setRotationSmooth = noop
+        o.addTag = function(t) o.tags[t] = true end
+        o.hasTag = function(t) return o.tags[t] == true end
+        o.flip = function() o.is_face_down = not o.is_face_down end
+        o.deal = noop
+        o.createButton = noop
+        o.destroyObject = function() objects[o.guid] = nil end
+        o.getJSON = function()
+            return store_json({name = o.name, description = o.description, contents = o.contents, type = o.type})
+        end
+
+        -- Containers (decks)
+        o.getQuantity = function() return o.contents and o.contents.count or -1 end
+        o.getObjects = function()
+            if o.type == 'ScriptingTrigger' then
+                local res = {}
+                local hw, hd = o.scale.x / 2, o.scale.z / 2
+                for _, x in pairs(objects) do
+                    if x ~= o and math.abs(x.position.x - o.position.x) <= hw
+                            and math.abs(x.position.z - o.position.z) <= hd then
+                        table.insert(res, x)
+                    end
+                end
+                return res
+            end
+
+            local res = {}
+            for i, c in ipairs(o.contents.list) do
+                if not o.contents.taken[c.guid] then
+                    table.insert(res, {index = i - 1, guid = c.guid, name = c.name, description = c.description})
+                end
+            end
+            return res
+        end
+        o.takeObject = function(params)
+            local c = o.contents.by_guid[params.guid]
+            o.contents.taken[params.guid] = true
+            o.contents.count = o.contents.count - 1
+            return new_object({guid = c.guid, name = c.name, description = c.description, position = params.position})
+        end
+        o.putObject = function(other)
+            if not o.contents then
+                o.contents = {list = {}, by_guid = {}, taken = {}, count = 0}
+                o.type = 'Deck'
+            end
+            table.insert(o.contents.list, {guid = other.guid, name = other.name, description = other.description})
+            o.contents.count = o.contents.count + 1
+            objects[other.guid] = nil
+            return o
+        end
+
+        return o
+    end
+
+    function destroyObject(o)
+        objects[o.guid] = nil
+    end
+
+    function getObjectFromGUID(guid)
+        return guid and objects[guid]
+    end
+
+    function getObjects()
+        local res = {}
+        for _, o in pairs(objects) do table.insert(res, o) end
+        return res
+    end
+
+    function spawnObject(params)
+        local o = new_object({type = params.type, position = params.position, scale = params.scale})
+        if params.callback_function then params.callback_function(o) end
+        return o
+    end
+
+    function spawnObjectJSON(params)
+        local data = json_store[params.json]
+        return new_object({name = data.name, description = data.description, contents = data.contents,
+                           type = data.type, position = params.position})
+    end
+
+    local players = {}
+    local colors = {'White', 'Red', 'Blue', 'Green', 'Yellow', 'Purple', 'Pink', 'Teal', 'Orange', 'Brown'}
+    for i = 1, math.min(OPTS.players, #colors) do
+        local angle = (i - 1) * 360 / OPTS.players
+        table.insert(players, {
+            color = colors[i],
+            steam_name = 'Player ' .. i,
+            blindfolded = false,
+            broadcast = noop,
+            getHandTransform = function()
+                return {position = Vector(0, 2, -20):rotateOver('y', angle), rotation = Vector(0, angle, 0)}
+            end,
+        })
+    end
+    Player = {
+        getPlayers = function() return players end,
+        Action = {Select = 0, FlipOver = 1, FlipIncrementalLeft = 2, FlipIncrementalRight = 3, PickUp = 4},
+    }
+
+    return {new_object = new_object, new_guid = new_guid, players = players}
+end
+
+
+--[[  Synthetic decks  ]]
+
+local HAIR = {'black', 'blonde', 'brown', 'red', 'white', 'pink', 'blue', 'green', 'silver', 'purple'}
+local TITLES = {}
+for i = 1, 60 do TITLES[i] = 'Title ' .. i end
+local FLAGS = {'From Game', 'From non-Asian Title', 'From Anime/Manga/Ranobe', 'Title Genre - Romance',
+               'Glasses', 'Twintails', 'Animal Ears'}
+
+local function make_cards(n)
+    local res = {}
+    for i = 1, n do
+        local name = 'Character ' .. (math.random(20) == 1 and math.random(i) or i)
+        local lines = {
+            'Hair: ' .. HAIR[math.random(#HAIR)],
+            'From Title: ' .. TITLES[math.random(#TITLES)],
+            'Height: ' .. (140 + math.random(40)),
+        }
+        for _, f in ipairs(FLAGS) do
+            if math.random(4) == 1 then table.insert(lines, f) end
+        end
+        res[i] = {name = name, description = table.concat(lines, '\n')}
+    end
+    return res
+end
+
+local function unique_names(names)
+    local res, first, counters = {}, {}, {}
+    for i, name in ipairs(names) do
+        res[i] = name
+        if not first[name] then
+            first[name] = i
+        else
+            if not counters[name] then
+                res[first[name]] = name .. ' (1)'
+                counters[name] = 1
+            end
+            counters[name] = counters[name] + 1
+            res[i] = name .. ' (' .. counters[name] .. ')'
+        end
+    end
+    return res
+end
+
+-- Same data as tts_deckgen/filter_index.py writes, built with the game's own InitFilters
+local function make_state(cards, own_guids, other_guids, other_deck)
+    local nicknames = {}
+    for i, c in ipairs(cards) do nicknames[i] = c.name end
+    local names = unique_names(nicknames)
+
+    local list, positions = {}, {}
+    for i, c in ipairs(cards) do
+        list[i] = {name = c.name, properties = PropertiesToTable(c.description), unique = names[i],
+                   GetName = function(self) return self.unique end}
+        positions[names[i]] = i - 1
+    end
+    local cat_map, cat_order, filter_order = GW_GAME:InitFilters(list)
+    for _, filters in pairs(cat_map) do
+        for f, l in pairs(filters) do
+            for j, name in ipairs(l) do l[j] = positions[name] end
+        end
+    end
+
+    local pairs_map = {}
+    for i, guid in ipairs(own_guids) do pairs_map[guid] = other_guids[i] end
+
+    return json.encode({
+        gw_index = FILTER_INDEX_VERSION, n = #cards, names = names,
+        cats = cat_order, map = cat_map, filters = filter_order,
+        pairs = {deck = other_deck, cards = pairs_map},
+    })
+end
+
+local function make_deck(api, zone_guid, cards)
+    local contents = {list = {}, by_guid = {}, taken = {}, count = #cards}
+    for i, c in ipairs(cards) do
+        local entry = {guid = api.new_guid(), name = c.name, description = c.description}
+        contents.list[i] = entry
+        contents.by_guid[entry.guid] = entry
+    end
+    local deck = api.new_object({type = 'Deck', contents = contents, position = POS_OPERATING_TABLE})
+    local zone = api.new_object({guid = zone_guid, type = 'Zone'})
+    zone.getObjects = function() return {deck} end
+    return deck
+end
+
+
+--[[  Timing  ]]
+
+local TIMED = {
+    'InitGame', 'LoadCards', 'LoadFilterIndex', 'FixNameCollisions', 'ApplyUniqueNames', 'InitCards',
+    'InitFilters', 'FiltersFromIndex', 'GenerateCardsCache', 'InitZones',
+    'StartGame', 'InitPlayers', 'InitCardsOrdered', 'InitPlyCardsOrdered', 'SetPage', 'UiInitFilters',
+    'ToggleCards', 'GetCardsOnTable', 'GetCardList', 'FindCard',
+}
+
+local function instrument(stats)
+    for _, name in ipairs(TIMED) do
+        local fnc = GW_GAME[name]
+        stats[name] = {calls = 0, time = 0}
+        GW_GAME[name] = function(...)
+            local st = os.clock()
+            local res = table.pack(fnc(...))
+            local s = stats[name]
+            s.calls = s.calls + 1
+            s.time = s.time + os.clock() - st
+            return table.unpack(res, 1, res.n)
+        end
+    end
+end
+
+local function run(size)
+    math.randomseed(size)
+    local api = install_stubs()
+    dofile(GLOBAL_LUA)
+
+    api.new_object({guid = GUID_OPERATING_TABLE, type = 'Table'})
+    local cards = make_cards(size)
+    local grid = make_deck(api, GUID_GRID_DECK_ZONE, cards)
+    local hand = make_deck(api, GUID_HAND_DECK_ZONE, cards)
+    if OPTS.index then
+        local grid_guids, hand_guids = {}, {}
+        for i = 1, size do
+            grid_guids[i] = grid.contents.list[i].guid
+            hand_guids[i] = hand.contents.list[i].guid
+        end
+        grid.script_state = make_state(cards, grid_guids, hand_guids, hand.guid)
+        hand.script_state = make_state(cards, hand_guids, grid_guids, grid.guid)
+    end
+
+    if OPTS.multi_page then
+        GW_GAME.config.one_page = false
+    end
+
+    local stats = {}
+    instrument(stats)
+
+    GW_GAME:InitGame()
+    for _, p in ipairs(api.players) do
+        GW_GAME.data.prepared_players[p.color] = GW_GAME.data.cards_cache[math.random(size)].name
+    end
+    GW_GAME:StartGame(false, true)
+
+    for _, p in ipairs(api.players) do
+        for cat_idx, cat in ipairs(GW_GAME.data.filter_categories) do
+            local n = 0
+            for _, f in ipairs(GW_GAME.data.filter_order) do
+                local list = GW_GAME.data.filters[cat][f]
+                if list then
+                    GW_GAME:ToggleCards(p.color, list)
+                    n = n + 1
+                    if n >= 3 then break end
+                end
+            end
+            local _, list = next(GW_GAME.data.filters[cat])
+            GW_GAME:ToggleCards(p.color, list, cat_idx .. '_1')
+        end
+
+        if OPTS.multi_page then
+            for page = 2, 5 do GW_GAME:SetPage(p.color, page) end
+        else
+            GW_GAME:SetPage(p.color, true)
+        end
+    end
+
+    return stats
+end
+
+print(string.format('Players: %d, filter index: %s, multi-page: %s', OPTS.players,
+                    tostring(OPTS.index), tostring(OPTS.multi_page)))
+print(string.format('%6s  %-20s %6s %12s %14s', 'cards', 'function', 'calls', 'total, ms', 'per call, ms'))
+for _, size in ipairs(OPTS.sizes) do
+    local stats = run(size)
+    for _, name in ipairs(TIMED) do
+        local s = stats[name]
+        if s.calls > 0 then
+            print(string.format('%6d  %-20s %6d %12.2f %14.3f', size, name, s.calls, s.time * 1000,
+                                s.time * 1000 / s.calls))
+        end
+    end
+end